@@ -0,0 +1,295 @@
+"""
+Load test the JSON HTTP API (utilities_lifetime/api.py).
+
+Many clients send requests at the same time over keep-alive
+connections, each waiting for its answer before sending the next
+request. Most requests are for one patient (GET /patient) and a
+fraction are batches of patients (POST /batch). The patients are
+drawn from the ages, sexes and mRS scores in the app, so repeats are
+answered from the results cache.
+
+Reported at the end, overall and for each endpoint:
+    requests_per_s - requests finished per second.
+    latency_ms     - p50, p90, p99 and max time for one request.
+    errors         - responses that weren't 200 OK, and failed
+                     connections.
+
+Run from the top of the repository. Either start the server first:
+    python -m utilities_lifetime.api --port 8502
+    python benchmarks/api_load_test.py --port 8502 --clients 32
+or let this script start one:
+    python benchmarks/api_load_test.py --start-server --gzip
+"""
+# Imports:
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+# Make the repository importable when run from anywhere:
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_directory)
+
+import utilities_lifetime.api as api
+
+model_types = ['mRS', 'Dichotomous']
+
+
+# #####################################################################
+# ############################## Clients ##############################
+# #####################################################################
+
+def make_request(rng, batch_fraction: float, batch_size: int, use_gzip: bool):
+    """
+    Make the bytes of one random request.
+
+    Inputs:
+    -------
+    rng            - np.random.Generator.
+    batch_fraction - float. Chance that this is a /batch request.
+    batch_size     - int. Patients in each /batch request.
+    use_gzip       - bool. Whether to ask for gzipped responses.
+
+    Returns:
+    --------
+    endpoint - str. "/patient" or "/batch".
+    request  - bytes. The whole HTTP request.
+    """
+    headers = 'Host: localhost\r\n'
+    if use_gzip:
+        headers += 'Accept-Encoding: gzip\r\n'
+    model_input_str = rng.choice(model_types)
+    if rng.random() < batch_fraction:
+        patients = [dict(
+            age=float(rng.integers(45, 91)),
+            sex=int(rng.integers(2)),
+            mrs=int(rng.integers(6)),
+            ) for i in range(batch_size)]
+        body = json.dumps(
+            dict(model=model_input_str, patients=patients)).encode('utf-8')
+        request = (
+            'POST /batch HTTP/1.1\r\n' + headers +
+            'Content-Type: application/json\r\n' +
+            f'Content-Length: {len(body)}\r\n\r\n').encode('latin-1') + body
+        return '/batch', request
+    target = (
+        f'/patient?age={rng.integers(45, 91)}&sex={rng.integers(2)}' +
+        f'&mrs={rng.integers(6)}&model={model_input_str}')
+    request = f'GET {target} HTTP/1.1\r\n{headers}\r\n'.encode('latin-1')
+    return '/patient', request
+
+
+async def read_response(reader: asyncio.StreamReader):
+    """
+    Read one HTTP response.
+
+    Inputs:
+    -------
+    reader - asyncio.StreamReader. The connection.
+
+    Returns:
+    --------
+    status - int. HTTP status code.
+    body   - bytes. The response body, unzipped if it was gzipped.
+    """
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length']))
+    if headers.get('content-encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return status, body
+
+
+async def run_client(
+        host: str,
+        port: int,
+        n_requests: int,
+        seed: int,
+        batch_fraction: float,
+        batch_size: int,
+        use_gzip: bool,
+        timings: list
+        ):
+    """
+    Send requests one after another over one connection.
+
+    Inputs:
+    -------
+    host, port     - where the server is.
+    n_requests     - int. Requests to send.
+    seed           - int. Seed for this client's random patients.
+    batch_fraction - float. Chance that each request is a /batch.
+    batch_size     - int. Patients in each /batch request.
+    use_gzip       - bool. Whether to ask for gzipped responses.
+    timings        - list. (endpoint, seconds, ok) is added for every
+                     request.
+    """
+    rng = np.random.default_rng(seed)
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        timings.extend([('connect', 0.0, False)] * n_requests)
+        return
+    try:
+        for i in range(n_requests):
+            endpoint, request = make_request(
+                rng, batch_fraction, batch_size, use_gzip)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, body = await read_response(reader)
+            timings.append((endpoint, time.perf_counter() - start,
+                            status == 200))
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        timings.append(('connect', 0.0, False))
+    finally:
+        writer.close()
+
+
+def summarise(timings: list, elapsed: float):
+    """
+    Work out throughput and latency percentiles.
+
+    Inputs:
+    -------
+    timings - list. (endpoint, seconds, ok) for each request.
+    elapsed - float. Seconds for the whole test.
+
+    Returns:
+    --------
+    summary - dict. Overall and per-endpoint results.
+    """
+    def stats(rows):
+        latencies = np.array([seconds for _, seconds, ok in rows if ok])
+        latencies = latencies * 1000.0 if len(latencies) else np.zeros(1)
+        return dict(
+            requests=len(rows),
+            requests_per_s=len(rows) / elapsed,
+            latency_ms=dict(
+                p50=float(np.percentile(latencies, 50)),
+                p90=float(np.percentile(latencies, 90)),
+                p99=float(np.percentile(latencies, 99)),
+                max=float(np.max(latencies)),
+                ),
+            errors=sum([not ok for _, _, ok in rows]),
+            )
+
+    summary = dict(elapsed_s=elapsed, overall=stats(timings))
+    for endpoint in sorted(set([row[0] for row in timings])):
+        summary[endpoint] = stats(
+            [row for row in timings if row[0] == endpoint])
+    return summary
+
+
+# #####################################################################
+# ############################### Server ##############################
+# #####################################################################
+
+def start_server(port: int):
+    """
+    Start the API server in a separate process and wait until it's up.
+
+    Inputs:
+    -------
+    port - int. Port for the server.
+
+    Returns:
+    --------
+    process - subprocess.Popen. Stop it with process.terminate().
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'utilities_lifetime.api', '--port', str(port)],
+        cwd=repo_directory, stdout=subprocess.DEVNULL)
+    url = f'http://{api.default_host}:{port}/health'
+    for attempt in range(100):
+        try:
+            with urllib.request.urlopen(url, timeout=1.0):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('The API server didn\'t start')
+
+
+def main(argv=None):
+    """
+    Run the load test from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 1 if any request failed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--host', default=api.default_host, help='Default: %(default)s.')
+    parser.add_argument(
+        '--port', type=int, default=api.default_port,
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--start-server', action='store_true',
+        help='Start a server on --port for the test.')
+    parser.add_argument(
+        '--clients', type=int, default=16,
+        help='Clients sending requests at once. Default: %(default)s.')
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Requests per client. Default: %(default)s.')
+    parser.add_argument(
+        '--batch-fraction', type=float, default=0.1,
+        help='Fraction of requests that are /batch. Default: %(default)s.')
+    parser.add_argument(
+        '--batch-size', type=int, default=100,
+        help='Patients per /batch request. Default: %(default)s.')
+    parser.add_argument(
+        '--gzip', action='store_true', help='Ask for gzipped responses.')
+    parser.add_argument(
+        '--seed', type=int, default=42, help='Default: %(default)s.')
+    parser.add_argument(
+        '--output', metavar='FILE', help='Save the summary as JSON here.')
+    args = parser.parse_args(argv)
+
+    process = start_server(args.port) if args.start_server else None
+    try:
+        timings = []
+
+        async def run_all_clients():
+            await asyncio.gather(*[run_client(
+                args.host, args.port, args.requests, args.seed + client,
+                args.batch_fraction, args.batch_size, args.gzip, timings
+                ) for client in range(args.clients)])
+
+        start = time.perf_counter()
+        asyncio.run(run_all_clients())
+        summary = summarise(timings, time.perf_counter() - start)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['overall']['errors'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Time how long it takes to build cohorts of different sizes.
+
+Compares build_cohort() from utilities_lifetime/cohort.py with the
+old way of adding one row at a time with patient_df.loc[count].
+The old way is only timed up to a few thousand patients because it
+gets slower with every row that's added.
+
+Run from the top of the repository:
+    python benchmarks/bench_cohort.py
+"""
+# Imports:
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Make utilities_lifetime importable when run from anywhere:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities_lifetime.cohort import build_cohort
+
+# Numbers of patients to time:
+cohort_sizes = [10, 100, 1000, 10000, 100000]
+# Largest cohort to build the old way:
+loc_max_patients = 5000
+# Number of mRS scores and sexes per age:
+n_per_age = 12
+
+
+def build_cohort_with_loc(ages, sexes=(0, 1), mrs_to_run=range(6)):
+    """
+    Create every combination of age, sex and mRS one row at a time.
+
+    This is how the Advanced options page used to build its patients.
+
+    Inputs:
+    -------
+    ages       - list or np.array. Ages in years.
+    sexes      - list or np.array. Sexes, 0 for female and 1 for male.
+    mrs_to_run - list or np.array. mRS scores from 0 to 5.
+
+    Returns:
+    --------
+    patient_df - pd.DataFrame. One row per patient.
+    """
+    patient_df = pd.DataFrame(columns=[
+        'age', 'sex', 'sex_label', 'mrs', 'outcome_type'])
+    count = 0
+    for age in ages:
+        for sex in sexes:
+            sex_label = 'Male' if sex == 1 else 'Female'
+            for mrs in mrs_to_run:
+                outcome_type = 'Dependent' if mrs > 2 else 'Independent'
+                patient_df.loc[count] = [
+                    age, sex, sex_label, mrs, outcome_type]
+                count += 1
+    return patient_df
+
+
+def time_function(function, ages, repeats: int):
+    """
+    Find the fastest time out of several repeats.
+
+    Inputs:
+    -------
+    function - callable. Takes the ages as its only argument.
+    ages     - np.array. Ages to build the cohort from.
+    repeats  - int. How many times to run the function.
+
+    Returns:
+    --------
+    float. Fastest time in seconds.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(ages)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    """Print a table of build times for each cohort size."""
+    rows = []
+    for n_patients in cohort_sizes:
+        n_ages = max(1, int(np.ceil(n_patients / n_per_age)))
+        ages = np.linspace(45.0, 90.0, n_ages)
+
+        time_bulk = time_function(build_cohort, ages, repeats=5)
+        if n_ages * n_per_age <= loc_max_patients:
+            time_loc = time_function(build_cohort_with_loc, ages, repeats=1)
+        else:
+            time_loc = np.nan
+
+        rows.append(dict(
+            patients=n_ages * n_per_age,
+            build_cohort_ms=1000.0 * time_bulk,
+            loc_loop_ms=1000.0 * time_loc,
+            speedup=time_loc / time_bulk,
+            ))
+    print(pd.DataFrame(rows).to_string(index=False, float_format='%.3f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Time a burst of sessions that all miss the results cache at once.
+
+A Streamlit server runs each session's script in a thread of one
+process, so each simulated session here is a thread. In every round
+all of the sessions ask results_cache.run_all_mrs() for a new patient
+at the same moment, like a room full of people changing the age at
+once. The cache is emptied first so that every request is a miss.
+
+The burst is run twice: once with each session looking up its own
+results and once through the model service (model_service.py), which
+collects the lookups into batches.
+
+Reported for each run:
+    cpu_ms_per_request  - process CPU time divided by requests.
+    wall_ms_per_request - wall clock time divided by requests.
+    latency_ms          - p50 and p95 time for one run_all_mrs() call.
+    service             - the model service metrics (second run only).
+
+Run from the top of the repository:
+    python benchmarks/burst_test.py --users 32 --rounds 20
+    python benchmarks/burst_test.py --window-ms 5 --output burst.json
+"""
+# Imports:
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Make the repository importable when run from anywhere:
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_directory)
+
+import utilities_lifetime.cohort as cohort
+import utilities_lifetime.model_service as model_service
+import utilities_lifetime.results_cache as results_cache
+import utilities_lifetime.results_grid as results_grid
+
+model_types = ['mRS', 'Dichotomous']
+
+
+def make_patients(n_users: int, n_rounds: int, distinct: int, seed: int):
+    """
+    Pick the patient that each session asks for in each round.
+
+    Inputs:
+    -------
+    n_users  - int. Number of sessions.
+    n_rounds - int. Number of bursts.
+    distinct - int. Number of different patients in each round. Many
+               visitors keep the default patient, so the same patient
+               often turns up in several sessions at once.
+    seed     - int. Seed for the random patients.
+
+    Returns:
+    --------
+    patients - list. For each round, a list of (age, sex, mrs_to_run,
+               model_input_str) for each session.
+    """
+    rng = np.random.default_rng(seed)
+    patients = []
+    for round_index in range(n_rounds):
+        choices = [(
+            float(rng.integers(45, 91)),
+            int(rng.integers(2)),
+            model_input_str,
+            ) for model_input_str in rng.choice(model_types, distinct)]
+        picked = rng.integers(distinct, size=n_users)
+        patients.append([
+            (choices[i][0], choices[i][1],
+             tuple(cohort.mrs_to_run_for_model(choices[i][2])),
+             choices[i][2])
+            for i in picked
+            ])
+    return patients
+
+
+def run_burst(patients: list):
+    """
+    Run every round with one thread per session.
+
+    Inputs:
+    -------
+    patients - list. Output from make_patients().
+
+    Returns:
+    --------
+    dict. CPU and wall clock time per request and latency percentiles.
+    """
+    n_users = len(patients[0])
+    barrier = threading.Barrier(n_users)
+    latencies = []
+    latency_lock = threading.Lock()
+
+    def session(user: int):
+        for round_patients in patients:
+            # Start every session's request at the same moment:
+            barrier.wait()
+            start = time.perf_counter()
+            results_cache.run_all_mrs(*round_patients[user])
+            with latency_lock:
+                latencies.append(time.perf_counter() - start)
+            # Wait for everyone so that each round is a separate burst:
+            barrier.wait()
+
+    results_cache.cache_clear()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(user,))
+               for user in range(n_users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    n_requests = len(latencies)
+    latencies = np.array(latencies) * 1000.0
+    return dict(
+        requests=n_requests,
+        cpu_ms_per_request=(
+            (time.process_time() - cpu_start) * 1000.0 / n_requests),
+        wall_ms_per_request=(
+            (time.perf_counter() - wall_start) * 1000.0 / n_requests),
+        latency_ms=dict(
+            p50=float(np.percentile(latencies, 50)),
+            p95=float(np.percentile(latencies, 95)),
+            ),
+        )
+
+
+def main(argv=None):
+    """
+    Run the burst with and without the model service.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, always 0.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--users', type=int, default=32,
+        help='Sessions in each burst. Default: %(default)s.')
+    parser.add_argument(
+        '--rounds', type=int, default=20,
+        help='Number of bursts. Default: %(default)s.')
+    parser.add_argument(
+        '--distinct', type=int, default=8,
+        help='Different patients in each burst. Default: %(default)s.')
+    parser.add_argument(
+        '--window-ms', type=float,
+        default=max(model_service.get_batch_window_s() * 1000.0, 3.0),
+        help='Model service batch window. Default: %(default)s.')
+    parser.add_argument(
+        '--seed', type=int, default=42, help='Default: %(default)s.')
+    parser.add_argument(
+        '--output', metavar='FILE', help='Save the summary as JSON here.')
+    args = parser.parse_args(argv)
+
+    # Load the grids before timing anything:
+    for model_input_str in model_types:
+        results_grid.get_grid(model_input_str)
+    patients = make_patients(args.users, args.rounds, args.distinct, args.seed)
+
+    summary = {}
+    model_service.batch_window_s = 0.0
+    summary['direct'] = run_burst(patients)
+
+    model_service.batch_window_s = args.window_ms / 1000.0
+    model_service.start()
+    model_service.metrics_reset()
+    summary['service'] = run_burst(patients)
+    summary['service']['service'] = model_service.metrics()
+    model_service.stop()
+
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
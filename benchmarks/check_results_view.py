@@ -0,0 +1,246 @@
+"""
+Check that the containers share one results view without copying.
+
+The Interactive demo page makes one ResultsView of the highlighted
+patient and passes it to every container (see results_table.py). For
+each model type, the four container main() functions are run against
+the stand-in for Streamlit (streamlit_stub.py) with one shared view,
+and every value they read is recorded. The checks are:
+    - no container calls ResultsTable.row() or ResultsTable.view(),
+      so nothing makes its own copy of the patient's results.
+    - every array read from the view or the table shares memory with
+      the arrays in the ResultsTable.
+    - every fixed parameter read from the view is the same object as
+      in fixed_params.
+
+Run from the top of the repository:
+    python benchmarks/check_results_view.py
+"""
+# Imports:
+import argparse
+import json
+import os
+import sys
+import warnings
+
+# Make the repository importable when run from anywhere:
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_directory)
+
+# The container tables use Styler.applymap, which newer pandas warns
+# about every time it's called:
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+# Replace Streamlit before anything imports it:
+import benchmarks.streamlit_stub as streamlit_stub
+streamlit_stub.install()
+
+import numpy as np
+import pandas as pd
+
+import utilities_lifetime.cohort as cohort
+import utilities_lifetime.container_costeffectiveness
+import utilities_lifetime.container_mortality
+import utilities_lifetime.container_qalys
+import utilities_lifetime.container_resources
+import utilities_lifetime.results_cache as results_cache
+from utilities_lifetime.results_table import ResultsTable, ResultsView
+from stroke_lifetime.fixed_params import get_fixed_params
+
+model_types = ['mRS', 'Dichotomous']
+
+
+def record_reads():
+    """
+    Record the values read from results tables and views.
+
+    ResultsTable.row() and ResultsTable.view() are counted, and
+    ResultsTable.__getitem__() and ResultsView.__getitem__() store
+    every value that they return.
+
+    Returns:
+    --------
+    reads   - dict. Contains:
+        calls        - dict. Number of calls of row and view.
+        table_values - list. (table, column, value) from the table.
+        view_values  - list. (view, key, value) from the views.
+    restore - callable. Puts the original functions back.
+    """
+    reads = dict(calls=dict(row=0, view=0), table_values=[], view_values=[])
+    originals = dict(
+        row=ResultsTable.row,
+        view=ResultsTable.view,
+        table_getitem=ResultsTable.__getitem__,
+        view_getitem=ResultsView.__getitem__,
+        )
+
+    def row(self, *args, **kwargs):
+        reads['calls']['row'] += 1
+        return originals['row'](self, *args, **kwargs)
+
+    def view(self, *args, **kwargs):
+        reads['calls']['view'] += 1
+        return originals['view'](self, *args, **kwargs)
+
+    def table_getitem(self, column):
+        value = originals['table_getitem'](self, column)
+        reads['table_values'].append((self, column, value))
+        return value
+
+    def view_getitem(self, key):
+        value = originals['view_getitem'](self, key)
+        reads['view_values'].append((self, key, value))
+        return value
+
+    ResultsTable.row = row
+    ResultsTable.view = view
+    ResultsTable.__getitem__ = table_getitem
+    ResultsView.__getitem__ = view_getitem
+
+    def restore():
+        ResultsTable.row = originals['row']
+        ResultsTable.view = originals['view']
+        ResultsTable.__getitem__ = originals['table_getitem']
+        ResultsView.__getitem__ = originals['view_getitem']
+
+    return reads, restore
+
+
+def table_storage(table: ResultsTable, column: str):
+    """
+    Find the array in the table that a result is stored in.
+
+    Inputs:
+    -------
+    table  - ResultsTable.
+    column - str. Any column of the old results DataFrame.
+
+    Returns:
+    --------
+    np.array. The year axis, the 2D array of a result by year or the
+    array of a scalar result.
+    """
+    if column == 'years':
+        return table.years
+    elif column in table.by_year:
+        return table.by_year[column]
+    return table.scalar_arrays[column]
+
+
+def check_model(model_input_str: str, age: float = 73, sex: int = 1):
+    """
+    Run the four containers on one shared view and check what they read.
+
+    Inputs:
+    -------
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    age             - float. Age of the patient.
+    sex             - int. Sex of the patient, 0 or 1.
+
+    Returns:
+    --------
+    report - dict. Counts of what was read and a list of failures.
+    """
+    fixed_params = get_fixed_params(model_input_str)
+    mrs_to_run = tuple(cohort.mrs_to_run_for_model(model_input_str))
+    (results, qalys_table, table_discounted_cost,
+     table_cost_effectiveness) = results_cache.run_all_mrs(
+        age, sex, mrs_to_run, model_input_str)
+    # The highlighted patient is the first row of the results:
+    mrs_input = 0
+    variables_dict = results.view(mrs_input, fixed_params)
+
+    reads, restore = record_reads()
+    try:
+        utilities_lifetime.container_mortality.main(
+            results, mrs_input, fixed_params, model_input_str,
+            variables_dict=variables_dict)
+        utilities_lifetime.container_qalys.main(
+            results, mrs_input, fixed_params, qalys_table,
+            model_input_str, variables_dict=variables_dict)
+        utilities_lifetime.container_resources.main(
+            results, mrs_input, fixed_params, table_discounted_cost,
+            model_input_str, variables_dict=variables_dict)
+        utilities_lifetime.container_costeffectiveness.main(
+            results, mrs_input, fixed_params, table_cost_effectiveness,
+            model_input_str, variables_dict=variables_dict)
+    finally:
+        restore()
+
+    failures = []
+    for name, calls in reads['calls'].items():
+        if calls > 0:
+            failures.append(f'{calls} calls of ResultsTable.{name}()')
+
+    n_arrays = 0
+    for table, column, value in reads['table_values']:
+        if isinstance(value, pd.Series):
+            value = value.to_numpy()
+        if not isinstance(value, np.ndarray):
+            continue
+        n_arrays += 1
+        if table is not results:
+            failures.append(f'results["{column}"] read from another table')
+        elif not np.shares_memory(value, table_storage(table, column)):
+            failures.append(f'results["{column}"] is a copy')
+
+    n_fixed_params = 0
+    for view, key, value in reads['view_values']:
+        if view is not variables_dict:
+            failures.append(f'"{key}" read from another view')
+        elif key in fixed_params:
+            n_fixed_params += 1
+            if value is not fixed_params[key]:
+                failures.append(f'fixed parameter "{key}" is a copy')
+        elif isinstance(value, np.ndarray):
+            n_arrays += 1
+            if not np.shares_memory(value, table_storage(results, key)):
+                failures.append(f'variables_dict["{key}"] is a copy')
+            elif value.flags.writeable:
+                failures.append(f'variables_dict["{key}"] can be changed')
+
+    report = dict(
+        view_reads=len(reads['view_values']),
+        view_keys=len(variables_dict.values),
+        table_reads=len(reads['table_values']),
+        arrays_checked=n_arrays,
+        fixed_params_checked=n_fixed_params,
+        failures=failures,
+        passed=len(failures) == 0,
+        )
+    return report
+
+
+def main(argv=None):
+    """
+    Run the checks from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 1 if any check failed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--output', metavar='FILE', help='Save the reports as JSON here.')
+    args = parser.parse_args(argv)
+
+    reports = {}
+    for model_input_str in model_types:
+        report = check_model(model_input_str)
+        reports[model_input_str] = report
+        print(f'{model_input_str:12s} ' +
+              ('passed' if report['passed'] else 'FAILED'))
+
+    print(json.dumps(reports, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+    return 0 if all([report['passed'] for report in reports.values()]) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
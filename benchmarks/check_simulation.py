@@ -0,0 +1,86 @@
+"""
+Check that the discrete event simulation agrees with the main results.
+
+For each model type, a cohort of every age, sex and mRS score on the
+Advanced options page is simulated one person at a time (see
+utilities_lifetime/simulation.py). The simulated survival and costs
+must be within a few standard errors of the calculated results.
+
+Run from the top of the repository:
+    python benchmarks/check_simulation.py
+    python benchmarks/check_simulation.py --people 1000000 --output sim.json
+"""
+# Imports:
+import argparse
+import json
+import os
+import sys
+import time
+
+# Make the repository importable when run from anywhere:
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_directory)
+
+import utilities_lifetime.results_cache as results_cache
+import utilities_lifetime.simulation as simulation
+from stroke_lifetime.fixed_params import get_fixed_params
+
+model_types = ['mRS', 'Dichotomous']
+
+
+def main(argv=None):
+    """
+    Run the checks from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 1 if any check failed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--people', type=int, default=simulation.verify_n_people,
+        help='People to simulate for each model. Default: %(default)s.')
+    parser.add_argument(
+        '--age-step', type=float, default=5.0,
+        help='Years between the ages of the cohort. Default: %(default)s.')
+    parser.add_argument(
+        '--tolerance', type=float, default=simulation.verify_tolerance,
+        help='Largest allowed difference in standard errors. ' +
+        'Default: %(default)s.')
+    parser.add_argument(
+        '--seed', type=int, default=42, help='Default: %(default)s.')
+    parser.add_argument(
+        '--output', metavar='FILE', help='Save the reports as JSON here.')
+    args = parser.parse_args(argv)
+
+    reports = {}
+    for model_input_str in model_types:
+        results = results_cache.run_sweep(
+            45.0, 90.0, args.age_step, model_input_str)
+        start = time.perf_counter()
+        report = simulation.verify_convergence(
+            results,
+            get_fixed_params(model_input_str),
+            n_people=args.people,
+            tolerance=args.tolerance,
+            seed=args.seed
+            )
+        report['time_s'] = time.perf_counter() - start
+        reports[model_input_str] = report
+        print(f'{model_input_str:12s} ' +
+              ('passed' if report['passed'] else 'FAILED') +
+              f' in {report["time_s"]:.1f}s')
+
+    print(json.dumps(reports, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+    return 0 if all([report['passed'] for report in reports.values()]) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
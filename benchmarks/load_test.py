@@ -0,0 +1,364 @@
+"""
+Simulate many people using the app at once, without a browser.
+
+Each simulated user runs a page with Streamlit's AppTest and then
+changes one widget at a time like a real user would: changing the
+age, switching sex, moving the mRS slider and switching model type.
+Each change makes the page script run again. The pages that are only
+text have no widgets, so those users just run the page again. The
+users run at the same time in separate processes. (A Streamlit server runs each
+session in a thread of one process, but AppTest sets some global
+state while a script runs so two AppTests can't share a process.)
+
+Reported at the end:
+    latency    - how long each script rerun took (percentiles).
+    throughput - reruns finished per second across all users.
+    peak RSS   - the most memory used by one user's process.
+    errors     - script runs that raised an exception.
+    text cache - hits and misses for the text files of the pages.
+
+Run from the top of the repository:
+    python benchmarks/load_test.py --page demo --users 8 --interactions 20
+    python benchmarks/load_test.py --page advanced --output load.json
+    python benchmarks/load_test.py --page intro --users 2
+"""
+# Imports:
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+# Make the repository importable when run from anywhere:
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_directory)
+
+import utilities_lifetime.inputs as inputs
+
+page_paths = dict(
+    demo=os.path.join(repo_directory, 'pages', '2_Interactive_demo.py'),
+    advanced=os.path.join(repo_directory, 'pages', '3_Advanced_options.py'),
+    intro=os.path.join(repo_directory, 'Introduction.py'),
+    project=os.path.join(repo_directory, 'pages', '4_OptImIST_Project.py'),
+    cite=os.path.join(repo_directory, 'pages', '5_Cite_this_work.py'),
+    resources=os.path.join(repo_directory, 'pages', '6_Resources.py'),
+    )
+
+
+# #####################################################################
+# ########################### Interactions ############################
+# #####################################################################
+
+def find_widget(widgets, label: str):
+    """
+    Find a widget by its label.
+
+    Inputs:
+    -------
+    widgets - AppTest widget list, e.g. at.radio.
+    label   - str. The widget's label.
+
+    Returns:
+    --------
+    The widget, or None if there isn't one with this label.
+    """
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    return None
+
+
+def interact_demo(at: AppTest, rng):
+    """
+    Change one widget on the Interactive demo page.
+
+    Inputs:
+    -------
+    at  - AppTest. The page after its most recent run.
+    rng - np.random.Generator. Picks the widget and its new value.
+
+    Returns:
+    --------
+    str. Description of the change.
+    """
+    action = rng.choice(['age', 'sex', 'mrs', 'model', 'section'])
+    if action == 'age':
+        value = int(rng.integers(45, 91))
+        find_widget(at.number_input, 'Age (years):').set_value(value)
+    elif action == 'sex':
+        widget = find_widget(at.radio, 'Sex:')
+        value = 'Female' if widget.value == 'Male' else 'Male'
+        widget.set_value(value)
+    elif action == 'mrs':
+        slider = find_widget(at.slider, 'mRS at discharge:')
+        if slider is not None:
+            value = int(rng.integers(0, 6))
+            slider.set_value(value)
+        else:
+            # The dichotomous model has a radio instead of a slider.
+            widget = find_widget(at.radio, 'Outcome at discharge:')
+            value = ('Dependent' if widget.value == 'Independent'
+                     else 'Independent')
+            widget.set_value(value)
+    elif action == 'model':
+        widget = find_widget(at.radio, 'Model type:')
+        value = 'Dichotomous' if widget.value == 'mRS' else 'mRS'
+        widget.set_value(value)
+    else:
+        widget = find_widget(at.radio, 'Results section:')
+        if widget is None:
+            # All sections are already shown in tabs.
+            return 'section (none)'
+        value = str(rng.choice(widget.options))
+        widget.set_value(value)
+    return f'{action}={value}'
+
+
+def interact_advanced(at: AppTest, rng):
+    """
+    Change one widget on the Advanced options page.
+
+    Inputs:
+    -------
+    at  - AppTest. The page after its most recent run.
+    rng - np.random.Generator. Picks the widget and its new value.
+
+    Returns:
+    --------
+    str. Description of the change.
+    """
+    action = rng.choice(['age_min', 'age_max', 'age_step', 'model'])
+    if action == 'age_min':
+        value = float(rng.integers(90, 121)) / 2.0
+        at.number_input(key='age_min').set_value(value)
+    elif action == 'age_max':
+        value = float(rng.integers(150, 181)) / 2.0
+        at.number_input(key='age_max').set_value(value)
+    elif action == 'age_step':
+        value = float(rng.choice([0.5, 1.0, 2.5, 5.0]))
+        at.number_input(key='age_step').set_value(value)
+    else:
+        widget = find_widget(at.radio, 'Model type:')
+        value = 'Dichotomous' if widget.value == 'mRS' else 'mRS'
+        widget.set_value(value)
+    return f'{action}={value}'
+
+
+def interact_static(at: AppTest, rng):
+    """
+    Do nothing before the next run of a page that's only text.
+
+    Inputs:
+    -------
+    at  - AppTest. The page after its most recent run.
+    rng - np.random.Generator. Not used.
+
+    Returns:
+    --------
+    str. Description of the change.
+    """
+    return 'rerun'
+
+
+page_interactions = dict(
+    demo=interact_demo,
+    advanced=interact_advanced,
+    intro=interact_static,
+    project=interact_static,
+    cite=interact_static,
+    resources=interact_static,
+    )
+
+
+# #####################################################################
+# ############################ Simulation #############################
+# #####################################################################
+
+def simulate_user(
+        page: str,
+        n_interactions: int,
+        seed: int,
+        timeout: float
+        ):
+    """
+    Run one simulated user's session.
+
+    Inputs:
+    -------
+    page           - str. A key of page_paths, e.g. "demo".
+    n_interactions - int. Number of widget changes after the first run.
+    seed           - int. Seed for this user's choices.
+    timeout        - float. Longest time allowed for one rerun.
+
+    Returns:
+    --------
+    dict. Keys latencies (seconds per run, including the first),
+    errors (message of each run that raised an exception), actions,
+    peak_rss_mb and text_cache (hit and miss counters).
+    """
+    # Keep Streamlit's own messages out of the report:
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    # The pages find their text files from the top of the repository:
+    os.chdir(repo_directory)
+
+    rng = np.random.default_rng(seed)
+    at = AppTest.from_file(page_paths[page], default_timeout=timeout)
+    latencies = []
+    actions = ['first run']
+    errors = []
+
+    start = time.perf_counter()
+    at.run()
+    latencies.append(time.perf_counter() - start)
+    for _ in range(n_interactions):
+        if at.exception:
+            # Start again from a fresh session after an error.
+            errors.append(at.exception[0].message)
+            at = AppTest.from_file(page_paths[page], default_timeout=timeout)
+            at.run()
+        actions.append(page_interactions[page](at, rng))
+        start = time.perf_counter()
+        at.run()
+        latencies.append(time.perf_counter() - start)
+    if at.exception:
+        errors.append(at.exception[0].message)
+    return dict(latencies=latencies, errors=errors, actions=actions,
+                peak_rss_mb=peak_rss_mb(),
+                text_cache=inputs.text_cache_info())
+
+
+def peak_rss_mb():
+    """
+    Find the most memory this process has used so far.
+
+    Returns:
+    --------
+    float. Peak resident set size in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kB and macOS gives bytes:
+    return peak / 1024.0**2 if sys.platform == 'darwin' else peak / 1024.0
+
+
+def run_load_test(
+        page: str,
+        n_users: int,
+        n_interactions: int,
+        seed: int = 42,
+        timeout: float = 120.0
+        ):
+    """
+    Run many simulated users at the same time.
+
+    Inputs:
+    -------
+    page           - str. A key of page_paths, e.g. "demo".
+    n_users        - int. Number of users running at once.
+    n_interactions - int. Widget changes per user.
+    seed           - int. Each user's choices use seed + user number.
+    timeout        - float. Longest time allowed for one rerun.
+
+    Returns:
+    --------
+    summary - dict. Latency percentiles in ms, throughput in reruns
+              per second, the highest peak RSS of one user in MB,
+              the number of errors and the text cache counters
+              summed over all users.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_users) as executor:
+        sessions = list(executor.map(
+            simulate_user,
+            [page] * n_users,
+            [n_interactions] * n_users,
+            [seed + user for user in range(n_users)],
+            [timeout] * n_users
+            ))
+    wall_time = time.perf_counter() - start
+
+    # Leave out each user's first run, which includes starting up:
+    latencies = np.array([
+        latency for session in sessions for latency in session['latencies'][1:]
+        ])
+    first_runs = np.array([session['latencies'][0] for session in sessions])
+    n_runs = sum([len(session['latencies']) for session in sessions])
+    percentiles = [50, 90, 95, 99]
+
+    summary = dict(
+        page=page,
+        users=n_users,
+        interactions_per_user=n_interactions,
+        reruns=int(len(latencies)),
+        wall_time_s=wall_time,
+        throughput_runs_per_s=n_runs / wall_time,
+        latency_ms={
+            f'p{p}': float(1000.0 * np.percentile(latencies, p))
+            for p in percentiles
+            } | dict(
+                mean=float(1000.0 * latencies.mean()),
+                max=float(1000.0 * latencies.max())),
+        first_run_ms=dict(
+            mean=float(1000.0 * first_runs.mean()),
+            max=float(1000.0 * first_runs.max())),
+        peak_rss_mb_per_user=max(
+            [session['peak_rss_mb'] for session in sessions]),
+        errors=int(sum([len(session['errors']) for session in sessions])),
+        error_messages=sorted(set(
+            [message for session in sessions for message in session['errors']]
+            )),
+        text_cache={
+            key: int(sum([session['text_cache'][key] for session in sessions]))
+            for key in ['hits', 'misses']
+            },
+        )
+    return summary
+
+
+def main(argv=None):
+    """
+    Run the load test from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 1 if any rerun raised an exception.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--page', choices=list(page_paths), default='demo',
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--users', type=int, default=4,
+        help='Number of simultaneous users. Default: %(default)s.')
+    parser.add_argument(
+        '--interactions', type=int, default=10,
+        help='Widget changes per user. Default: %(default)s.')
+    parser.add_argument(
+        '--seed', type=int, default=42, help='Default: %(default)s.')
+    parser.add_argument(
+        '--timeout', type=float, default=120.0,
+        help='Longest time for one rerun in seconds. Default: %(default)s.')
+    parser.add_argument(
+        '--output', metavar='FILE', help='Save the summary as JSON here.')
+    args = parser.parse_args(argv)
+
+    summary = run_load_test(
+        args.page, args.users, args.interactions, args.seed, args.timeout)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['errors'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
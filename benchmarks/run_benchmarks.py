@@ -0,0 +1,457 @@
+"""
+Time the slow parts of the app and compare against earlier runs.
+
+There are four groups of benchmarks:
+    model  - main_calculations() from the stroke-lifetime package for
+             each mRS score and model type.
+    tables - the change-in-outcome table builders in
+             utilities_lifetime/main_calculations.py.
+    sweep  - the Advanced options page calculations for several age
+             steps, both looked up from the grid and calculated.
+    render - the container main() functions, the latex_equations
+             string builders and the container table writers. These
+             run against a stand-in for Streamlit (streamlit_stub.py)
+             so only the app's own work is timed.
+
+Run from the top of the repository:
+    python benchmarks/run_benchmarks.py --output benchmarks.json
+    python benchmarks/run_benchmarks.py --compare benchmarks.json
+
+The results are saved as JSON with the median and fastest time per
+call for each benchmark. With --compare, any benchmark whose median
+time is more than --threshold (default 20%) slower than in the earlier
+file is flagged and the script exits with code 1.
+"""
+# Imports:
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import warnings
+
+# Make the repository importable when run from anywhere:
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_directory)
+
+# The container tables use Styler.applymap, which newer pandas warns
+# about every time it's called:
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+# Replace Streamlit before anything imports it:
+import benchmarks.streamlit_stub as streamlit_stub
+streamlit_stub.install()
+
+import numpy as np
+import pandas as pd
+
+import stroke_lifetime
+import stroke_lifetime.main_calculations as stroke_calc
+from stroke_lifetime.fixed_params import get_fixed_params
+
+import utilities_lifetime.batch_calculations as batch_calc
+import utilities_lifetime.cohort as cohort
+import utilities_lifetime.container_costeffectiveness
+import utilities_lifetime.container_mortality
+import utilities_lifetime.container_qalys
+import utilities_lifetime.container_resources
+import utilities_lifetime.latex_equations as eqn
+import utilities_lifetime.main_calculations as calc
+import utilities_lifetime.results_cache as results_cache
+import utilities_lifetime.results_grid as results_grid
+
+model_types = ['mRS', 'Dichotomous']
+sweep_age_steps = [5.0, 1.0, 0.5]
+
+
+# #####################################################################
+# ############################ Benchmarks #############################
+# #####################################################################
+
+def model_cases():
+    """
+    Benchmarks of main_calculations() for one patient.
+
+    Returns:
+    --------
+    cases - list. Contains (group, name, function) for each benchmark.
+    """
+    cases = []
+    for model_input_str in model_types:
+        fixed_params = get_fixed_params(model_input_str)
+        for mrs in cohort.mrs_to_run_for_model(model_input_str):
+            cases.append((
+                'model',
+                f'main_calculations[{model_input_str}, mRS {mrs}]',
+                lambda mrs=mrs, fixed_params=fixed_params,
+                model_input_str=model_input_str:
+                    stroke_calc.main_calculations(
+                        73, 1, 'Male', mrs, fixed_params, model_input_str)
+                ))
+    return cases
+
+
+def table_cases():
+    """
+    Benchmarks of the change-in-outcome table builders.
+
+    Returns:
+    --------
+    cases - list. Contains (group, name, function) for each benchmark.
+    """
+    rng = np.random.default_rng(42)
+    values = rng.normal(size=6)
+    values_batch = rng.normal(size=(1000, 6))
+    cases = [
+        ('tables', f'{name}[6]', lambda function=getattr(calc, name):
+            function(values))
+        for name in [
+            'build_table_qaly_by_change_in_outcome',
+            'build_table_discounted_change',
+            'build_table_cost_effectiveness',
+            ]
+        ]
+    cases.append((
+        'tables', 'build_change_in_outcome[1000 x 6]',
+        lambda: calc.build_change_in_outcome(values_batch)))
+    return cases
+
+
+def sweep_cases():
+    """
+    Benchmarks of the Advanced options page calculations.
+
+    Returns:
+    --------
+    cases - list. Contains (group, name, function) for each benchmark.
+    """
+    cases = []
+    for model_input_str in model_types:
+        fixed_params = get_fixed_params(model_input_str)
+        mrs_to_run = cohort.mrs_to_run_for_model(model_input_str)
+        # Load or build the grid now so it isn't part of the timings:
+        results_grid.get_grid(model_input_str)
+        for age_step in sweep_age_steps:
+            ages = np.arange(45.0, 90.0 + 1e-3, age_step)
+
+            def sweep_lookup(ages=ages, mrs_to_run=mrs_to_run,
+                             model_input_str=model_input_str):
+                patient_df = cohort.build_cohort(ages, mrs_to_run=mrs_to_run)
+                results = results_grid.lookup_table(
+                    patient_df['age'].to_numpy(),
+                    patient_df['sex'].to_numpy(),
+                    patient_df['mrs'].to_numpy(),
+                    model_input_str,
+                    sex_label=patient_df['sex_label'].to_numpy()
+                    )
+                return calc.build_change_in_outcome_dataframe(
+                    results.scalars, ['qalys_total', 'total_discounted_cost',
+                                      'net_benefit'], len(mrs_to_run))
+
+            def sweep_batch(ages=ages, mrs_to_run=mrs_to_run,
+                            fixed_params=fixed_params,
+                            model_input_str=model_input_str):
+                patient_df = cohort.build_cohort(ages, mrs_to_run=mrs_to_run)
+                return batch_calc.main_calculations_batch(
+                    patient_df['age'].to_numpy(),
+                    patient_df['sex'].to_numpy(),
+                    patient_df['mrs'].to_numpy(),
+                    fixed_params,
+                    model_input_str
+                    )
+
+            label = f'{model_input_str}, step {age_step}'
+            cases.append(('sweep', f'advanced_sweep_lookup[{label}]',
+                          sweep_lookup))
+            cases.append(('sweep', f'advanced_sweep_batch[{label}]',
+                          sweep_batch))
+    return cases
+
+
+def render_cases():
+    """
+    Benchmarks of the container scripts against the Streamlit stub.
+
+    The container main() functions are run once first to record the
+    arguments of every latex_equations function and write_table_*
+    function that they call. Those calls are then timed on their own.
+
+    Returns:
+    --------
+    cases - list. Contains (group, name, function) for each benchmark.
+    """
+    containers = [
+        utilities_lifetime.container_mortality,
+        utilities_lifetime.container_qalys,
+        utilities_lifetime.container_resources,
+        utilities_lifetime.container_costeffectiveness,
+        ]
+    cases = []
+    for model_input_str in model_types:
+        fixed_params = get_fixed_params(model_input_str)
+        mrs_to_run = tuple(cohort.mrs_to_run_for_model(model_input_str))
+        (results, qalys_table, table_discounted_cost,
+         table_cost_effectiveness) = results_cache.run_all_mrs(
+            73, 1, mrs_to_run, model_input_str)
+        # The highlighted patient is the first row of the results:
+        mrs_input = 0
+        container_args = {
+            'container_mortality': (
+                results, mrs_input, fixed_params, model_input_str),
+            'container_qalys': (
+                results, mrs_input, fixed_params, qalys_table,
+                model_input_str),
+            'container_resources': (
+                results, mrs_input, fixed_params, table_discounted_cost,
+                model_input_str),
+            'container_costeffectiveness': (
+                results, mrs_input, fixed_params, table_cost_effectiveness,
+                model_input_str),
+            }
+        for container in containers:
+            short_name = container.__name__.split('.')[-1]
+            args = container_args[short_name]
+            latex_calls, table_calls = record_calls(container, args)
+
+            cases.append((
+                'render', f'{short_name}.main[{model_input_str}]',
+                lambda container=container, args=args: container.main(*args)
+                ))
+            if len(latex_calls) > 0:
+                cases.append((
+                    'render',
+                    f'latex_equations from {short_name}[{model_input_str}, ' +
+                    f'{len(latex_calls)} calls]',
+                    lambda calls=latex_calls: replay_calls(calls)
+                    ))
+            for name, call in table_calls.items():
+                cases.append((
+                    'render', f'{short_name}.{name}[{model_input_str}]',
+                    lambda call=call: replay_calls([call])
+                    ))
+    return cases
+
+
+def record_calls(container, args: tuple):
+    """
+    Run a container and record the latex and table-writing calls.
+
+    Inputs:
+    -------
+    container - module. One of the container scripts.
+    args      - tuple. Arguments for the container's main().
+
+    Returns:
+    --------
+    latex_calls - list. Contains (function, args, kwargs) for every
+                  latex_equations call.
+    table_calls - dict. For each write_table_* function called, its
+                  first (function, args, kwargs).
+    """
+    latex_calls = []
+    table_calls = {}
+    originals = []
+
+    def recorder(module, name, function, store):
+        def wrapper(*call_args, **call_kwargs):
+            store(name, (function, call_args, call_kwargs))
+            return function(*call_args, **call_kwargs)
+        originals.append((module, name, function))
+        setattr(module, name, wrapper)
+
+    for name, function in list(vars(eqn).items()):
+        if callable(function) and getattr(
+                function, '__module__', None) == eqn.__name__:
+            recorder(eqn, name, function,
+                     lambda name, call: latex_calls.append(call))
+    for name, function in list(vars(container).items()):
+        if name.startswith('write_table') and callable(function):
+            recorder(container, name, function,
+                     lambda name, call: table_calls.setdefault(name, call))
+    try:
+        container.main(*args)
+    finally:
+        for module, name, function in originals:
+            setattr(module, name, function)
+    return latex_calls, table_calls
+
+
+def replay_calls(calls: list):
+    """
+    Run each recorded call again.
+
+    Inputs:
+    -------
+    calls - list. Contains (function, args, kwargs).
+    """
+    for function, args, kwargs in calls:
+        function(*args, **kwargs)
+
+
+# #####################################################################
+# ############################## Timing ###############################
+# #####################################################################
+
+def time_function(function, min_time: float, repeats: int):
+    """
+    Time one benchmark.
+
+    Inputs:
+    -------
+    function - callable. The code to time.
+    min_time - float. Each repeat runs the function enough times to
+               take at least this many seconds.
+    repeats  - int. Number of repeats.
+
+    Returns:
+    --------
+    dict. Keys median_s and min_s (per call), number (calls per
+    repeat) and repeats.
+    """
+    timer = timeit.Timer(function)
+    # Find how many calls fill min_time:
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time or number >= 1_000_000:
+            break
+        number *= 2
+    times = np.array(timer.repeat(repeats, number)) / number
+    return dict(
+        median_s=float(np.median(times)),
+        min_s=float(np.min(times)),
+        number=number,
+        repeats=repeats,
+        )
+
+
+def environment_details():
+    """
+    Describe where the benchmarks ran so that runs can be compared.
+
+    Returns:
+    --------
+    dict. Versions, platform, time and git commit.
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_directory,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        time=datetime.datetime.now().isoformat(timespec='seconds'),
+        commit=commit,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        stroke_lifetime=getattr(stroke_lifetime, '__version__', None),
+        )
+
+
+def compare_results(results: dict, baseline: dict, threshold: float):
+    """
+    Compare these timings with an earlier run.
+
+    Inputs:
+    -------
+    results   - dict. Benchmark name to timings from this run.
+    baseline  - dict. Benchmark name to timings from an earlier run.
+    threshold - float. Flag benchmarks whose median time grew by more
+                than this fraction, e.g. 0.2 for 20%.
+
+    Returns:
+    --------
+    df_compare - pd.DataFrame. One row per benchmark in both runs.
+    """
+    rows = []
+    for name, timings in results.items():
+        if name not in baseline:
+            continue
+        ratio = timings['median_s'] / baseline[name]['median_s']
+        rows.append(dict(
+            benchmark=name,
+            baseline_ms=1000.0 * baseline[name]['median_s'],
+            median_ms=1000.0 * timings['median_s'],
+            ratio=ratio,
+            regression=ratio > 1.0 + threshold,
+            ))
+    df_compare = pd.DataFrame(
+        rows, columns=['benchmark', 'baseline_ms', 'median_ms', 'ratio',
+                       'regression'])
+    return df_compare
+
+
+def main(argv=None):
+    """
+    Run the benchmarks from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 1 if a regression was found, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--group', choices=['model', 'tables', 'sweep', 'render'],
+        action='append', help='Only run these groups. Default: all.')
+    parser.add_argument(
+        '--filter', default='',
+        help='Only run benchmarks whose names contain this text.')
+    parser.add_argument(
+        '--output', metavar='FILE', help='Save the results as JSON here.')
+    parser.add_argument(
+        '--compare', metavar='FILE',
+        help='Compare with the results saved in this JSON file.')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='Slowdown that counts as a regression. Default: %(default)s.')
+    parser.add_argument(
+        '--min-time', type=float, default=0.05,
+        help='Seconds per repeat. Default: %(default)s.')
+    parser.add_argument(
+        '--repeats', type=int, default=5,
+        help='Repeats per benchmark. Default: %(default)s.')
+    args = parser.parse_args(argv)
+
+    case_functions = dict(
+        model=model_cases, tables=table_cases,
+        sweep=sweep_cases, render=render_cases)
+    groups = args.group or list(case_functions.keys())
+
+    results = {}
+    for group in groups:
+        for group_name, name, function in case_functions[group]():
+            if args.filter not in name:
+                continue
+            timings = time_function(function, args.min_time, args.repeats)
+            results[name] = dict(group=group_name, **timings)
+            print(f'{group_name:7} {1000.0 * timings["median_s"]:10.3f} ms' +
+                  f'  {name}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(environment=environment_details(),
+                           results=results), f, indent=2)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        df_compare = compare_results(results, baseline, args.threshold)
+        print(df_compare.to_string(index=False, float_format='%.3f'))
+        if df_compare['regression'].any():
+            print(f'{df_compare["regression"].sum()} benchmarks are more ' +
+                  f'than {100 * args.threshold:.0f}% slower.')
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+A stand-in for Streamlit so that the container scripts can be timed.
+
+Every Streamlit function becomes a function that does nothing, so the
+benchmarks time the work done by the app's own code (building
+strings, tables and figures) without the cost of sending anything to
+a browser. Widgets return their default values.
+
+Install it before anything imports streamlit:
+    import benchmarks.streamlit_stub
+    benchmarks.streamlit_stub.install()
+"""
+# Imports:
+import sys
+import types
+
+
+class StubElement:
+    """
+    Stands in for anything that Streamlit returns.
+
+    Works as a context manager (e.g. "with st.expander(...):") and
+    has the same functions as the stub module (e.g. cols[0].markdown).
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(stub_module, name)
+
+    def __call__(self, *args, **kwargs):
+        return StubElement()
+
+
+def do_nothing(*args, **kwargs):
+    """Stand in for any Streamlit function that draws something."""
+    return StubElement()
+
+
+def columns(spec, *args, **kwargs):
+    """Return one element for each column."""
+    n_columns = spec if isinstance(spec, int) else len(spec)
+    return [StubElement() for _ in range(n_columns)]
+
+
+def tabs(labels, *args, **kwargs):
+    """Return one element for each tab."""
+    return [StubElement() for _ in labels]
+
+
+def slider(label, min_value=None, max_value=None, value=None, *args,
+           **kwargs):
+    """Return the default value of the slider."""
+    return min_value if value is None else value
+
+
+def number_input(label, min_value=None, max_value=None, value=None, *args,
+                 **kwargs):
+    """Return the default value of the number input."""
+    return min_value if value is None else value
+
+
+def radio(label, options, index=0, *args, **kwargs):
+    """Return the default option."""
+    return list(options)[index]
+
+
+selectbox = radio
+
+
+def toggle(label, value=False, *args, **kwargs):
+    """Return the default value of the toggle."""
+    return value
+
+
+checkbox = toggle
+
+
+def make_stub_module():
+    """
+    Make the module that replaces streamlit.
+
+    Returns:
+    --------
+    module - types.ModuleType. Any function not defined here does
+             nothing and returns a StubElement.
+    """
+    module = types.ModuleType('streamlit')
+    module.columns = columns
+    module.tabs = tabs
+    module.slider = slider
+    module.number_input = number_input
+    module.radio = radio
+    module.selectbox = selectbox
+    module.toggle = toggle
+    module.checkbox = checkbox
+    module.session_state = {}
+    module.query_params = {}
+    module.sidebar = StubElement()
+    module.__getattr__ = lambda name: do_nothing
+    return module
+
+
+stub_module = make_stub_module()
+
+
+def install():
+    """Replace streamlit with the stub for anything imported after this."""
+    sys.modules['streamlit'] = stub_module
@@ -12,7 +12,6 @@ are in the scripts named container_(something).py.
 """
 # ----- Imports -----
 import streamlit as st
-import pandas as pd
 
 # Add an extra bit to the path if we need to.
 # Try importing something as though we're running this from the same
@@ -35,8 +34,11 @@ import utilities_lifetime.container_mortality
 import utilities_lifetime.container_qalys
 import utilities_lifetime.container_resources
 import utilities_lifetime.container_costeffectiveness
-# The home of the main calculation functions:
-import stroke_lifetime.main_calculations as calc
+import utilities_lifetime.container_sensitivity
+# The main calculations, cached between reruns:
+import utilities_lifetime.results_cache
+# Optional timings of everything drawn on the page:
+import utilities_lifetime.instrumentation
 # Function to import fixed params for either mRS or dicho model:
 from stroke_lifetime.fixed_params import get_fixed_params
 
@@ -48,6 +50,27 @@ def main():
     # Set up the tab title and emoji:
     page_setup()
 
+    # Time the container functions if ?profile=1 is in the URL or the
+    # environment variable LIFETIME_PROFILE=1 is set.
+    utilities_lifetime.instrumentation.start_rerun([
+        utilities_lifetime.container_mortality,
+        utilities_lifetime.container_qalys,
+        utilities_lifetime.container_resources,
+        utilities_lifetime.container_costeffectiveness,
+        utilities_lifetime.container_sensitivity,
+        ])
+    try:
+        draw_page()
+        # Show and log the timings if they're switched on:
+        utilities_lifetime.instrumentation.finish_rerun('Interactive demo')
+    finally:
+        # Unwrap the functions even if the page stopped early, e.g.
+        # from an exception, st.stop() or a rerun:
+        utilities_lifetime.instrumentation.release_wrappers()
+
+
+def draw_page():
+    """Draw everything on the page below the title bar."""
     # Page title:
     st.markdown('# Lifetime outcomes')
     # Draw a blue information box:
@@ -65,6 +88,7 @@ def main():
         # Place these container now and add stuff to them later:
         container_patient_detail_inputs = st.container()
         container_model_type_inputs = st.container()
+        container_display_inputs = st.container()
         # Add an empty header for breathing room in the sidebar:
         st.markdown('# ')
 
@@ -89,6 +113,11 @@ def main():
         # sex is an integer,  0 for female and 1 for male.
         # age and mrs_input are both integers.
 
+    with container_display_inputs:
+        st.markdown('## Display')
+        show_all_sections = (
+            utilities_lifetime.container_inputs.display_options_input())
+
     # #####################################
     # ######### MAIN CALCULATIONS #########
     # #####################################
@@ -101,116 +130,119 @@ def main():
 
     if model_input_str == 'mRS':
         # Create results for all mRS scores [0, 1, ..., 5]:
-        mrs_to_run = range(6)
+        mrs_to_run = (0, 1, 2, 3, 4, 5)
     else:
         # In the dichotomous model we give one set of parameters to
         # mRS < 3 and a second set to mRS >=3. So just run two mRS
         # values to save repeats.
-        mrs_to_run = [0, 5]
-
-    # Store results dictionaries in here:
-    results_dict_list = []
-    for mrs in mrs_to_run:
-        # For each mRS score, use the following function to calculate
-        # everything useful for displaying in the app. The function
-        # returns a dictionary.
-        results_dict = calc.main_calculations(
-            age,
-            sex,
-            sex_str,
-            mrs,
-            fixed_params,
-            model_input_str
-            )
-
-        # Store this dictionary in the list of dicts:
-        results_dict_list.append(results_dict)
+        mrs_to_run = (0, 5)
 
-    # Turn all results dictionaries into a single data frame:
-    df = pd.DataFrame(results_dict_list)
-
-    # #####################################
-    # ######### CHANGE IN OUTCOME #########
-    # #####################################
-
-    # Take a column from the dataframe that contains one value for
+    # For each mRS score, calculate everything useful for displaying
+    # in the app and store it all in a single table of results.
+    # Then take a column from the dataframe that contains one value for
     # each mRS score from 0 to 5. Turn those six values into a 6x6
     # grid to show the change in the value between mRS scores.
-
-    # ##### QALYs #####
-    qalys_table = calc.build_table_qaly_by_change_in_outcome(
-        df['qalys_total']
-        )
+    # The results are cached for all visitors, so they are only
+    # calculated when this patient hasn't been seen recently.
+    with utilities_lifetime.instrumentation.timer('calculations'):
+        (results,
+         qalys_table,
+         table_discounted_cost,
+         table_cost_effectiveness) = (
+            utilities_lifetime.results_cache.run_all_mrs(
+                age,
+                sex,
+                mrs_to_run,
+                model_input_str
+                ))
     # qalys_table is a 2D np.array, 6 rows by 6 columns, that contains
     # the data for the "Discounted QALYs by change in outcome" table,
     # and invalid cells already contain either '-' or '' depending.
+    # table_discounted_cost and table_cost_effectiveness are the same
+    # for the "Discounted total costs by change in outcome" and
+    # "Discounted total Net Benefit by change in outcome" tables.
 
-    # ##### Resource use #####
-    table_discounted_cost = calc.build_table_discounted_change(
-        df['total_discounted_cost']
-        )
-    # table_discounted_cost is a 2D np.array, 6 rows by 6 columns, that
-    # contains the data for the "Discounted total costs by change in
-    # outcome" table, and invalid cells already contain either '-' or ''.
-
-    # ##### Cost-effectiveness #####
-    table_cost_effectiveness = calc.build_table_cost_effectiveness(
-        df['net_benefit']
-        )
-    # table_cost_effectiveness is a 2D np.array, 6 rows by 6 columns, that
-    # contains the data for the "Discounted total Net Benefit by change in
-    # outcome" table, and invalid cells already contain either '-' or ''.
+    # Make one read-only view of the results for the highlighted mRS
+    # score and the fixed parameters. Every container reads from this
+    # same view, and values are only looked up when they're used.
+    variables_dict = results.view(mrs_input, fixed_params)
 
     # ###########################
     # ######### RESULTS #########
     # ###########################
 
-    # Put each section into its own tab.
-    tabs = st.tabs(['Mortality', 'QALYs', 'Resources', 'Cost'])
-
     # For each topic, run the main() function in the container script.
-    # That function pulls out all of the relevant data from "df" and
+    # That function pulls out all of the relevant data from "results" and
     # draws all of the tables, plots, "details" and "example" boxes
     # and everything else that is displayed on the app.
-
-    with tabs[0]:
-        st.header('Mortality')
-        utilities_lifetime.container_mortality.main(
-            df,
-            mrs_input,
-            fixed_params,
-            model_input_str
-            )
-
-    with tabs[1]:
-        st.header('QALYs')
-        utilities_lifetime.container_qalys.main(
-            df,
-            mrs_input,
-            fixed_params,
-            qalys_table,
-            model_input_str
-            )
-
-    with tabs[2]:
-        st.header('Resources and costs')
-        utilities_lifetime.container_resources.main(
-            df,
-            mrs_input,
-            fixed_params,
-            table_discounted_cost,
-            model_input_str
-            )
-
-    with tabs[3]:
-        st.header('Cost-effectiveness')
-        utilities_lifetime.container_costeffectiveness.main(
-            df,
-            mrs_input,
-            fixed_params,
-            table_cost_effectiveness,
-            model_input_str
-            )
+    def draw_section(section):
+        if section == 'Mortality':
+            st.header('Mortality')
+            utilities_lifetime.container_mortality.main(
+                results,
+                mrs_input,
+                fixed_params,
+                model_input_str,
+                variables_dict=variables_dict
+                )
+        elif section == 'QALYs':
+            st.header('QALYs')
+            utilities_lifetime.container_qalys.main(
+                results,
+                mrs_input,
+                fixed_params,
+                qalys_table,
+                model_input_str,
+                variables_dict=variables_dict
+                )
+        elif section == 'Resources':
+            st.header('Resources and costs')
+            utilities_lifetime.container_resources.main(
+                results,
+                mrs_input,
+                fixed_params,
+                table_discounted_cost,
+                model_input_str,
+                variables_dict=variables_dict
+                )
+        elif section == 'Cost':
+            st.header('Cost-effectiveness')
+            utilities_lifetime.container_costeffectiveness.main(
+                results,
+                mrs_input,
+                fixed_params,
+                table_cost_effectiveness,
+                model_input_str,
+                variables_dict=variables_dict
+                )
+        elif section == 'Sensitivity':
+            st.header('Sensitivity analysis')
+            utilities_lifetime.container_sensitivity.main(
+                age,
+                sex,
+                mrs_input,
+                model_input_str
+                )
+
+    section_names = [
+        'Mortality', 'QALYs', 'Resources', 'Cost', 'Sensitivity']
+    # Each section is timed with the other timings (see
+    # instrumentation.py) when they're switched on.
+    if show_all_sections:
+        # Put each section into its own tab.
+        # Streamlit draws the contents of every tab on every rerun.
+        tabs = st.tabs(section_names)
+        for tab, section in zip(tabs, section_names):
+            with tab:
+                with utilities_lifetime.instrumentation.timer(
+                        f'section.{section}'):
+                    draw_section(section)
+    else:
+        # Only draw the chosen section so that reruns are quicker.
+        section = utilities_lifetime.container_inputs.section_input(
+            section_names)
+        with utilities_lifetime.instrumentation.timer(f'section.{section}'):
+            draw_section(section)
 
     # ----- The end! -----
 
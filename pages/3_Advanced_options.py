@@ -9,11 +9,14 @@ for age, sex, and mRS, to calculating all the quantities we need
 for tables and charts of mortality, QALYs, resource use, and
 cost effectiveness.
 
-Most of the proper calculation functions are in main_calculations.py,
-and most of the calls to write to streamlit are in the scripts
-named container_(something).py.
+Most of the proper calculation functions are in the stroke-lifetime
+package, batch_calculations.py and results_grid.py, and most of the
+calls to write to streamlit are in the scripts named
+container_(something).py.
 """
 # ----- Imports -----
+import functools
+
 import streamlit as st
 import numpy as np
 import pandas as pd
@@ -37,8 +40,18 @@ except ModuleNotFoundError:
 
 # Container scripts (which will be called after the calculations):
 import utilities_lifetime.container_inputs
-# The home of the main calculation functions:
-import stroke_lifetime.main_calculations as calc
+# Every combination of age, sex and mRS:
+import utilities_lifetime.cohort as cohort
+# Files for the download buttons, made only when they're clicked:
+import utilities_lifetime.downloads as downloads
+# The change-in-outcome tables:
+import utilities_lifetime.main_calculations as calc
+# Expected change in results from a shift in the mRS distribution:
+import utilities_lifetime.distribution_shift as distribution_shift
+# Weighted results for a whole population:
+import utilities_lifetime.population as population_lifetime
+# The main calculations for many patients at once, kept between reruns:
+import utilities_lifetime.results_cache as results_cache
 # Function to import fixed params for either mRS or dicho model:
 from stroke_lifetime.fixed_params import get_fixed_params
 
@@ -122,39 +135,9 @@ def main():
             '''
             )
         st.stop()
-    age_range = np.arange(age_min, age_max+1e-3, age_step)
-
-
-    # ###################################
-    # ######### CREATE PATIENTS #########
-    # ###################################
-    # Create every combination of age/sex/mrs for the selected
-    # age range and model type.
 
     # Decide which mRS scores to run:
-    if model_input_str == 'mRS':
-        mrs_to_run = range(6)
-    else:
-        # In the dichotomous model we give one set of parameters to
-        # mRS < 3 and a second set to mRS >=3. So just run two mRS
-        # values to save repeats.
-        mrs_to_run = [0, 5]
-
-    # Store patients in here:
-    patient_df = pd.DataFrame(columns=[
-        'age', 'sex', 'sex_label', 'mrs', 'outcome_type'])
-    count = 0
-    for age in age_range:
-        for sex in [0, 1]:
-            sex_label = 'Male' if sex == 1 else 'Female'
-            for mrs in mrs_to_run:
-                # Use the mRS score to label this patient as independent or
-                # dependent in the dichotomous model.
-                outcome_type = 'Dependent' if mrs > 2 else 'Independent'
-
-                patient_df.loc[count] = [
-                    age, sex, sex_label, mrs, outcome_type]
-                count += 1
+    mrs_to_run = cohort.mrs_to_run_for_model(model_input_str)
 
     # #####################################
     # ######### MAIN CALCULATIONS #########
@@ -166,41 +149,234 @@ def main():
     # model.
     fixed_params = get_fixed_params(model_input_str)
 
-    # Store results dictionaries in here:
-    results_dict_list = []
-
-    # Run each patient separately:
-    for p in range(len(patient_df)):
-        patient = patient_df.loc[p]
-
-        # This is the same code as in "2_Interactive_demo.py".
-        results_dict = calc.main_calculations(
-            patient['age'],
-            patient['sex'],
-            patient['sex_label'],
-            patient['mrs'],
-            fixed_params,
-            model_input_str
-            )
-        # Store this dictionary in the list of dicts:
-        results_dict_list.append(results_dict)
-
-    # Turn all results dictionaries into a single data frame:
-    df = pd.DataFrame(results_dict_list)
+    # Create every combination of age/sex/mrs for the selected
+    # age range and model type and look them all up at once in the
+    # precomputed grid. This gives the same results as running
+    # main_calculations() from "2_Interactive_demo.py" separately for
+    # each patient. The results are kept between reruns.
+    results = results_cache.run_sweep(
+        age_min, age_max, age_step, model_input_str)
+    # The results with one value per patient:
+    df = results.scalars
 
     # ###################################
     # ######### DISPLAY RESULTS #########
     # ###################################
 
-    st.markdown('## Results')
+    st.markdown(
+        '''
+        ## Results
+
+        The results with one value per patient. The results for each
+        year, such as survival and QALYs by year, are in a separate
+        download with one row per patient per year.
+        '''
+        )
     # Display on Streamlit:
     st.dataframe(df)
+    # The files are only made when a button is clicked:
+    for content, content_label in [
+            ('results', 'these results'),
+            ('by_year', 'the results by year')
+            ]:
+        cols_download = st.columns(len(downloads.export_formats))
+        for col, (export_format, export_dict) in zip(
+                cols_download, downloads.export_formats.items()):
+            with col:
+                st.download_button(
+                    f'Download {content_label} as {export_dict["label"]}',
+                    downloads.make_sweep_export(
+                        age_min, age_max, age_step, model_input_str,
+                        export_format, content
+                        ),
+                    file_name=(
+                        f'lifetime_outcomes_{content}' +
+                        export_dict['extension']
+                        ),
+                    mime=export_dict['mime']
+                )
+
+    st.markdown(
+        '''
+        ## Change in outcome
+
+        For each patient, the change in results when the outcome
+        changes from a worse mRS score (mrs_from) to a better one
+        (mrs_to). A negative change in cost is a saving.
+        '''
+        )
+    # Find every change in outcome for every patient at once:
+    df_change = calc.build_change_in_outcome_dataframe(
+        df,
+        ['qalys_total', 'total_discounted_cost', 'net_benefit'],
+        len(mrs_to_run)
+        )
+    # Display on Streamlit:
+    st.dataframe(df_change)
     st.download_button(
-        'Download these results as .csv',
-        df.to_csv(),
-        file_name='lifetime_outcomes_results.csv'
+        'Download these changes in outcome as .csv',
+        functools.partial(downloads.encode_csv, df_change),
+        file_name='lifetime_outcomes_change_in_outcome.csv'
     )
 
+    st.markdown(
+        '''
+        ## Change in mRS distribution
+
+        For each patient, the expected change in results when the
+        proportion of patients with each mRS score changes from the
+        control group to the treatment group, e.g. from the results
+        of a trial. For the dichotomous model, mRS 0 to 2 use the
+        independent results and mRS 3 to 5 use the dependent results.
+        '''
+        )
+    cols_shift = st.columns(2)
+    with cols_shift[0]:
+        control_str = st.text_input(
+            'Control group (%) for mRS 0 to 5, separated by commas:',
+            value='10, 15, 15, 20, 20, 20',
+            help='The six values should add up to 100.'
+            )
+    with cols_shift[1]:
+        treatment_str = st.text_input(
+            'Treatment group (%) for mRS 0 to 5, separated by commas:',
+            value='15, 17, 16, 19, 17, 16',
+            help='The six values should add up to 100.'
+            )
+    try:
+        control = [float(p) / 100.0 for p in control_str.split(',')
+                   if len(p.strip()) > 0]
+        treatment = [float(p) / 100.0 for p in treatment_str.split(',')
+                     if len(p.strip()) > 0]
+        # Find the changes for every patient at once:
+        df_shift = distribution_shift.shift_dataframe(
+            df, len(mrs_to_run), control, treatment).drop(columns='scenario')
+    except ValueError:
+        st.warning(
+            '''
+            :warning: Enter six numbers for each group that are not
+            negative and add up to 100, separated by commas.
+            '''
+            )
+    else:
+        # Display on Streamlit:
+        st.dataframe(df_shift)
+        st.download_button(
+            'Download these changes in mRS distribution as .csv',
+            functools.partial(downloads.encode_csv, df_shift),
+            file_name='lifetime_outcomes_change_in_mrs_distribution.csv'
+        )
+
+    st.markdown(
+        '''
+        ## Survival percentiles
+
+        For each patient, the time when the probability of death
+        reaches each chosen percentile. For example, the 50th percentile
+        is the median survival time.
+        '''
+        )
+    percentiles_str = st.text_input(
+        'Percentiles (%), separated by commas:',
+        value='10, 25, 50, 75, 90',
+        help='Each value ranges from 0 to 100.'
+        )
+    try:
+        percentiles = [float(p) for p in percentiles_str.split(',')
+                       if len(p.strip()) > 0]
+    except ValueError:
+        percentiles = []
+    if (len(percentiles) == 0 or
+            any([(p < 0.0) | (p > 100.0) for p in percentiles])):
+        st.warning(
+            '''
+            :warning: Enter numbers from 0 to 100 separated by commas.
+            '''
+            )
+    else:
+        # Find every percentile for every patient at once:
+        df_percentiles = results.survival_percentiles_dataframe(
+            percentiles, fixed_params['gz_gamma'])
+        # Display on Streamlit:
+        st.dataframe(df_percentiles)
+        st.download_button(
+            'Download these survival percentiles as .csv',
+            functools.partial(downloads.encode_csv, df_percentiles),
+            file_name='lifetime_outcomes_survival_percentiles.csv'
+        )
+
+    st.markdown(
+        '''
+        ## Population burden
+
+        The total and mean results for a whole population of patients.
+        Upload a .csv file with one row per patient, or one row per
+        group of patients with a "weight" column giving how many
+        patients are in each group. Each row needs an age from 45 to
+        90, a sex ("Female" or "Male") and an mRS score from 0 to 5.
+        Any other columns, e.g. region, can be used to split up the
+        results.
+        '''
+        )
+    # Example file for people to copy:
+    df_template = pd.DataFrame(dict(
+        age=[65, 65, 80, 80],
+        sex=['Female', 'Male', 'Female', 'Male'],
+        mrs=[1, 3, 2, 4],
+        weight=[120, 95, 80, 60],
+        region=['North', 'North', 'South', 'South'],
+        ))
+    population_file = st.file_uploader(
+        'Population (.csv):', type='csv', key='population_file')
+    population = None
+    if population_file is None:
+        st.download_button(
+            'Download an example population as .csv',
+            functools.partial(downloads.encode_csv, df_template),
+            file_name='lifetime_outcomes_population_example.csv'
+        )
+    else:
+        try:
+            population = pd.read_csv(population_file)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError,
+                UnicodeDecodeError):
+            st.warning(
+                '''
+                :warning: The file couldn't be read. Upload a .csv file
+                with columns age, sex and mrs.
+                '''
+                )
+    if population is not None:
+        strata_options = [
+            *population_lifetime.input_strata,
+            *[c for c in population.columns
+              if c not in ['age', 'sex', 'mrs', 'weight']]
+            ]
+        strata = st.multiselect(
+            'Split the results by:',
+            options=strata_options,
+            default=['sex_label', 'mrs']
+            )
+        try:
+            # Look up each distinct patient once and add them up:
+            burden = population_lifetime.population_burden(
+                population, model_input_str, strata)
+        except ValueError as e:
+            st.warning(f':warning: {e}')
+        else:
+            st.write(
+                f'{burden["n_rows"]} rows with ' +
+                f'{burden["n_inputs"]} different patients.'
+                )
+            # Display on Streamlit:
+            st.dataframe(burden['totals'])
+            st.dataframe(burden['strata'])
+            st.download_button(
+                'Download this population burden as .csv',
+                functools.partial(downloads.encode_csv, burden['strata']),
+                file_name='lifetime_outcomes_population_burden.csv'
+            )
+
     st.markdown(
         '''
         ## Fixed parameters
@@ -0,0 +1,498 @@
+"""
+A small JSON HTTP API for the lifetime model.
+
+Other programs can get the same results as the app without going
+through Streamlit. The server only uses the standard library (asyncio
+streams) and is meant to run locally or behind a proxy.
+
+Endpoints:
+    GET  /health
+        {"status": "ok"}
+    GET  /patient?age=72&sex=1&mrs=2&model=mRS&fields=qalys_total
+        Results for one patient. sex is 0 for female and 1 for male.
+        model and fields are optional. The results come from
+        results_cache.run_all_mrs(), the same cache as the Interactive
+        demo, so repeated patients are answered from memory and
+        patients that arrive together are looked up in one batch by
+        the model service (model_service.py).
+    POST /batch
+        {"model": "mRS", "fields": ["qalys_total"],
+         "patients": [{"age": 72, "sex": 1, "mrs": 2}, ...]}
+        Results for many patients, looked up all at once in the
+        precomputed grid (results_grid.py) in the order given.
+    GET  /metrics
+        Hit and miss counters of the results cache and the model
+        service metrics.
+
+fields can be any column of the results, including the values by
+year, which come back as lists. Missing values are null. Responses
+are gzipped if the client sends "Accept-Encoding: gzip" and the
+response is bigger than gzip_min_bytes.
+
+Run from the top of the repository:
+    python -m utilities_lifetime.api --port 8502
+    curl "http://127.0.0.1:8502/patient?age=72&sex=1&mrs=2"
+"""
+# Imports:
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import math
+import sys
+import time
+import urllib.parse
+
+import numpy as np
+
+# Which mRS scores to run for each model type:
+import utilities_lifetime.cohort as cohort
+# Batches the lookups of requests that arrive at the same time:
+import utilities_lifetime.model_service as model_service
+# The same results cache as the app:
+import utilities_lifetime.results_cache as results_cache
+# Precomputed results for every patient:
+import utilities_lifetime.results_grid as results_grid
+# The column names of the results:
+import utilities_lifetime.batch_calculations as batch_calc
+
+logger = logging.getLogger(__name__)
+
+default_host = '127.0.0.1'
+# The Streamlit app uses 8501 by default:
+default_port = 8502
+# Largest request body to accept:
+max_body_bytes = 16 * 1024 * 1024
+# Most patients in one /batch request:
+max_batch_patients = 100000
+# Only gzip responses bigger than this:
+gzip_min_bytes = 1024
+# Close idle connections after this long:
+keep_alive_timeout_s = 15.0
+# Results returned when no fields are given:
+default_fields = [
+    'survival_median_years',
+    'life_expectancy',
+    'qalys_total',
+    'ae_discounted_cost',
+    'nel_discounted_cost',
+    'el_discounted_cost',
+    'care_years_discounted_cost',
+    'total_discounted_cost',
+    'net_benefit',
+]
+status_reasons = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+# #####################################################################
+# ############################## Inputs ###############################
+# #####################################################################
+
+def parse_model(value):
+    """
+    Check the model type.
+
+    Inputs:
+    -------
+    value - str or None. "mRS" or "Dichotomous". None means "mRS".
+
+    Returns:
+    --------
+    model_input_str - str. The model type.
+    """
+    model_input_str = 'mRS' if value is None else value
+    if model_input_str not in results_grid.grid_model_types:
+        raise ValueError(
+            'model must be one of: ' +
+            ', '.join(results_grid.grid_model_types))
+    return model_input_str
+
+
+def parse_fields(value):
+    """
+    Check the requested result columns.
+
+    Inputs:
+    -------
+    value - str, list or None. Column names, either as a list or as
+            one comma-separated string. None means default_fields.
+
+    Returns:
+    --------
+    fields - list. The column names.
+    """
+    if value is None:
+        return default_fields
+    if isinstance(value, str):
+        fields = value.split(',')
+    elif isinstance(value, list):
+        fields = value
+    else:
+        raise ValueError(
+            'fields must be a list or a comma-separated string')
+    unknown = [f for f in fields if f not in batch_calc.results_columns]
+    if len(fields) == 0 or len(unknown) > 0:
+        raise ValueError(f'Unknown fields: {", ".join(map(str, unknown))}')
+    return fields
+
+
+def parse_patient(values: dict):
+    """
+    Check one patient's details.
+
+    Inputs:
+    -------
+    values - dict. Contains age, sex and mrs as numbers or strings.
+
+    Returns:
+    --------
+    age - float. Between the youngest and oldest ages in the app.
+    sex - int. 0 for female and 1 for male.
+    mrs - int. From 0 to 5.
+    """
+    try:
+        age = float(values['age'])
+        sex = float(values['sex'])
+        mrs = float(values['mrs'])
+    except KeyError as error:
+        raise ValueError(f'Missing {error.args[0]}')
+    except (TypeError, ValueError):
+        raise ValueError('age, sex and mrs must be numbers')
+    # Don't round values like 1.9 to the nearest code:
+    if not (sex.is_integer() and mrs.is_integer()):
+        raise ValueError('sex and mrs must be whole numbers')
+    sex = int(sex)
+    mrs = int(mrs)
+    if not (results_grid.grid_age_min <= age <= results_grid.grid_age_max):
+        raise ValueError(
+            f'age must be from {results_grid.grid_age_min:g} ' +
+            f'to {results_grid.grid_age_max:g}')
+    if sex not in results_grid.grid_sexes:
+        raise ValueError('sex must be 0 (female) or 1 (male)')
+    if mrs not in results_grid.grid_mrs:
+        raise ValueError('mrs must be from 0 to 5')
+    return age, sex, mrs
+
+
+# #####################################################################
+# ############################# Endpoints #############################
+# #####################################################################
+
+def json_values(values):
+    """
+    Make a list of results safe for JSON.
+
+    Inputs:
+    -------
+    values - list. Numbers or arrays (for results by year).
+
+    Returns:
+    --------
+    list. NaN and infinite numbers are None and arrays are lists.
+    """
+    cleaned = []
+    for value in values:
+        if isinstance(value, np.ndarray):
+            value = json_values(value.tolist())
+        elif isinstance(value, float) and not math.isfinite(value):
+            value = None
+        cleaned.append(value)
+    return cleaned
+
+
+def table_records(table, fields: list):
+    """
+    Pick out results from a ResultsTable for each patient.
+
+    Inputs:
+    -------
+    table  - ResultsTable. The results.
+    fields - list. Column names to include.
+
+    Returns:
+    --------
+    records - list. One dict per patient with the fields as keys.
+    """
+    columns = []
+    for field in fields:
+        if field in table.scalar_arrays:
+            values = table.scalar_arrays[field].tolist()
+        else:
+            values = [table.row_value(i, field) for i in range(len(table))]
+        columns.append(json_values(values))
+    return [dict(zip(fields, row)) for row in zip(*columns)]
+
+
+def get_health(query: dict, body: bytes):
+    """GET /health. Whether the server is up."""
+    return dict(status='ok')
+
+
+def get_patient(query: dict, body: bytes):
+    """
+    GET /patient. Results for one patient.
+
+    Inputs:
+    -------
+    query - dict. The URL parameters age, sex, mrs, model and fields.
+    body  - bytes. Not used.
+
+    Returns:
+    --------
+    dict. The patient details and the results for them.
+    """
+    age, sex, mrs = parse_patient(query)
+    model_input_str = parse_model(query.get('model'))
+    fields = parse_fields(query.get('fields'))
+
+    mrs_to_run = tuple(cohort.mrs_to_run_for_model(model_input_str))
+    # The dichotomous model only runs one mRS score for each outcome
+    # and mRS 0 to 2 (and 3 to 5) share the same results:
+    mrs_row = mrs if mrs in mrs_to_run else (0 if mrs <= 2 else 5)
+    results = results_cache.run_all_mrs(
+        age, sex, mrs_to_run, model_input_str)[0]
+    record = table_records(results, fields)[mrs_to_run.index(mrs_row)]
+    return dict(
+        patient=dict(age=age, sex=sex, mrs=mrs, model=model_input_str),
+        results=record,
+        )
+
+
+def post_batch(query: dict, body: bytes):
+    """
+    POST /batch. Results for many patients.
+
+    Inputs:
+    -------
+    query - dict. Not used.
+    body  - bytes. JSON with "patients" and optionally "model" and
+            "fields".
+
+    Returns:
+    --------
+    dict. The model type and a list of results in the same order as
+    the patients.
+    """
+    try:
+        request = json.loads(body)
+        patients = request['patients']
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('The body must be JSON with a "patients" list')
+    if not isinstance(patients, list) or len(patients) == 0:
+        raise ValueError('"patients" must be a list of patients')
+    if len(patients) > max_batch_patients:
+        raise ValueError(f'At most {max_batch_patients} patients per batch')
+    model_input_str = parse_model(request.get('model'))
+    fields = parse_fields(request.get('fields'))
+    details = np.array([parse_patient(patient) for patient in patients])
+
+    results = results_grid.lookup_table(
+        details[:, 0],
+        details[:, 1].astype(int),
+        details[:, 2].astype(int),
+        model_input_str
+        )
+    return dict(model=model_input_str, results=table_records(results, fields))
+
+
+def get_metrics(query: dict, body: bytes):
+    """GET /metrics. Results cache counters and model service metrics."""
+    return dict(
+        results_cache=results_cache.cache_info(),
+        model_service=model_service.metrics(),
+        )
+
+
+routes = {
+    ('GET', '/health'): get_health,
+    ('GET', '/patient'): get_patient,
+    ('POST', '/batch'): post_batch,
+    ('GET', '/metrics'): get_metrics,
+}
+
+
+# #####################################################################
+# ############################### Server ##############################
+# #####################################################################
+
+def make_response(
+        status: int,
+        payload: dict,
+        use_gzip: bool,
+        keep_alive: bool
+        ):
+    """
+    Write a JSON HTTP response.
+
+    Inputs:
+    -------
+    status     - int. HTTP status code.
+    payload    - dict. The response, written as JSON.
+    use_gzip   - bool. Whether the client accepts gzip.
+    keep_alive - bool. Whether to keep the connection open.
+
+    Returns:
+    --------
+    bytes. The whole response including the headers.
+    """
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    headers = [
+        f'HTTP/1.1 {status} {status_reasons[status]}',
+        'Content-Type: application/json',
+        f'Connection: {"keep-alive" if keep_alive else "close"}',
+        ]
+    if use_gzip and len(body) > gzip_min_bytes:
+        body = gzip.compress(body, compresslevel=5)
+        headers += ['Content-Encoding: gzip', 'Vary: Accept-Encoding']
+    headers.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """
+    Read one HTTP request from a connection.
+
+    Inputs:
+    -------
+    reader - asyncio.StreamReader. The connection.
+
+    Returns:
+    --------
+    method  - str. e.g. "GET".
+    target  - str. The path and query string.
+    version - str. e.g. "HTTP/1.1".
+    headers - dict. Lower case names.
+    body    - bytes. Empty if there is no body.
+    Or None if the client closed the connection.
+    """
+    request_line = await asyncio.wait_for(
+        reader.readline(), keep_alive_timeout_s)
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > max_body_bytes:
+        raise OverflowError(length)
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method, target, version, headers, body
+
+
+async def handle_connection(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+        ):
+    """
+    Answer requests on one connection until the client closes it.
+
+    The model lookups run in the event loop's thread pool so that
+    other connections are served in the meantime.
+    """
+    event_loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except OverflowError:
+                writer.write(make_response(
+                    413, dict(error='Request body too big'), False, False))
+                break
+            except (ValueError, asyncio.IncompleteReadError):
+                writer.write(make_response(
+                    400, dict(error='Malformed request'), False, False))
+                break
+            if request is None:
+                break
+            method, target, version, headers, body = request
+            keep_alive = (
+                version == 'HTTP/1.1' and
+                headers.get('connection', '').lower() != 'close')
+            use_gzip = 'gzip' in headers.get('accept-encoding', '')
+
+            url = urllib.parse.urlsplit(target)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            handler = routes.get((method, url.path))
+            start = time.perf_counter()
+            if handler is None:
+                known_path = url.path in [path for _, path in routes]
+                status, payload = (
+                    (405, dict(error='Method not allowed')) if known_path
+                    else (404, dict(error='Not found')))
+            else:
+                try:
+                    payload = await event_loop.run_in_executor(
+                        None, handler, query, body)
+                    status = 200
+                except ValueError as error:
+                    status, payload = 400, dict(error=str(error))
+                except Exception:
+                    logger.exception('Error in %s %s', method, target)
+                    status, payload = 500, dict(error='Internal error')
+            writer.write(make_response(status, payload, use_gzip, keep_alive))
+            await writer.drain()
+            logger.info('%s %s %d %.1fms', method, url.path, status,
+                        (time.perf_counter() - start) * 1000.0)
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = default_host, port: int = default_port):
+    """
+    Run the server until it's stopped.
+
+    Inputs:
+    -------
+    host - str. Address to listen on.
+    port - int. Port to listen on.
+    """
+    # Load the grids before the first request:
+    for model_input_str in results_grid.grid_model_types:
+        results_grid.get_grid(model_input_str)
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f'Serving on http://{host}:{port}', flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    """
+    Run the server from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--host', default=default_host, help='Default: %(default)s.')
+    parser.add_argument(
+        '--port', type=int, default=default_port, help='Default: %(default)s.')
+    parser.add_argument(
+        '--log-requests', action='store_true', help='Log every request.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.log_requests else logging.WARNING,
+        format='%(asctime)s %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
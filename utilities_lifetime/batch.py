@@ -0,0 +1,390 @@
+"""
+Run the lifetime outcomes model for many patients from the command line.
+
+This does the same job as the Advanced options page without the
+browser. The patients are read and calculated in chunks and each
+chunk of results is written straight to the output file, so the
+whole table of results is never held in memory at once.
+
+The patients come from either a file or a range of ages:
+    python -m utilities_lifetime.batch --patients patients.csv \
+        --output results.parquet
+    python -m utilities_lifetime.batch --ages 45 90 0.5 \
+        --model-type Dichotomous --output results.csv
+
+A patients file (.csv or .parquet) needs the columns age (45 to 90),
+sex (0 or "Female", 1 or "Male") and mrs (0 to 5). Each chunk is
+checked before it's calculated and the first problem is reported
+with the rows that it's in. An age range runs every combination of
+age, sex and mRS score in the same order as the Advanced options page.
+
+Only the results with one value per patient are written. The values
+by year (e.g. hazard_by_year) are left out because they would make
+the output around fifty times larger.
+"""
+# Imports:
+import argparse
+import collections
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# The main calculations for many patients at once:
+import utilities_lifetime.batch_calculations as batch_calc
+# Every combination of age, sex and mRS:
+import utilities_lifetime.cohort as cohort
+# Pool of worker processes that already have the fixed parameters:
+import utilities_lifetime.parallel as parallel
+# The same checks of the patient details as for a population:
+import utilities_lifetime.population as population
+# Function to import fixed params for either mRS or dicho model:
+from stroke_lifetime.fixed_params import get_fixed_params
+
+# Columns with one value per patient, in the usual results order:
+scalar_columns = [
+    column for column in batch_calc.results_columns
+    if column not in (
+        batch_calc.columns_by_model_year +
+        batch_calc.columns_by_survival_year
+        )
+    ]
+# Columns that a patients file must have:
+patient_columns = ['age', 'sex', 'mrs']
+
+
+# #####################################################################
+# ############################## Inputs ###############################
+# #####################################################################
+
+def read_patient_chunks(path: str, chunk_size: int):
+    """
+    Read a patients file a chunk at a time.
+
+    Inputs:
+    -------
+    path       - str. Path to a .csv or .parquet file.
+    chunk_size - int. Number of patients in each chunk.
+
+    Returns:
+    --------
+    generator of pd.DataFrame. Up to chunk_size patients each with
+    the columns age, sex and mrs.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        chunks = (
+            batch.to_pandas() for batch in
+            parquet_file.iter_batches(
+                batch_size=chunk_size, columns=patient_columns)
+            )
+    else:
+        chunks = pd.read_csv(
+            path, usecols=patient_columns, chunksize=chunk_size)
+
+    for patient_df in chunks:
+        yield patient_df
+
+
+def check_patient_chunks(chunks):
+    """
+    Check each chunk of patients and put it in a standard form.
+
+    Inputs:
+    -------
+    chunks - iterable of pd.DataFrame. Chunks of patients.
+
+    Returns:
+    --------
+    generator of pd.DataFrame. The same patients with age as float,
+    sex as 0 or 1 and mrs as int. Raises ValueError with the rows of
+    the first chunk that has a problem.
+    """
+    n_rows = 0
+    for patient_df in chunks:
+        try:
+            patient_df = population.prepare_population(patient_df)
+        except ValueError as e:
+            raise ValueError(
+                f'Rows {n_rows + 1} to {n_rows + len(patient_df)} ' +
+                f'of the patients: {e}')
+        n_rows += len(patient_df)
+        yield patient_df[patient_columns]
+
+
+def cohort_chunks(
+        age_min: float,
+        age_max: float,
+        age_step: float,
+        model_input_str: str,
+        chunk_size: int
+        ):
+    """
+    Create every combination of age, sex and mRS a chunk at a time.
+
+    Inputs:
+    -------
+    age_min         - float. Youngest age in years.
+    age_max         - float. Oldest age in years.
+    age_step        - float. Gap between ages in years.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    chunk_size      - int. Roughly the number of patients in each
+                      chunk. Chunks always contain whole ages.
+
+    Returns:
+    --------
+    generator of pd.DataFrame. Patients from build_cohort().
+    """
+    age_range = np.arange(age_min, age_max + 1e-3, age_step)
+    mrs_to_run = cohort.mrs_to_run_for_model(model_input_str)
+    n_per_age = 2 * len(mrs_to_run)
+    ages_per_chunk = max(1, chunk_size // n_per_age)
+    for start in range(0, len(age_range), ages_per_chunk):
+        yield cohort.build_cohort(
+            age_range[start:start + ages_per_chunk], mrs_to_run=mrs_to_run)
+
+
+# #####################################################################
+# ########################### Calculations ############################
+# #####################################################################
+
+def calculate_scalar_results(age, sex, mrs, fixed_params: dict = None):
+    """
+    Calculate the results with one value per patient.
+
+    This can run in a worker process from parallel.get_pool(), in
+    which case the fixed parameters that the worker was started with
+    are used.
+
+    Inputs:
+    -------
+    age          - np.array. Patients' ages in years.
+    sex          - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs          - np.array. Patients' mRS scores from 0 to 5.
+    fixed_params - dict or None. Contains fixed parameters independent
+                   of the model results. If None, use the worker's.
+
+    Returns:
+    --------
+    results - dict. The scalar_columns from calculate_results_arrays().
+    """
+    if fixed_params is None:
+        fixed_params = parallel.worker_fixed_params
+    results = batch_calc.calculate_results_arrays(age, sex, mrs, fixed_params)
+    return {key: results[key] for key in scalar_columns if key in results}
+
+
+def build_scalar_dataframe(results: dict, model_input_str: str):
+    """
+    Convert the scalar results into a DataFrame for writing.
+
+    Inputs:
+    -------
+    results         - dict. Output from calculate_scalar_results().
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+
+    Returns:
+    --------
+    df - pd.DataFrame. One row per patient with the scalar_columns.
+    """
+    n_patients = len(results['age'])
+    mrs = results['mrs']
+    mrs_valid = (mrs >= 0) & (mrs <= 5)
+
+    data = dict(
+        age=results['age'],
+        sex=results['sex'],
+        sex_label=np.where(results['sex'] == 1, 'Male', 'Female'),
+        model_type=np.full(n_patients, model_input_str),
+        mrs=mrs,
+        outcome_type=np.where(
+            mrs_valid, np.where(mrs > 2, 'Dependent', 'Independent'), 'n/a'),
+        )
+    for column in scalar_columns[len(data):]:
+        # Keep every column as floats so that every chunk has the same
+        # column types in the output file.
+        data[column] = np.asarray(results[column], dtype=float)
+
+    df = pd.DataFrame(data, columns=scalar_columns)
+    return df
+
+
+def calculate_chunks(chunks, model_input_str: str, workers: int = 1):
+    """
+    Calculate each chunk of patients, keeping them in order.
+
+    With more than one worker, the chunks are shared out between
+    the processes from parallel.get_pool(), which are sent the fixed
+    parameters once when they start. Only a few chunks per worker are
+    read ahead of the one being written so that memory use doesn't
+    grow with the cohort.
+
+    Inputs:
+    -------
+    chunks          - iterable of pd.DataFrame. Chunks of patients.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    workers         - int. Number of processes to use.
+
+    Returns:
+    --------
+    generator of pd.DataFrame. Results for each chunk in the same
+    order as the input chunks.
+    """
+    fixed_params = get_fixed_params(model_input_str)
+
+    def patient_arrays(patient_df):
+        return (
+            patient_df['age'].to_numpy(dtype=float),
+            patient_df['sex'].to_numpy(dtype=int),
+            patient_df['mrs'].to_numpy(dtype=int),
+            )
+
+    if workers <= 1:
+        for patient_df in chunks:
+            results = calculate_scalar_results(
+                *patient_arrays(patient_df), fixed_params)
+            yield build_scalar_dataframe(results, model_input_str)
+        return
+
+    executor = parallel.get_pool(workers, fixed_params)
+    max_pending = 2 * workers
+    pending = collections.deque()
+    for patient_df in chunks:
+        pending.append(executor.submit(
+            calculate_scalar_results, *patient_arrays(patient_df)))
+        if len(pending) >= max_pending:
+            yield build_scalar_dataframe(
+                pending.popleft().result(), model_input_str)
+    while pending:
+        yield build_scalar_dataframe(
+            pending.popleft().result(), model_input_str)
+
+
+# #####################################################################
+# ############################## Outputs ##############################
+# #####################################################################
+
+def write_chunks(results_chunks, path: str):
+    """
+    Write each chunk of results to the end of a .csv or .parquet file.
+
+    Inputs:
+    -------
+    results_chunks - iterable of pd.DataFrame. Results to write.
+    path           - str. Output file. Parquet if the name ends with
+                     .parquet, otherwise CSV. Overwritten if it exists.
+
+    Returns:
+    --------
+    n_patients - int. Number of patients written.
+    """
+    n_patients = 0
+    if path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in results_chunks:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                n_patients += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for df in results_chunks:
+            df.to_csv(
+                path,
+                mode='w' if n_patients == 0 else 'a',
+                header=(n_patients == 0),
+                index=False
+                )
+            n_patients += len(df)
+    return n_patients
+
+
+# #####################################################################
+# ########################### Command line ############################
+# #####################################################################
+
+def main(argv=None):
+    """
+    Run the batch calculations from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 0 if everything worked.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m utilities_lifetime.batch',
+        description='Run the lifetime outcomes model for many patients.'
+        )
+    patients = parser.add_mutually_exclusive_group(required=True)
+    patients.add_argument(
+        '--patients', metavar='FILE',
+        help='A .csv or .parquet file with columns age, sex and mrs.')
+    patients.add_argument(
+        '--ages', nargs=3, type=float, metavar=('MIN', 'MAX', 'STEP'),
+        help='Run every age, sex and mRS for this range of ages.')
+    parser.add_argument(
+        '--output', required=True, metavar='FILE',
+        help='Results file, .parquet or .csv.')
+    parser.add_argument(
+        '--model-type', choices=['mRS', 'Dichotomous'], default='mRS',
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--chunk-size', type=int, default=10000,
+        help='Patients per chunk. Default: %(default)s.')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Number of processes. Default: %(default)s.')
+    args = parser.parse_args(argv)
+
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1.')
+    if args.patients is not None and not os.path.exists(args.patients):
+        parser.error(f'Patients file not found: {args.patients}')
+    if args.ages is not None:
+        age_min, age_max, age_step = args.ages
+        if age_step <= 0.0:
+            parser.error('The age STEP must be more than zero.')
+        if age_max < age_min:
+            parser.error('The age MAX must be at least the age MIN.')
+
+    if args.patients is not None:
+        chunks = read_patient_chunks(args.patients, args.chunk_size)
+    else:
+        chunks = cohort_chunks(
+            *args.ages, args.model_type, args.chunk_size)
+
+    start = time.perf_counter()
+    try:
+        n_patients = write_chunks(
+            calculate_chunks(
+                check_patient_chunks(chunks), args.model_type, args.workers),
+            args.output
+            )
+    except ValueError as e:
+        # Don't leave half of the results behind:
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        parser.error(str(e))
+    print(
+        f'Wrote {n_patients} patients to {args.output} in ' +
+        f'{time.perf_counter() - start:.1f}s',
+        file=sys.stderr
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1065 @@
+"""
+Batch version of the main calculations.
+
+The function main_calculations_batch() runs the same model as
+main_calculations() in the stroke-lifetime package, but for a whole
+cohort of patients at once. Instead of looping over patients, every
+quantity is stored in a NumPy array with one row per patient (and one
+column per year for the quantities that change with time), so the
+cohort is calculated in a handful of array operations.
+
+The elementwise model functions from stroke_lifetime.models are
+reused directly. The functions that contain if/else branches or loops
+over years are rewritten here with np.where() and loops over the
+year columns, keeping the same order of operations as the originals
+so that the results match the per-patient calculations.
+
+Any of the fixed parameters may carry an extra leading axis with one
+value (or one set of coefficients) per patient. This is not needed
+for the app, where every patient shares the same parameters, but it
+lets sampled parameter sets run through the same code.
+"""
+# Imports:
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# Import the elementwise functions for calculating various quantities:
+import stroke_lifetime.models as model
+
+
+# Columns of the results DataFrame in the same order as the keys of
+# the results dictionary from main_calculations():
+results_columns = [
+    'age', 'sex', 'sex_label', 'model_type', 'mrs', 'outcome_type',
+    'death_in_year_1_lp', 'death_in_year_1_prob', 'death_in_year_n_lp',
+    'years', 'hazard_by_year', 'survival_by_year', 'fhazard_by_year',
+    'death_in_year_n_probs', 'death_in_year_n_probs_first_invalid_index',
+    'survival_median_years', 'survival_lower_quartile_years',
+    'survival_upper_quartile_years', 'life_expectancy',
+    'year_when_zero_survival',
+    'qalys_total', 'qalys_by_year', 'raw_qalys_by_year',
+    'ae_lp', 'ae_count', 'ae_counts_by_year', 'ae_discounted_by_year',
+    'ae_discounted_cost',
+    'nel_lp', 'nel_count', 'nel_counts_by_year', 'nel_discounted_by_year',
+    'nel_discounted_cost',
+    'el_lp', 'el_count', 'el_counts_by_year', 'el_discounted_by_year',
+    'el_discounted_cost',
+    'care_years', 'care_years_by_year', 'care_years_discounted_by_year',
+    'care_years_discounted_cost',
+    'total_discounted_cost',
+    'net_benefit',
+]
+
+# Columns that contain one value per year from year 0 (or year 1 for
+# the probability of death in each year) up to the maximum year:
+columns_by_model_year = [
+    'years',
+    'hazard_by_year',
+    'survival_by_year',
+    'fhazard_by_year',
+    'death_in_year_n_probs',
+]
+
+# Columns that contain one value per year up until the median survival
+# year (rounded up), so a different number of years for each patient:
+columns_by_survival_year = [
+    'qalys_by_year',
+    'raw_qalys_by_year',
+    'ae_counts_by_year',
+    'ae_discounted_by_year',
+    'nel_counts_by_year',
+    'nel_discounted_by_year',
+    'el_counts_by_year',
+    'el_discounted_by_year',
+    'care_years_by_year',
+    'care_years_discounted_by_year',
+]
+
+
+# #####################################################################
+# ######################## Overall function ###########################
+# #####################################################################
+
+def main_calculations_batch(
+        age,
+        sex,
+        mrs,
+        fixed_params: dict,
+        model_type_str: str,
+        sex_label=None
+        ):
+    """
+    Calculates everything useful for lifetime outcomes for a cohort.
+
+    The returned DataFrame has the same columns as a DataFrame made
+    from a list of results dictionaries from main_calculations(),
+    with one row per patient in the same order as the inputs.
+
+    Inputs:
+    -------
+    age            - float or array. Patients' ages in years.
+    sex            - int or array. Patients' sex, 0 for female and
+                     1 for male.
+    mrs            - int or array. Patients' mRS scores from 0 to 5.
+    fixed_params   - dict. Contains fixed parameters independent
+                     of the model results.
+    model_type_str - str. Separate "mRS" or "Dichotomous" model.
+    sex_label      - str or array. Either "Male" or "Female". If this
+                     is not given, it is worked out from sex.
+
+    Returns:
+    --------
+    df - pd.DataFrame. All of the useful results, one row per patient.
+    """
+    results = calculate_results_arrays(age, sex, mrs, fixed_params)
+    df = build_results_dataframe(results, model_type_str, sex_label)
+    return df
+
+
+def calculate_results_arrays(age, sex, mrs, fixed_params: dict):
+    """
+    Calculate all of the lifetime outcomes as arrays.
+
+    Inputs:
+    -------
+    age          - float or array. Patients' ages in years.
+    sex          - int or array. Patients' sex, 0 for female and
+                   1 for male.
+    mrs          - int or array. Patients' mRS scores from 0 to 5.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+
+    Returns:
+    --------
+    results - dict. Same keys as the results dictionary from
+              main_calculations() except for the labels. Values are
+              arrays with one row per patient. The quantities by year
+              are 2D arrays padded with NaN after the final year for
+              each patient. Extra key:
+        n_survival_years - np.array. The number of years in each
+                           patient's by-year QALY and resource lists,
+                           i.e. the median survival in years rounded up.
+    """
+    # Copy the broadcast views so the inputs own their memory. numpy
+    # warns when the writeable flag of a broadcast view is used.
+    age, sex, mrs = [np.array(x) for x in np.broadcast_arrays(
+        np.atleast_1d(np.asarray(age, dtype=float)),
+        np.atleast_1d(np.asarray(sex, dtype=int)),
+        np.atleast_1d(np.asarray(mrs, dtype=int))
+        )]
+    # Patients with an mRS outside of 0 to 5 get placeholder results.
+    # Use mRS 0 for them in the calculations and blank them out later.
+    mrs_valid = (mrs >= 0) & (mrs <= 5)
+    mrs_index = np.where(mrs_valid, mrs, 0)
+
+    # Shared for all patients.
+    # Times for hazard with time calculations:
+    # This list contains [0, 1, 2, ..., time_max_post_discharge_year].
+    years = np.arange(
+        0, fixed_params['time_max_post_discharge_year'] + 1, 1)
+
+    # ##### Mortality #####
+    death_in_year_1_lp = find_lpDeath_year1_batch(
+        age,
+        sex,
+        mrs_index,
+        fixed_params['lg_mean_ages'],
+        fixed_params['lg_coeffs']
+        )
+    death_in_year_n_lp = find_lpDeath_yearn_batch(
+        age,
+        sex,
+        mrs_index,
+        fixed_params['gz_mean_age'],
+        fixed_params['gz_coeffs']
+        )
+    death_in_year_1_prob = model.find_pDeath_year1(death_in_year_1_lp)
+
+    gz_gamma = np.asarray(fixed_params['gz_gamma'], dtype=float)
+
+    hazard_by_year, survival_by_year, fhazard_by_year = (
+        find_cumhazard_with_time_batch(
+            years,
+            gz_gamma,
+            death_in_year_1_prob,
+            death_in_year_n_lp
+            ))
+
+    # Find the first year where the calculated probability of death
+    # is invalid. Add one to the index because we start hazard_by_year
+    # from year 0 but death_in_year_n_probs from year 1.
+    invalid = hazard_by_year >= 1.0
+    death_in_year_n_probs_first_invalid_index = np.where(
+        np.any(invalid, axis=1),
+        np.argmax(invalid, axis=1) + 1,
+        np.nan
+        )
+
+    death_in_year_n_probs = calculate_prob_death_per_year_batch(
+        years,
+        gz_gamma,
+        death_in_year_1_prob,
+        death_in_year_n_lp
+        )
+
+    year_when_zero_survival = find_time_for_this_hazard_batch(
+        gz_gamma,
+        death_in_year_1_prob,
+        death_in_year_n_lp,
+        hazard_prob=1.0
+        )
+
+    # Survival times for the median, lower and upper quartiles:
+    survival_times = find_survival_quantiles_batch(
+        [0.5, 0.25, 0.75],
+        death_in_year_1_prob,
+        death_in_year_n_lp,
+        gz_gamma
+        )
+    (survival_median_years,
+     survival_lower_quartile_years,
+     survival_upper_quartile_years) = survival_times
+    life_expectancy = survival_median_years + age
+
+    # ##### QALYs #####
+    qalys, qalys_by_year, raw_qalys_by_year = calculate_qaly_batch(
+        pick_by_mrs(fixed_params['utility_list'], mrs_index),
+        survival_median_years,
+        age,
+        sex,
+        pick_by_mrs(fixed_params['lg_mean_ages'], mrs_index),
+        np.asarray(fixed_params['qaly_age_coeff'], dtype=float),
+        np.asarray(fixed_params['qaly_age2_coeff'], dtype=float),
+        np.asarray(fixed_params['qaly_sex_coeff'], dtype=float),
+        dfq=np.asarray(
+            fixed_params['discount_factor_QALYs_perc'], dtype=float) / 100.0
+        )
+    # Every list by year has one value per year until the median
+    # survival year (rounded up):
+    n_survival_years = np.sum(~np.isnan(qalys_by_year), axis=1)
+
+    # ##### Resource use #####
+    # Linear predictors:
+    age_norm = age - pick_by_mrs(fixed_params['lg_mean_ages'], mrs_index)
+    ae_lp = find_lp_count_batch(
+        age_norm, sex, mrs_index,
+        fixed_params['ae_coeffs'], fixed_params['ae_mRS'])
+    nel_lp = find_lp_count_batch(
+        age_norm, sex, mrs_index,
+        fixed_params['nel_coeffs'], fixed_params['nel_mRS'])
+    el_lp = find_lp_count_batch(
+        age_norm, sex, mrs_index,
+        fixed_params['el_coeffs'], fixed_params['el_mRS'])
+
+    # Fixed parameter for care home usage. Choose which list of care
+    # home percentage rates to use based on the age input.
+    average_care_year = 0.95 * np.where(
+        age > 70,
+        pick_by_mrs(fixed_params['perc_care_home_over70'], mrs_index),
+        pick_by_mrs(fixed_params['perc_care_home_not_over70'], mrs_index)
+        )
+
+    # Resource use across the median survival time in years:
+    ae_coeffs = coeffs_first(fixed_params['ae_coeffs'])
+    nel_coeffs = coeffs_first(fixed_params['nel_coeffs'])
+    el_coeffs = coeffs_first(fixed_params['el_coeffs'])
+    ae_count = model.find_ae_count(ae_lp, ae_coeffs, survival_median_years)
+    nel_count = model.find_nel_count(
+        nel_lp, nel_coeffs, survival_median_years)
+    el_count = model.find_el_count(el_lp, el_coeffs, survival_median_years)
+    care_years = model.find_residential_care_average_time(
+        average_care_year, survival_median_years)
+
+    # Calculate the non-discounted values for each year from year=1
+    # to year=median_survival_year (rounded up).
+    # Add an axis to the patient values so that they line up with
+    # the year columns.
+    def count_by_year(count_function, lp, coeffs):
+        return find_resource_count_for_all_years_batch(
+            survival_median_years,
+            n_survival_years,
+            lambda t: count_function(
+                lp[:, None], coeffs_first(coeffs, n_axes=2), t)
+            )
+    ae_count_by_year = count_by_year(
+        model.find_ae_count, ae_lp, fixed_params['ae_coeffs'])
+    nel_count_by_year = count_by_year(
+        model.find_nel_count, nel_lp, fixed_params['nel_coeffs'])
+    el_count_by_year = count_by_year(
+        model.find_el_count, el_lp, fixed_params['el_coeffs'])
+    care_years_by_year = find_resource_count_for_all_years_batch(
+        survival_median_years,
+        n_survival_years,
+        lambda t: model.find_residential_care_average_time(
+            average_care_year[:, None], t)
+        )
+
+    # Find discounted lists:
+    discount_factor = np.asarray(
+        fixed_params['discount_factor_QALYs_perc'], dtype=float)
+    ae_discounted_by_year = find_discounted_resource_use_for_all_years_batch(
+        ae_count_by_year, discount_factor)
+    nel_discounted_by_year = (
+        find_discounted_resource_use_for_all_years_batch(
+            nel_count_by_year, discount_factor))
+    el_discounted_by_year = find_discounted_resource_use_for_all_years_batch(
+        el_count_by_year, discount_factor)
+    care_years_discounted_by_year = (
+        find_discounted_resource_use_for_all_years_batch(
+            care_years_by_year, discount_factor))
+
+    # Find discounted costs:
+    ae_discounted_cost = (
+        np.asarray(fixed_params['cost_ae_gbp'], dtype=float) *
+        sum_by_year(ae_discounted_by_year)
+        )
+    nel_discounted_cost = (
+        np.asarray(fixed_params['cost_non_elective_bed_day_gbp'],
+                   dtype=float) *
+        sum_by_year(nel_discounted_by_year)
+        )
+    el_discounted_cost = (
+        np.asarray(fixed_params['cost_elective_bed_day_gbp'], dtype=float) *
+        sum_by_year(el_discounted_by_year)
+        )
+    care_years_discounted_cost = (
+        np.asarray(fixed_params['cost_residential_day_gbp'],
+                   dtype=float) * 365 *
+        sum_by_year(care_years_discounted_by_year)
+        )
+    # Sum for total costs:
+    total_discounted_cost = (
+        ae_discounted_cost +
+        nel_discounted_cost +
+        el_discounted_cost +
+        care_years_discounted_cost
+        )
+
+    # ##### COST EFFECTIVENESS #####
+    net_benefit = (
+        np.asarray(fixed_params['wtp_qaly_gpb'], dtype=float) * qalys -
+        total_discounted_cost
+        )
+
+    results = dict(
+        age=age,
+        sex=sex,
+        mrs=mrs,
+        death_in_year_1_lp=death_in_year_1_lp,
+        death_in_year_1_prob=death_in_year_1_prob,
+        death_in_year_n_lp=death_in_year_n_lp,
+        years=np.broadcast_to(years, (len(age), len(years))),
+        hazard_by_year=hazard_by_year,
+        survival_by_year=survival_by_year,
+        fhazard_by_year=fhazard_by_year,
+        death_in_year_n_probs=death_in_year_n_probs,
+        death_in_year_n_probs_first_invalid_index=(
+            death_in_year_n_probs_first_invalid_index),
+        survival_median_years=survival_median_years,
+        survival_lower_quartile_years=survival_lower_quartile_years,
+        survival_upper_quartile_years=survival_upper_quartile_years,
+        life_expectancy=life_expectancy,
+        year_when_zero_survival=year_when_zero_survival,
+        qalys_total=qalys,
+        qalys_by_year=qalys_by_year,
+        raw_qalys_by_year=raw_qalys_by_year,
+        ae_lp=ae_lp,
+        ae_count=ae_count,
+        ae_counts_by_year=ae_count_by_year,
+        ae_discounted_by_year=ae_discounted_by_year,
+        ae_discounted_cost=ae_discounted_cost,
+        nel_lp=nel_lp,
+        nel_count=nel_count,
+        nel_counts_by_year=nel_count_by_year,
+        nel_discounted_by_year=nel_discounted_by_year,
+        nel_discounted_cost=nel_discounted_cost,
+        el_lp=el_lp,
+        el_count=el_count,
+        el_counts_by_year=el_count_by_year,
+        el_discounted_by_year=el_discounted_by_year,
+        el_discounted_cost=el_discounted_cost,
+        care_years=care_years,
+        care_years_by_year=care_years_by_year,
+        care_years_discounted_by_year=care_years_discounted_by_year,
+        care_years_discounted_cost=care_years_discounted_cost,
+        total_discounted_cost=total_discounted_cost,
+        net_benefit=net_benefit,
+        n_survival_years=n_survival_years,
+        )
+
+    if not np.all(mrs_valid):
+        # If mRS is 6 (dead) or other invalid value,
+        # replace the results with placeholder empty data.
+        for key, value in results.items():
+            if key in ['age', 'sex', 'mrs']:
+                continue
+            elif key == 'n_survival_years':
+                results[key] = np.where(mrs_valid, value, 0)
+            else:
+                value = np.array(value, dtype=float)
+                value[~mrs_valid] = np.nan
+                results[key] = value
+    return results
+
+
+def build_results_dataframe(
+        results: dict,
+        model_type_str: str,
+        sex_label=None
+        ):
+    """
+    Convert the results arrays into the main results DataFrame.
+
+    Each of the by-year quantities is stored in the DataFrame as one
+    array per patient in the same way as the results of
+    main_calculations(), and the lists that stop at the median survival
+    year are cut down to the right length for each patient.
+
+    Inputs:
+    -------
+    results        - dict. Output from calculate_results_arrays().
+    model_type_str - str. Separate "mRS" or "Dichotomous" model.
+    sex_label      - str or array. Either "Male" or "Female". If this
+                     is not given, it is worked out from sex.
+
+    Returns:
+    --------
+    df - pd.DataFrame. All of the useful results, one row per patient.
+    """
+    n_patients = len(results['age'])
+    mrs = results['mrs']
+    mrs_valid = (mrs >= 0) & (mrs <= 5)
+    if sex_label is None:
+        sex_label = np.where(results['sex'] == 1, 'Male', 'Female')
+    # Use the mRS score to label this patient as independent or
+    # dependent in the dichotomous model.
+    outcome_type = np.where(
+        mrs_valid, np.where(mrs > 2, 'Dependent', 'Independent'), 'n/a')
+
+    data = dict(
+        age=results['age'],
+        sex=results['sex'],
+        sex_label=np.broadcast_to(np.asarray(sex_label), (n_patients,)),
+        model_type=[model_type_str] * n_patients,
+        mrs=mrs,
+        outcome_type=outcome_type,
+        )
+    for column in results_columns[len(data):]:
+        values = results[column]
+        if column in columns_by_model_year:
+            # Placeholder patients get an empty array here.
+            empty = np.array([])
+            values = [
+                row if valid else empty
+                for row, valid in zip(values, mrs_valid)
+                ]
+        elif column in columns_by_survival_year:
+            values = [
+                row[:n] for row, n in
+                zip(values, results['n_survival_years'])
+                ]
+        elif column == 'death_in_year_n_probs_first_invalid_index':
+            # Keep these as integer indices unless there are any
+            # missing values.
+            if not np.any(np.isnan(values)):
+                values = values.astype(int)
+        data[column] = values
+
+    df = pd.DataFrame(data, columns=results_columns)
+    return df
+
+
+# #####################################################################
+# ############################## Helpers ##############################
+# #####################################################################
+
+def fixed_params_checksum(fixed_params: dict):
+    """
+    Make a short fingerprint of the fixed parameters.
+
+    Inputs:
+    -------
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+
+    Returns:
+    --------
+    str. Hex digest that changes when any parameter value changes.
+    """
+    values = {
+        key: np.asarray(value).tolist()
+        for key, value in sorted(fixed_params.items())
+        }
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def pick_by_mrs(values, mrs_index):
+    """
+    Pick out one value per patient from a list with one value per mRS.
+
+    Inputs:
+    -------
+    values    - list or array. One value for each mRS score, or a
+                2D array with one row of values for each patient.
+    mrs_index - np.array. The mRS score of each patient.
+
+    Returns:
+    --------
+    np.array. One value for each patient.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        return values[mrs_index]
+    else:
+        return np.take_along_axis(values, mrs_index[:, None], axis=1)[:, 0]
+
+
+def coeffs_first(coeffs, n_axes=1):
+    """
+    Move the coefficient axis first so coeffs[i] works for all shapes.
+
+    The model functions pick out coefficients with coeffs[i]. When
+    there is one set of coefficients per patient, the input array has
+    shape (patients, coefficients). This is rearranged so that
+    coeffs[i] gives one value per patient, with extra axes added so
+    that the values line up with any other axes (e.g. years).
+
+    Inputs:
+    -------
+    coeffs - list or array. Coefficients for one model.
+    n_axes - int. The number of axes of the arrays that the
+             coefficients will be combined with.
+
+    Returns:
+    --------
+    np.array. The rearranged coefficients.
+    """
+    coeffs = np.asarray(coeffs, dtype=float)
+    if coeffs.ndim == 1:
+        return coeffs
+    else:
+        return coeffs.T.reshape(coeffs.shape[1], -1, *[1] * (n_axes - 1))
+
+
+def sum_by_year(values_by_year):
+    """
+    Sum a padded array of values by year for each patient.
+
+    The sum runs in order through the years so that the result for
+    each patient does not depend on how much padding is on the end.
+
+    Inputs:
+    -------
+    values_by_year - np.array. One row per patient and one column
+                     per year. Padding values are NaN.
+
+    Returns:
+    --------
+    np.array. One total for each patient.
+    """
+    if values_by_year.shape[1] == 0:
+        return np.zeros(len(values_by_year))
+    values = np.where(np.isnan(values_by_year), 0.0, values_by_year)
+    return np.cumsum(values, axis=1)[:, -1]
+
+
+# #####################################################################
+# ############################ Mortality ##############################
+# #####################################################################
+
+def find_lpDeath_year1_batch(age, sex, mrs_index, lg_mean_ages, lg_coeffs):
+    """
+    Calculate the linear predictor (lp) for death during year 1.
+
+    This linear predictor is for the logistic (lg) model.
+
+    Inputs:
+    -------
+    age          - np.array. Patients' ages.
+    sex          - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs_index    - np.array. Patients' mRS scores from 0 to 5.
+    lg_mean_ages - list or np.array. Mean age coefficients for the
+                   logistic model.
+    lg_coeffs    - np.array. Other coefficients for the logistic model.
+
+    Returns:
+    --------
+    np.array. The value of the linear predictor for each patient.
+    """
+    lg_coeffs = coeffs_first(lg_coeffs)
+    lp = (
+        lg_coeffs[0] +
+        lg_coeffs[1] * (age - pick_by_mrs(lg_mean_ages, mrs_index)) +
+        lg_coeffs[2] * sex +
+        pick_by_mrs(np.moveaxis(lg_coeffs[3:9], 0, -1), mrs_index)
+    )
+    return lp
+
+
+def find_lpDeath_yearn_batch(age, sex, mrs_index, gz_mean_age, gz_coeffs):
+    """
+    Calculate the linear predictor (lp) for death after year 1.
+
+    This linear predictor is for the Gompertz (gz) model.
+
+    Inputs:
+    -------
+    age          - np.array. Patients' ages.
+    sex          - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs_index    - np.array. Patients' mRS scores from 0 to 5.
+    gz_mean_age  - float. Mean age coefficients for the
+                   Gompertz model.
+    gz_coeffs    - np.array. Other coefficients for the Gompertz model.
+
+    Returns:
+    --------
+    np.array. The value of the linear predictor for each patient.
+    """
+    gz_coeffs = coeffs_first(gz_coeffs)
+    gz_mean_age = np.asarray(gz_mean_age, dtype=float)
+    age_adjusted = age - gz_mean_age
+    lp = (
+        gz_coeffs[0] +
+        gz_coeffs[1] * age_adjusted +
+        gz_coeffs[2] * ((age**2.0) - gz_mean_age**2.0) +
+        gz_coeffs[3] * sex +
+        pick_by_mrs(np.moveaxis(gz_coeffs[4:10], 0, -1), mrs_index) *
+        age_adjusted +
+        pick_by_mrs(np.moveaxis(gz_coeffs[10:16], 0, -1), mrs_index)
+    )
+    return lp
+
+
+def find_cumhazard_with_time_batch(
+        years,
+        gz_gamma,
+        death_in_year_1_prob,
+        death_in_year_n_lp
+        ):
+    """
+    For each year, find the cumulative probability of death and the
+    survival percentage.
+
+    Inputs:
+    -------
+    years                - array. List of integer years from 0.
+    gz_gamma             - float or np.array. Gompertz gamma coefficient.
+    death_in_year_1_prob - np.array. Probability of death in year 1.
+    death_in_year_n_lp   - np.array. Linear predictor for probability
+                           of death after year 1.
+
+    Returns:
+    --------
+    death_in_year_n_probs - np.array. Cumulative probability of death
+                            in each year. One row per patient.
+    survival_by_year      - np.array. Survival for each year.
+    hazard_by_year        - np.array. Gompertz cumulative hazard for
+                            each year. Years 0 and 1 are set to zero.
+    """
+    hazard, cum_prob_death = model.find_FDeath_yearn(
+        years,
+        np.asarray(gz_gamma)[..., None],
+        death_in_year_1_prob[:, None],
+        death_in_year_n_lp[:, None]
+        )
+    # The Gompertz values only apply after year one.
+    hazard_by_year = hazard.copy()
+    hazard_by_year[:, :2] = 0.0
+    # Start with prob in year 0, which is zero, and then the
+    # probability of death in year 1:
+    death_in_year_n_probs = cum_prob_death.copy()
+    death_in_year_n_probs[:, 0] = 0.0
+    death_in_year_n_probs[:, 1] = death_in_year_1_prob
+    # Manual override if the value is too big:
+    death_in_year_n_probs = np.where(
+        death_in_year_n_probs > 1.0, 1.0, death_in_year_n_probs)
+
+    # Convert to survival:
+    survival_by_year = 1.0 - death_in_year_n_probs
+
+    return death_in_year_n_probs, survival_by_year, hazard_by_year
+
+
+def calculate_prob_death_per_year_batch(
+        years,
+        gz_gamma,
+        death_in_year_1_prob,
+        death_in_year_n_lp
+        ):
+    """
+    Calculate the probability of death during each year.
+
+    Inputs:
+    -------
+    years                - array. List of integer years from 0.
+    gz_gamma             - float or np.array. Gompertz gamma coefficient.
+    death_in_year_1_prob - np.array. Probability of death in year 1.
+    death_in_year_n_lp   - np.array. Linear predictor for probability
+                           of death after year 1.
+
+    Returns:
+    --------
+    death_in_year_n_probs - np.array. Probability of death during
+                            each year from year 1. One row per patient.
+    """
+    # Cumulative probability of death by each year without the
+    # manual override for values over 1:
+    hazard, cum_prob_death = model.find_FDeath_yearn(
+        years,
+        np.asarray(gz_gamma)[..., None],
+        death_in_year_1_prob[:, None],
+        death_in_year_n_lp[:, None]
+        )
+    # Year 2 is combined with the probability of death in year 1:
+    cum_prob_death[:, 1] = death_in_year_1_prob
+    death_in_year_n_probs = np.empty(
+        (len(death_in_year_1_prob), len(years) - 1))
+    death_in_year_n_probs[:, 0] = death_in_year_1_prob
+    death_in_year_n_probs[:, 1:] = (
+        1.0 - np.exp(cum_prob_death[:, 1:-1] - cum_prob_death[:, 2:]))
+    return death_in_year_n_probs
+
+
+def find_time_for_this_hazard_batch(
+        gz_gamma,
+        p_death_year1,
+        lp_yearn,
+        hazard_prob=1.0
+        ):
+    """
+    Find the time when hazard reaches some value.
+
+    Use this to find when survival first reaches zero.
+
+    Inputs:
+    -------
+    gz_gamma      - float or np.array. Gompertz gamma coefficient.
+    p_death_year1 - np.array. Probability of death in year 1.
+    lp_yearn      - np.array. Linear predictor for probability of death
+                    after year 1.
+    hazard_prob   - float. Chosen hazard value.
+                    Survival is zero when this prob is 1.0.
+
+    Returns:
+    --------
+    years_to_hazard - np.array. Years from discharge until the input
+                      probability of death is reached.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Invert the pDeath_yearn formula to get time:
+        x = (gz_gamma * hazard_prob * np.exp(-lp_yearn)) + 1.0
+        days = np.log(x) / gz_gamma
+        years_gompertz = (days/365) + 1
+        # Use the year one probability if it is already too large:
+        years_year1 = (
+            np.log(hazard_prob) /
+            (np.log(1.0 - p_death_year1)/365.0)
+            / 365.0
+        )
+    years_to_hazard = np.where(
+        p_death_year1 < hazard_prob, years_gompertz, years_year1)
+    return years_to_hazard
+
+
+def find_survival_time_for_pDeath_batch(
+        pDeath,
+        pDeath_year1,
+        lpDeath_yearn,
+        gz_gamma
+        ):
+    """
+    Calculate the time when the probability of death = chosen value.
+
+    All inputs are broadcast against each other, so e.g. a column of
+    probabilities and a row of patients gives a grid of survival times
+    with one row per probability and one column per patient.
+
+    Inputs:
+    -------
+    pDeath        - float or np.array. Chosen probability of death.
+                    e.g. for median, use pDeath=0.5.
+    pDeath_year1  - np.array. Probability of death in year 1.
+    lpDeath_yearn - np.array. Linear predictor for death after year 1.
+    gz_gamma      - float or np.array. Gompertz gamma coefficient.
+
+    Returns:
+    --------
+    survival_time  - np.array. The survival time in years.
+    survival_years - np.array. Case 1 survival time.
+    time_log       - np.array. Case 2 survival time.
+    eqperc         - np.array. Adjusted input probability to account
+                     for the chance of death during year one. a.k.a. P`.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # ----- Case 1: -----
+        # Use this if input probability is greater than the probability
+        # of death in year one.
+        eqperc = ((1.0 + pDeath)/(1.0 + pDeath_year1)) - 1.0
+        x = eqperc * gz_gamma / np.exp(lpDeath_yearn)
+        survival_years = np.log(x + 1.0) / (gz_gamma*365.0)
+        # Note: one year added to median survival years as they
+        # survive the first year.
+        survival_years += 1.0
+        survival_years = np.where(eqperc <= 0, -1.0, survival_years)
+
+        # ----- Case 2: -----
+        # Use this if input probability is less than or equal to the
+        # probability of death in year one.
+        time_log_days = (
+            np.log(1.0 - pDeath) /
+            (np.log(1 - pDeath_year1)/365.0)
+        )
+        time_log = time_log_days / 365.0
+
+    # Choose which case to use:
+    survival_time = np.where(survival_years > 1.0, survival_years, time_log)
+    return survival_time, survival_years, time_log, eqperc
+
+
+def find_survival_quantiles_batch(
+        probabilities,
+        pDeath_year1,
+        lpDeath_yearn,
+        gz_gamma
+        ):
+    """
+    Calculate the survival times for many probabilities and patients.
+
+    e.g. probabilities=[0.25, 0.5, 0.75] gives the lower quartile,
+    median and upper quartile survival times for every patient.
+    Uses the Case 1 and Case 2 formulae from
+    find_survival_time_for_pDeath_batch() for all of them at once.
+
+    Inputs:
+    -------
+    probabilities - list or np.array. Chosen probabilities of death
+                    from 0 to 1.
+    pDeath_year1  - float or np.array. Probability of death in year 1
+                    for each patient.
+    lpDeath_yearn - float or np.array. Linear predictor for death after
+                    year 1 for each patient.
+    gz_gamma      - float or np.array. Gompertz gamma coefficient.
+
+    Returns:
+    --------
+    survival_times - np.array. The survival times in years with one
+                     row per probability and one column per patient.
+    """
+    probabilities = np.asarray(probabilities, dtype=float).reshape(-1, 1)
+    survival_times, _, _, _ = find_survival_time_for_pDeath_batch(
+        probabilities,
+        np.atleast_1d(pDeath_year1),
+        np.atleast_1d(lpDeath_yearn),
+        gz_gamma
+        )
+    return survival_times
+
+
+# #####################################################################
+# ############################## QALYs ################################
+# #####################################################################
+
+def calculate_qaly_batch(
+        util,
+        med_survival_years,
+        age,
+        sex,
+        average_age,
+        qaly_age_coeff,
+        qaly_age2_coeff,
+        qaly_sex_coeff,
+        dfq=0.035
+        ):
+    """
+    Calculate the number of QALYs up until the median survival time.
+
+    Inputs:
+    -------
+    util               - np.array. Utility for each patient's mRS score.
+    med_survival_years - np.array. Median survival time in years.
+    age                - np.array. Patients' ages in years.
+    sex                - np.array. 0 for female, 1 for male.
+    average_age        - np.array. Average age coefficient.
+    qaly_age_coeff     - float or np.array. QALY age coefficient.
+    qaly_age2_coeff    - float or np.array. QALY age^2 coefficient.
+    qaly_sex_coeff     - float or np.array. QALY sex coefficient.
+    dfq                - float or np.array. Discount Factor QALYs,
+                         e.g. 3.5%.
+
+    Returns:
+    --------
+    total_qaly       - np.array. Calculated number of QALYs.
+    qaly_by_year     - np.array. The discounted QALY for each year.
+    qaly_raw_by_year - np.array. The raw QALY for each year.
+    """
+    # Line up the patient values with the year columns:
+    def col(x):
+        return np.asarray(x)[..., None]
+    med = col(med_survival_years)
+    age = col(age)
+
+    # One column for each year up to the longest median survival:
+    n_years = int(np.nanmax(np.ceil(med_survival_years), initial=0))
+    year = np.arange(0, max(n_years, 0), dtype=float)
+    # Only keep the years in np.arange(0, med_survival_years):
+    alive = year < med
+
+    # Calculate raw QALY
+    raw_qaly = (
+        col(util) -
+        ((age+year) - col(average_age)) * col(qaly_age_coeff) -
+        ((age+year)**2.0 - col(average_age)**2.0) * col(qaly_age2_coeff) +
+        col(sex) * col(qaly_sex_coeff)
+    )
+    raw_qaly = np.where(raw_qaly > 1, 1.0, raw_qaly)
+
+    # Calculate discounted QALY:
+    qaly = raw_qaly * (1.0 + col(dfq))**(-year)
+
+    # Scale down the QALY in the final year to match the amount of
+    # the year that the patient lives during.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        final_year_fraction = np.where(
+            year == 0,
+            # When this condition is reached, med_survival_years
+            # is less than one anyway so just use that value:
+            med,
+            # Find just the digits after the decimal place
+            # of the median survival in years:
+            np.mod(med, np.trunc(med))
+            )
+    scale_factor = np.where(
+        (year + age + 1) < (med + age),
+        # If this is *not* the final year:
+        1.0,
+        np.where(
+            (year + age + 1) < (med + age + 1),
+            # If this *is* the final year:
+            final_year_fraction,
+            # This shouldn't happen.
+            0.0
+            )
+        )
+    # Multiply the discounted QALY by the scale factor:
+    qaly = qaly * scale_factor
+
+    qaly_by_year = np.where(alive, qaly, np.nan)
+    qaly_raw_by_year = np.where(alive, raw_qaly, np.nan)
+    total_qaly = sum_by_year(qaly_by_year)
+    return total_qaly, qaly_by_year, qaly_raw_by_year
+
+
+# #####################################################################
+# ############################ Resources ##############################
+# #####################################################################
+
+def find_lp_count_batch(age_norm, sex, mrs_index, coeffs, coeffs_mrs):
+    """
+    Calculate the linear predictor (lp) for a resource use count.
+
+    This is the same for the A&E admissions, non-elective bed days
+    and elective bed days models.
+
+    Inputs:
+    -------
+    age_norm   - np.array. Patients' ages minus the mean age for the
+                 logistic model for their mRS score.
+    sex        - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs_index  - np.array. Patients' mRS scores from 0 to 5.
+    coeffs     - np.array. Coefficients for this resource model.
+    coeffs_mrs - np.array. mRS coefficients for this resource model.
+
+    Returns:
+    --------
+    lp - np.array. The value of the linear predictor for each patient.
+    """
+    coeffs = coeffs_first(coeffs)
+    lp = (
+        coeffs[0] +
+        (coeffs[1] * age_norm) +
+        (coeffs[2] * sex) +
+        pick_by_mrs(coeffs_mrs, mrs_index)
+    )
+    return lp
+
+
+def find_resource_count_for_all_years_batch(
+        median_survival_years,
+        n_survival_years,
+        cumulative_count_function
+        ):
+    """
+    Calculates amount of a resource used in each year of the remaining
+    lifetime of each patient.
+
+    Inputs:
+    -------
+    median_survival_years     - np.array. Median survival years for
+                                each patient.
+    n_survival_years          - np.array. The median survival years
+                                rounded up.
+    cumulative_count_function - function. Takes a 2D array of times
+                                in years with one row per patient and
+                                returns the cumulative resource use
+                                up until those times.
+
+    Returns:
+    --------
+    counts - np.array. Contains the resource use for each year from 1
+             to the median survival year (rounded up), and NaN after
+             that. One row per patient.
+    """
+    n_years = int(np.max(n_survival_years, initial=0))
+    years_to_tabulate = np.arange(1, n_years + 1, dtype=float)
+    death_year = n_survival_years[:, None]
+
+    # Count up until the end of each year, or until the median
+    # survival time in the final year:
+    times = np.where(
+        years_to_tabulate < death_year,
+        years_to_tabulate,
+        median_survival_years[:, None]
+        )
+    cumulative_counts = cumulative_count_function(times)
+
+    # Subtract the count up until this year:
+    counts = np.full(cumulative_counts.shape, np.nan)
+    previous_count = np.zeros(len(median_survival_years))
+    for y in range(n_years):
+        count = cumulative_counts[:, y] - previous_count
+        counts[:, y] = count
+        previous_count = previous_count + count
+    counts[years_to_tabulate > death_year] = np.nan
+    return counts
+
+
+def find_discounted_resource_use_for_all_years_batch(
+        resource_by_year,
+        discount_factor_QALYs_perc
+        ):
+    """
+    Convert the input resource use to discounted resource use.
+
+    Inputs:
+    -------
+    resource_by_year           - np.array. Resource use in each year
+                                 of the remaining lifetime (not
+                                 cumulative). One row per patient.
+    discount_factor_QALYs_perc - float or np.array. Discount factor
+                                 for QALYs.
+
+    Returns:
+    --------
+    discounted_resource - np.array. Contains the discounted resource
+                          use for each year in the remaining lifetime
+                          (not cumulative).
+    """
+    # Start from year 1, which is the first (0th) column:
+    year = np.arange(1, resource_by_year.shape[1] + 1)
+    c = 1.0 + np.asarray(discount_factor_QALYs_perc)[..., None] / 100.0
+    discounted_resource = resource_by_year * (1.0 / ((c)**(year - 1.0)))
+    return discounted_resource
@@ -4,17 +4,25 @@ This contains everything in the Cost Effectiveness section.
 import streamlit as st
 import numpy as np
 import pandas as pd
+import plotly.graph_objects as go
 
 # For writing formulae in the "Details" sections:
 import utilities_lifetime.latex_equations as eqn
+# The change-in-outcome table formatter:
+import utilities_lifetime.main_calculations as calc
+# Net benefit for every willingness-to-pay threshold:
+import utilities_lifetime.net_benefit as net_benefit
+# The results for all mRS scores:
+from utilities_lifetime.results_table import ResultsTable, ResultsView
 
 
 def main(
-        df: pd.DataFrame,
+        results: ResultsTable,
         mrs_input: int,
         fixed_params: dict,
         table_cost_effectiveness: np.array,
-        model_input_str: str
+        model_input_str: str,
+        variables_dict: ResultsView = None
         ):
     """
     Main function for drawing everything under the "Resources" tab.
@@ -25,7 +33,7 @@ def main(
 
     Inputs:
     -------
-    df                       - pd.DataFrame. Contains all of the
+    results                  - ResultsTable. Contains all of the
                                calculated results for all mRS scores.
     mrs_input                - int. The mRS score to highlight in areas
                                that only show one score's results.
@@ -36,14 +44,20 @@ def main(
     model_type_used          - str. Whether this is the separate "mRS"
                                or "Dichotomous" model. Used to change
                                formatting in the app for model type.
+    variables_dict           - ResultsView. The results for the
+                               highlighted mRS score and the fixed
+                               parameters, shared by all of the
+                               containers. Made here if not given.
     """
-    # Pick bits out of the dataframe for all mRS:
-    qalys_all_mrs = df['qalys_total'].to_list()
-    total_discounted_cost_list = df['total_discounted_cost']
+    # Pick bits out of the results for all mRS:
+    qalys_all_mrs = results['qalys_total'].to_list()
+    total_discounted_cost_list = results['total_discounted_cost']
 
-    # Get the results for just the selected mRS:
-    results_dict = df.loc[mrs_input].to_dict()
-    variables_dict = dict(**results_dict, **fixed_params)
+    # Get the results for just the selected mRS. The same view is
+    # shared by every container, and values are only looked up when
+    # they're used:
+    if variables_dict is None:
+        variables_dict = results.view(mrs_input, fixed_params)
 
     # Discounted total net benefit by change in outcome
     #     +---+---+---+---+---+---+
@@ -76,6 +90,14 @@ def main(
     else:
         write_table_cost_effectiveness_dicho(table_cost_effectiveness)
 
+    # Net benefit at other willingness-to-pay thresholds:
+    write_net_benefit_by_wtp(
+        qalys_all_mrs,
+        total_discounted_cost_list,
+        variables_dict['wtp_qaly_gpb'],
+        model_input_str
+        )
+
 
 def write_table_cost_effectiveness(table_cost_effectiveness):
     """
@@ -226,3 +248,188 @@ def write_example_cost_effectiveness(
         'giving a net benefit of: '
     ]))
     st.latex(eqn.cost_effectiveness(vd, qaly, cost, total))
+
+
+def write_net_benefit_by_wtp(
+        qalys_all_mrs,
+        total_discounted_cost_list,
+        wtp_qaly_gpb,
+        model_input_str
+        ):
+    """
+    Write the net benefit tables for a chosen WTP and the break-even WTP.
+
+    The tables for every threshold on the slider are found at once
+    from the QALYs and costs that are already calculated.
+
+    Inputs:
+    -------
+    qalys_all_mrs              - list. Discounted QALYs, one per mRS.
+    total_discounted_cost_list - array. Discounted total cost, one per
+                                 mRS.
+    wtp_qaly_gpb               - float. The fixed WTP threshold.
+    model_input_str            - str. Whether this is the separate
+                                 "mRS" or "Dichotomous" model.
+    """
+    st.markdown('### Net Benefit at other willingness-to-pay thresholds')
+    st.markdown(''.join([
+        'Net Benefit changes in a straight line with the WTP threshold. ',
+        'Move the slider to see the table for another threshold. ',
+        'The break-even WTP is the threshold where the Net Benefit of ',
+        'a change in outcome is zero.'
+        ]))
+    wtp_values = net_benefit.wtp_grid(wtp_qaly_gpb)
+    surface, mask = net_benefit.build_net_benefit_surface(
+        qalys_all_mrs, total_discounted_cost_list, wtp_values)
+    break_even, gains, mask = net_benefit.find_break_even_wtp(
+        qalys_all_mrs, total_discounted_cost_list)
+
+    wtp_input = st.slider(
+        'Willingness to pay (£ per QALY):',
+        min_value=int(net_benefit.wtp_min_gbp),
+        max_value=int(net_benefit.wtp_max_gbp),
+        value=int(wtp_qaly_gpb),
+        step=int(net_benefit.wtp_step_gbp),
+        key='wtp_threshold'
+        )
+    # Pick the table for this threshold out of the ones already found:
+    index = np.argmin(np.abs(wtp_values - wtp_input))
+    table_cost_effectiveness = calc.format_change_in_outcome(
+        surface[index], mask)
+
+    if model_input_str == 'mRS':
+        write_table_cost_effectiveness(table_cost_effectiveness)
+        write_table_break_even(break_even, gains, mask)
+    else:
+        write_table_cost_effectiveness_dicho(table_cost_effectiveness)
+        st.markdown(
+            'Break-even WTP for the change from Independent to ' +
+            f'Dependent: {format_break_even(break_even[-1, 0], gains[-1, 0])}.'
+            )
+    plot_net_benefit_by_wtp(
+        wtp_values, surface, mask, wtp_input, model_input_str)
+
+
+def format_break_even(break_even, gains):
+    """
+    Describe one break-even WTP.
+
+    Inputs:
+    -------
+    break_even - float. Change in cost per QALY gained.
+    gains      - bool. Whether the change gains QALYs.
+
+    Returns:
+    --------
+    str. e.g. "£1,234", "Any" or "Never".
+    """
+    if np.isnan(break_even):
+        return 'n/a'
+    elif gains:
+        # Positive above the break-even WTP:
+        return f'£{break_even:,.0f}' if break_even > 0.0 else 'Any'
+    # Positive below the break-even WTP:
+    return f'Below £{break_even:,.0f}' if break_even > 0.0 else 'Never'
+
+
+def write_table_break_even(break_even, gains, mask):
+    """
+    Write a table of the break-even WTP for each change in outcome.
+
+    Inputs:
+    -------
+    break_even - 2D array. 6 rows by 6 columns. Change in cost per
+                 QALY gained for each change in outcome.
+    gains      - 2D array. Whether each change gains QALYs.
+    mask       - 2D array. True for the cells that are used.
+    """
+    table = []
+    for row in range(6):
+        row_vals = []
+        for column in range(6):
+            if mask[row, column]:
+                row_vals.append(
+                    format_break_even(break_even[row, column],
+                                      gains[row, column]))
+            elif column == row:
+                row_vals.append('-')
+            else:
+                row_vals.append('')
+        table.append(row_vals)
+
+    df_table = pd.DataFrame(table)
+
+    # Write to streamlit:
+    st.markdown('#### Break-even WTP by change in outcome')
+    st.table(df_table)
+    st.caption(''.join([
+        'Changes in outcome from column value to row value. ',
+        'The Net Benefit is positive for any WTP above the break-even ',
+        'WTP. "Any" means that the change saves money as well as ',
+        'gaining QALYs.'
+        ]))
+
+
+def plot_net_benefit_by_wtp(
+        wtp_values, surface, mask, wtp_input, model_input_str
+        ):
+    """
+    Draw a line graph of net benefit (y) with WTP threshold (x).
+
+    Inputs:
+    -------
+    wtp_values      - array. WTP thresholds for the x-axis.
+    surface         - array. Net benefit tables for each threshold,
+                      shape (thresholds, rows, columns).
+    mask            - 2D array. True for the cells that are used.
+    wtp_input       - float. The chosen threshold to mark.
+    model_input_str - str. Whether this is the separate "mRS" or
+                      "Dichotomous" model.
+    """
+    labels = ['Independent', 'Dependent']
+    fig = go.Figure()
+    for row, column in zip(*np.nonzero(mask)):
+        if model_input_str == 'mRS':
+            name = f'mRS {column} to {row}'
+        else:
+            name = f'{labels[column]} to {labels[row]}'
+        fig.add_trace(go.Scatter(
+            x=wtp_values,
+            y=surface[:, row, column],
+            mode='lines',
+            name=name,
+            hovertemplate=(
+                name + ': £%{y:,.0f} at £%{x:,.0f}' +
+                # Remove the contents of the secondary box:
+                '<extra></extra>'
+                )
+            ))
+    # Mark the chosen threshold and zero net benefit:
+    fig.add_vline(x=wtp_input, line_color='grey', line_dash='dot')
+    fig.add_hline(y=0.0, line_color='black', line_width=1.0)
+
+    fig.update_layout(
+        xaxis_title='Willingness to pay (£ per QALY)',
+        yaxis_title='Net Benefit (£)',
+        legend_title_text='Change in outcome',
+        xaxis=dict(fixedrange=True),
+        yaxis=dict(fixedrange=True),
+        height=400
+        )
+
+    # Options for the mode bar.
+    # (which doesn't appear on touch devices.)
+    plotly_config = {
+        # Plotly logo in the mode bar:
+        'displaylogo': False,
+        # Remove the following from the mode bar:
+        'modeBarButtonsToRemove': [
+            'zoom', 'pan', 'select', 'zoomIn', 'zoomOut', 'autoScale',
+            'lasso2d'
+            ],
+        # Options when the image is saved:
+        'toImageButtonOptions': {'height': None, 'width': None},
+        }
+
+    # Write to streamlit:
+    st.plotly_chart(fig, use_container_width=True, config=plotly_config)
@@ -87,3 +87,46 @@ def model_type_input():
         )
 
     return model_input_str
+
+
+def display_options_input():
+    """
+    Choose how the results sections are drawn.
+
+    Returns:
+    --------
+    show_all_sections - bool. Whether to draw every section in tabs.
+                        Otherwise only the section picked by the
+                        section selector is drawn, which is quicker.
+    """
+    show_all_sections = st.toggle(
+        'Show all sections in tabs',
+        value=False,
+        help=(
+            'Tabs draw every section each time anything changes. ' +
+            'With this off, only the chosen section is drawn.'
+            )
+        )
+    return show_all_sections
+
+
+def section_input(section_names):
+    """
+    Choose which results section to draw.
+
+    Inputs:
+    -------
+    section_names - list. Names of the results sections.
+
+    Returns:
+    --------
+    section - str. The chosen section name.
+    """
+    section = st.radio(
+        'Results section:',
+        section_names,
+        horizontal=True,
+        label_visibility='collapsed',
+        key='results_section'
+        )
+    return section
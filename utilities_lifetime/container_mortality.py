@@ -11,15 +11,20 @@ from utilities_lifetime.fixed_params import colours_excel
 # from utilities_lifetime.inputs import write_text_from_file
 # Import this function for use with user input probability:
 from stroke_lifetime.models import find_survival_time_for_pDeath
+# Survival times for many probabilities at once:
+import utilities_lifetime.batch_calculations as batch_calc
 # For writing formulae in the "Details" sections:
 import utilities_lifetime.latex_equations as eqn
+# The results for all mRS scores:
+from utilities_lifetime.results_table import ResultsTable, ResultsView
 
 
 def main(
-        df: pd.DataFrame,
+        results: ResultsTable,
         mrs_input: int,
         fixed_params: dict,
-        model_type_used: str
+        model_type_used: str,
+        variables_dict: ResultsView = None
         ):
     """
     Main function for drawing everything under the "Mortality" tab.
@@ -30,7 +35,7 @@ def main(
 
     Inputs:
     -------
-    df              - pd.DataFrame. Contains all of the calculated
+    results         - ResultsTable. Contains all of the calculated
                       results for all mRS scores.
     mrs_input       - int. The mRS score to highlight in areas
                       that only show one score's results.
@@ -39,21 +44,26 @@ def main(
     model_type_used - str. Whether this is the separate "mRS" or
                       "Dichotomous" model. Used to change the
                       formatting in the app for model type.
+    variables_dict  - ResultsView. The results for the highlighted mRS
+                      score and the fixed parameters, shared by all of
+                      the containers. Made here if not given.
     """
 
-    # Pick bits out of the dataframe for all mRS:
-    years = df.loc[0]['years']
-    all_survival_by_years = df['survival_by_year']
-    all_hazard_by_years = df['hazard_by_year'].tolist()
+    # Pick bits out of the results for all mRS:
+    years = results.years
+    all_survival_by_years = results['survival_by_year']
+    all_hazard_by_years = results['hazard_by_year']
 
-    survival_median_years = df['survival_median_years']
-    survival_lower_quartile_years = df['survival_lower_quartile_years']
-    survival_upper_quartile_years = df['survival_upper_quartile_years']
-    life_expectancy = df['life_expectancy']
+    survival_median_years = results['survival_median_years']
+    survival_lower_quartile_years = results['survival_lower_quartile_years']
+    survival_upper_quartile_years = results['survival_upper_quartile_years']
+    life_expectancy = results['life_expectancy']
 
-    # Get the results for just the selected mRS:
-    results_dict = df.loc[mrs_input].to_dict()
-    variables_dict = dict(**results_dict, **fixed_params)
+    # Get the results for just the selected mRS. The same view is
+    # shared by every container, and values are only looked up when
+    # they're used:
+    if variables_dict is None:
+        variables_dict = results.view(mrs_input, fixed_params)
 
     # Pick bits out of the results for just the selected mRS:
     death_in_year_n_probs = variables_dict['death_in_year_n_probs']
@@ -1083,3 +1093,97 @@ def write_example_median_survival(vd, fixed_params):
                 fixed_params['gz_gamma']
                 ))
         print_survival_time_calcs(prob_input_frac, survival_time, vd)
+
+        # Survival times for every probability from 1% to 99%:
+        st.markdown(''.join([
+            'The survival time for every probability of death ',
+            'for this patient:'
+            ]))
+        probabilities = np.arange(1, 100) / 100.0
+        survival_times = batch_calc.find_survival_quantiles_batch(
+            probabilities,
+            vd['death_in_year_1_prob'],
+            vd['death_in_year_n_lp'],
+            fixed_params['gz_gamma']
+            )[:, 0]
+        plot_survival_quantiles_plotly(
+            probabilities, survival_times, prob_input_frac, survival_time)
+
+
+def plot_survival_quantiles_plotly(
+        probabilities, survival_times, prob_input_frac, survival_time
+        ):
+    """
+    Draw a line graph of survival time (y) with probability of death (x).
+
+    Inputs:
+    probabilities   - array. Probabilities of death for the x-axis.
+                      Values lie between 0 and 1.
+    survival_times  - array. Survival time in years for each
+                      probability.
+    prob_input_frac - float. The chosen probability to mark on the line.
+    survival_time   - float. Survival time for the chosen probability.
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=probabilities*100.0,
+        y=survival_times,
+        mode='lines',
+        line_color='black',
+        name='Survival time',
+        hovertemplate=(
+            'P = %{x:.0f}%: %{y:.2f} years' +
+            # Remove the contents of the secondary box:
+            '<extra></extra>'
+            )
+        ))
+    # Mark the chosen probability:
+    if np.isfinite(survival_time):
+        fig.add_trace(go.Scatter(
+            x=[prob_input_frac*100.0],
+            y=[survival_time],
+            mode='markers',
+            marker_color='HotPink',
+            marker_size=10,
+            marker_line_color='black',
+            marker_line_width=1.0,
+            name='Chosen probability',
+            hovertemplate=(
+                'P = %{x:.0f}%: %{y:.2f} years' +
+                '<extra></extra>'
+                )
+            ))
+
+    # Figure title:
+    fig.update_layout(title_text='Survival time', title_x=0.5)
+    fig.update_layout(
+        xaxis_title='Probability of death (%)',
+        yaxis_title='Years since discharge',
+        showlegend=False
+        )
+    # Change axis:
+    fig.update_xaxes(range=[0, 100], tick0=0, dtick=25)
+    # Remove the excess margins at the top and bottom by changing
+    # figure height:
+    fig.update_layout(height=300)
+
+    # Disable zoom and pan:
+    fig.update_layout(xaxis=dict(fixedrange=True),
+                      yaxis=dict(fixedrange=True))
+
+    # Options for the mode bar.
+    # (which doesn't appear on touch devices.)
+    plotly_config = {
+        # Plotly logo in the mode bar:
+        'displaylogo': False,
+        # Remove the following from the mode bar:
+        'modeBarButtonsToRemove': [
+            'zoom', 'pan', 'select', 'zoomIn', 'zoomOut', 'autoScale',
+            'lasso2d'
+            ],
+        # Options when the image is saved:
+        'toImageButtonOptions': {'height': None, 'width': None},
+        }
+
+    # Write to streamlit:
+    st.plotly_chart(fig, use_container_width=True, config=plotly_config)
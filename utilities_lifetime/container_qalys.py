@@ -7,14 +7,17 @@ import pandas as pd
 
 # For writing formulae in the "Details" sections:
 import utilities_lifetime.latex_equations as eqn
+# The results for all mRS scores:
+from utilities_lifetime.results_table import ResultsTable, ResultsView
 
 
 def main(
-        df: pd.DataFrame,
+        results: ResultsTable,
         mrs_input: int,
         fixed_params: dict,
         qalys_table: np.array,
-        model_input_str: str
+        model_input_str: str,
+        variables_dict: ResultsView = None
         ):
     """
     Main function for drawing everything under the "QALYs" tab.
@@ -25,7 +28,7 @@ def main(
 
     Inputs:
     -------
-    df              - pd.DataFrame. Contains all of the calculated
+    results         - ResultsTable. Contains all of the calculated
                       results for all mRS scores.
     mrs_input       - int. The mRS score to highlight in areas
                       that only show one score's results.
@@ -36,14 +39,17 @@ def main(
     model_input_str - str. Whether this is the separate "mRS" or
                       "Dichotomous" model. Used to change the
                       formatting in the app for model type.
+    variables_dict  - ResultsView. The results for the highlighted mRS
+                      score and the fixed parameters, shared by all of
+                      the containers. Made here if not given.
     """
 
-    # Pick bits out of the dataframe for all mRS:
+    # Pick bits out of the results for all mRS:
 
-    survival_median_years = df['survival_median_years']
-    survival_lower_quartile_years = df['survival_lower_quartile_years']
-    survival_upper_quartile_years = df['survival_upper_quartile_years']
-    life_expectancy = df['life_expectancy']
+    survival_median_years = results['survival_median_years']
+    survival_lower_quartile_years = results['survival_lower_quartile_years']
+    survival_upper_quartile_years = results['survival_upper_quartile_years']
+    life_expectancy = results['life_expectancy']
 
     all_survival_times = np.array([
         survival_median_years,
@@ -51,11 +57,13 @@ def main(
         survival_upper_quartile_years,
         life_expectancy
     ]).T
-    qalys_all_mrs = df['qalys_total'].tolist()
+    qalys_all_mrs = results['qalys_total'].tolist()
 
-    # Get the results for just the selected mRS:
-    results_dict = df.loc[mrs_input].to_dict()
-    variables_dict = dict(**results_dict, **fixed_params)
+    # Get the results for just the selected mRS. The same view is
+    # shared by every container, and values are only looked up when
+    # they're used:
+    if variables_dict is None:
+        variables_dict = results.view(mrs_input, fixed_params)
 
     # Pick bits out of the results for just the selected mRS:
     survival_times = [
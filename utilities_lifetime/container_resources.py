@@ -7,14 +7,17 @@ import pandas as pd
 
 # For writing formulae in the "Details" sections:
 import utilities_lifetime.latex_equations as eqn
+# The results for all mRS scores:
+from utilities_lifetime.results_table import ResultsTable, ResultsView
 
 
 def main(
-        df: pd.DataFrame,
+        results: ResultsTable,
         mRS_input: int,
         fixed_params: dict,
         table_discounted_cost: np.array,
-        model_input_str: str
+        model_input_str: str,
+        variables_dict: ResultsView = None
         ):
     """
     Main function for drawing everything under the "Resources" tab.
@@ -25,8 +28,8 @@ def main(
 
     Inputs:
     -------
-    df                    - pd.DataFrame. Contains all of the calculated
-                            results for all mRS scores.
+    results               - ResultsTable. Contains all of the
+                            calculated results for all mRS scores.
     mrs_input             - int. The mRS score to highlight in areas
                             that only show one score's results.
     fixed_params          - dict. Contains fixed parameters independent
@@ -36,21 +39,27 @@ def main(
     model_type_used       - str. Whether this is the separate "mRS" or
                             "Dichotomous" model. Used to change the
                             formatting in the app for model type.
+    variables_dict        - ResultsView. The results for the highlighted
+                            mRS score and the fixed parameters, shared
+                            by all of the containers. Made here if not
+                            given.
     """
-    # Pick bits out of the dataframe for all mRS:
-    ae_count_list = df['ae_count']
-    nel_count_list = df['nel_count']
-    el_count_list = df['el_count']
-    care_years_list = df['care_years']
-    ae_discounted_cost = df['ae_discounted_cost']
-    nel_discounted_cost = df['nel_discounted_cost']
-    el_discounted_cost = df['el_discounted_cost']
-    care_years_discounted_cost = df['care_years_discounted_cost']
-    total_discounted_cost = df['total_discounted_cost'].tolist()
-
-    # Get the results for just the selected mRS:
-    results_dict = df.loc[mRS_input].to_dict()
-    variables_dict = dict(**results_dict, **fixed_params)
+    # Pick bits out of the results for all mRS:
+    ae_count_list = results['ae_count']
+    nel_count_list = results['nel_count']
+    el_count_list = results['el_count']
+    care_years_list = results['care_years']
+    ae_discounted_cost = results['ae_discounted_cost']
+    nel_discounted_cost = results['nel_discounted_cost']
+    el_discounted_cost = results['el_discounted_cost']
+    care_years_discounted_cost = results['care_years_discounted_cost']
+    total_discounted_cost = results['total_discounted_cost'].tolist()
+
+    # Get the results for just the selected mRS. The same view is
+    # shared by every container, and values are only looked up when
+    # they're used:
+    if variables_dict is None:
+        variables_dict = results.view(mRS_input, fixed_params)
 
     # Resource use
     # |__Mortality__ |__QALYs__ |__Resources__ |__Cost__
@@ -0,0 +1,168 @@
+"""
+This contains everything in the Sensitivity section.
+"""
+import functools
+
+import streamlit as st
+import numpy as np
+import plotly.graph_objects as go
+
+# The one-way sensitivity analysis:
+import utilities_lifetime.sensitivity as sensitivity
+# For the download button:
+import utilities_lifetime.downloads as downloads
+
+# Results that can be shown in the tornado chart:
+result_labels = {
+    'net_benefit': 'Net benefit (£)',
+    'qalys_total': 'Discounted QALYs',
+    'total_discounted_cost': 'Discounted total cost (£)',
+}
+
+
+def main(
+        age: int,
+        sex: int,
+        mrs_input: int,
+        model_input_str: str
+        ):
+    """
+    Main function for drawing everything under the "Sensitivity" tab.
+
+    Inputs:
+    -------
+    age             - int. The patient's age in years.
+    sex             - int. 1 for Male, 0 for Female.
+    mrs_input       - int. The mRS score to show in the tornado chart.
+    model_input_str - str. Whether this is the separate "mRS"
+                      or "Dichotomous" model.
+    """
+    st.markdown(''.join([
+        'Each entry of the fixed parameters is changed to a lower ',
+        'and then a higher value while everything else stays the ',
+        'same. The longest bars show which entries change the ',
+        'results the most for this patient.'
+        ]))
+
+    cols = st.columns(2)
+    with cols[0]:
+        range_perc = st.slider(
+            'Change either side of the point estimate (%):',
+            min_value=1,
+            max_value=50,
+            value=int(sensitivity.default_relative_range * 100),
+            step=1,
+            key='sensitivity_range'
+            )
+        result = st.selectbox(
+            'Result:',
+            list(result_labels),
+            format_func=result_labels.get,
+            key='sensitivity_result'
+            )
+    with cols[1]:
+        parameters = st.multiselect(
+            'Parameters to change:',
+            sensitivity.sensitivity_parameters,
+            default=sensitivity.sensitivity_parameters,
+            key='sensitivity_parameters'
+            )
+        n_bars = st.slider(
+            'Number of bars:',
+            min_value=5,
+            max_value=40,
+            value=15,
+            step=1,
+            key='sensitivity_bars'
+            )
+
+    if len(parameters) == 0:
+        st.warning('Choose at least one parameter to change.')
+        return
+
+    # All of the scenarios for every mRS score are calculated at once
+    # and kept for all visitors:
+    df_one_way = sensitivity.run_one_way_cached(
+        float(age),
+        int(sex),
+        model_input_str,
+        range_perc / 100.0,
+        tuple(parameters)
+        )
+    df_tornado = sensitivity.tornado_data(
+        df_one_way, mrs_input, result, n_bars)
+
+    plot_tornado_plotly(df_tornado, result_labels[result])
+
+    with st.expander('Table of all results'):
+        st.dataframe(df_one_way)
+        st.download_button(
+            'Download these results as .csv',
+            functools.partial(downloads.encode_csv, df_one_way),
+            file_name='lifetime_outcomes_sensitivity.csv',
+            key='sensitivity_download'
+        )
+
+
+def plot_tornado_plotly(df_tornado, result_label):
+    """
+    Draw a tornado chart of the low and high results for each entry.
+
+    Inputs:
+    -------
+    df_tornado   - pd.DataFrame. Output from sensitivity.tornado_data().
+                   The first row is drawn at the top.
+    result_label - str. Name of the result for the axis title.
+    """
+    if len(df_tornado) == 0:
+        st.write('None of the parameters change this result.')
+        return
+    base = df_tornado['base'].iloc[0]
+
+    fig = go.Figure()
+    for side, colour in zip(['low', 'high'], ['#0072B2', '#E69F00']):
+        fig.add_trace(go.Bar(
+            y=df_tornado['label'],
+            # Bars start from the base case result:
+            x=df_tornado[side] - base,
+            base=base,
+            orientation='h',
+            marker_color=colour,
+            name=f'{side.capitalize()} value',
+            customdata=np.stack(
+                [df_tornado[f'{side}_value'], df_tornado[side]], axis=-1),
+            hovertemplate=(
+                '%{y} = %{customdata[0]:.4g}: %{customdata[1]:,.2f}' +
+                # Remove the contents of the secondary box:
+                '<extra></extra>'
+                )
+            ))
+    fig.add_vline(x=base, line_color='black', line_width=1.0)
+
+    fig.update_layout(
+        barmode='overlay',
+        xaxis_title=result_label,
+        # Biggest swing at the top:
+        yaxis=dict(autorange='reversed', fixedrange=True),
+        xaxis=dict(fixedrange=True),
+        legend=dict(orientation='h', yanchor='bottom', y=1.0),
+        # Room for each bar:
+        height=100 + 25 * len(df_tornado)
+        )
+
+    # Options for the mode bar.
+    # (which doesn't appear on touch devices.)
+    plotly_config = {
+        # Plotly logo in the mode bar:
+        'displaylogo': False,
+        # Remove the following from the mode bar:
+        'modeBarButtonsToRemove': [
+            'zoom', 'pan', 'select', 'zoomIn', 'zoomOut', 'autoScale',
+            'lasso2d'
+            ],
+        # Options when the image is saved:
+        'toImageButtonOptions': {'height': None, 'width': None},
+        }
+
+    # Write to streamlit:
+    st.plotly_chart(fig, use_container_width=True, config=plotly_config)
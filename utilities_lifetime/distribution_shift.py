@@ -0,0 +1,234 @@
+"""
+Expected change in results from a shift in the mRS distribution.
+
+Trials usually report the proportion of patients with each mRS score
+in the control and treatment groups rather than one change in
+outcome. The expected change in a result, e.g. QALYs, is then
+    sum over mRS of (treatment proportion - control proportion)
+        x result for that mRS.
+
+The shift can also be given as a transition matrix, where row i gives
+the chance of each mRS score with treatment for a patient who would
+have had mRS i without it. The expected change is then the
+change-in-outcome table (see build_change_in_outcome() in
+main_calculations.py) weighted by how likely each change is:
+    sum over i and j of control[i] x transitions[i, j]
+        x (result[j] - result[i]).
+
+Both work for any number of patients and any number of scenarios at
+once with a single np.tensordot.
+
+The dichotomous model only has results for "independent" (mRS 0 to 2)
+and "dependent" (mRS 3 to 5). Distributions over the six mRS scores
+can still be used with it because each mRS score takes the results of
+its outcome type.
+"""
+# Imports:
+import numpy as np
+import pandas as pd
+
+# The change-in-outcome tables:
+import utilities_lifetime.main_calculations as calc
+
+# Results to find the expected change in:
+shift_columns = ['qalys_total', 'total_discounted_cost', 'net_benefit']
+# Allowed difference from 1 in the sum of each distribution:
+probability_tolerance = 1e-6
+# Which dichotomous outcome each mRS score belongs to:
+mrs_to_dichotomous_outcome = np.array([0, 0, 0, 1, 1, 1])
+
+
+def check_distributions(probabilities, n_outcomes: int, name: str):
+    """
+    Check that each row of probabilities is a distribution.
+
+    Inputs:
+    -------
+    probabilities - list or array. Shape (..., n_outcomes).
+    n_outcomes    - int. Number of outcomes, e.g. 6 mRS scores.
+    name          - str. What these are, for the error message.
+
+    Returns:
+    --------
+    probabilities - np.array. The same as a float array.
+    """
+    probabilities = np.asarray(probabilities, dtype=float)
+    if probabilities.ndim == 0 or probabilities.shape[-1] != n_outcomes:
+        raise ValueError(f'{name} must have {n_outcomes} values per row')
+    if np.any(probabilities < 0.0) or not np.all(np.isfinite(probabilities)):
+        raise ValueError(f'{name} must not be negative')
+    difference = np.abs(probabilities.sum(axis=-1) - 1.0)
+    if np.any(difference > probability_tolerance):
+        raise ValueError(f'Each row of {name} must add up to 1')
+    return probabilities
+
+
+def values_for_outcomes(values, n_outcomes: int):
+    """
+    Line up the results with the outcomes of the distributions.
+
+    Inputs:
+    -------
+    values     - array. Shape (..., k). One result per model outcome.
+    n_outcomes - int. Number of outcomes in the distributions.
+
+    Returns:
+    --------
+    values - np.array. Shape (..., n_outcomes). For the dichotomous
+             model (k = 2) with six mRS scores, each mRS score gets the
+             result of its outcome type.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.shape[-1] == n_outcomes:
+        return values
+    if values.shape[-1] == 2 and n_outcomes == len(mrs_to_dichotomous_outcome):
+        return values[..., mrs_to_dichotomous_outcome]
+    raise ValueError(
+        f'The distributions have {n_outcomes} outcomes but the results ' +
+        f'have {values.shape[-1]}')
+
+
+def expected_change(values, control, treatment):
+    """
+    Find the expected change in a result between two distributions.
+
+    Inputs:
+    -------
+    values    - array. Shape (..., k). One result per outcome for each
+                patient, e.g. qalys_total for mRS 0 to 5.
+    control   - array. Shape (k,) or (scenarios, k). Proportion of
+                patients with each outcome without treatment.
+    treatment - array. Same shape as control. With treatment.
+
+    Returns:
+    --------
+    change - np.array. Shape (...) or (..., scenarios). Expected
+             change in the result with treatment.
+    """
+    control = np.asarray(control, dtype=float)
+    n_outcomes = control.shape[-1]
+    control = check_distributions(control, n_outcomes, 'control')
+    treatment = check_distributions(treatment, n_outcomes, 'treatment')
+    values = values_for_outcomes(values, n_outcomes)
+    return np.tensordot(values, treatment - control, axes=([-1], [-1]))
+
+
+def expected_change_from_transitions(values, control, transitions):
+    """
+    Find the expected change in a result from a transition matrix.
+
+    Inputs:
+    -------
+    values      - array. Shape (..., k). One result per outcome for
+                  each patient.
+    control     - array. Shape (k,) or (scenarios, k). Proportion of
+                  patients with each outcome without treatment.
+    transitions - array. Shape (k, k) or (scenarios, k, k). Row i is
+                  the distribution of outcomes with treatment for the
+                  patients with outcome i without it.
+
+    Returns:
+    --------
+    change - np.array. Shape (...) or (..., scenarios). Expected
+             change in the result with treatment.
+    """
+    control = np.asarray(control, dtype=float)
+    n_outcomes = control.shape[-1]
+    control = check_distributions(control, n_outcomes, 'control')
+    transitions = check_distributions(
+        transitions, n_outcomes, 'transitions')
+    if transitions.shape[-2] != n_outcomes:
+        raise ValueError(
+            f'transitions must be {n_outcomes} by {n_outcomes}')
+    values = values_for_outcomes(values, n_outcomes)
+    # Chance of each change in outcome, shape (scenarios, k, k):
+    weights = control[..., :, None] * transitions
+    # Change in the result for each change in outcome, (..., k, k):
+    table, mask = calc.build_change_in_outcome(values)
+    return np.tensordot(table, weights, axes=([-2, -1], [-2, -1]))
+
+
+def shift_results(
+        df: pd.DataFrame,
+        n_outcomes: int,
+        control,
+        treatment=None,
+        transitions=None,
+        columns: list = shift_columns
+        ):
+    """
+    Find the expected changes for every patient in a results table.
+
+    Give either treatment or transitions.
+
+    Inputs:
+    -------
+    df          - pd.DataFrame. Results where each group of n_outcomes
+                  rows is one patient with every mRS score (or both
+                  outcome types) from best to worst, as on the
+                  Advanced options page.
+    n_outcomes  - int. Number of rows per patient.
+    control     - array. Shape (m,) or (scenarios, m). m is 6 for the
+                  mRS scores or the same as n_outcomes.
+    treatment   - array or None. Same shape as control.
+    transitions - array or None. Shape (m, m) or (scenarios, m, m).
+    columns     - list. Names of the results to find changes in.
+
+    Returns:
+    --------
+    changes - dict. For each column, an array of shape (patients,) or
+              (patients, scenarios).
+    """
+    if (treatment is None) == (transitions is None):
+        raise ValueError('Give either treatment or transitions')
+    n_patients = len(df) // n_outcomes
+    changes = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=float).reshape(
+            n_patients, n_outcomes)
+        if treatment is not None:
+            changes[column] = expected_change(values, control, treatment)
+        else:
+            changes[column] = expected_change_from_transitions(
+                values, control, transitions)
+    return changes
+
+
+def shift_dataframe(
+        df: pd.DataFrame,
+        n_outcomes: int,
+        control,
+        treatment=None,
+        transitions=None,
+        columns: list = shift_columns
+        ):
+    """
+    Make a table of the expected changes for every patient and scenario.
+
+    Inputs:
+    -------
+    The same as shift_results().
+
+    Returns:
+    --------
+    df_shift - pd.DataFrame. One row per patient and scenario with
+               columns age, sex_label, scenario and the expected change
+               in each of the columns.
+    """
+    changes = shift_results(
+        df, n_outcomes, control, treatment, transitions, columns)
+    n_patients = len(df) // n_outcomes
+    # Make every result (patients, scenarios) even for one scenario:
+    changes = {column: np.reshape(values, (n_patients, -1))
+               for column, values in changes.items()}
+    n_scenarios = changes[columns[0]].shape[1]
+    first = np.arange(n_patients) * n_outcomes
+
+    data = dict(
+        age=np.repeat(df['age'].to_numpy()[first], n_scenarios),
+        sex_label=np.repeat(df['sex_label'].to_numpy()[first], n_scenarios),
+        scenario=np.tile(np.arange(n_scenarios), n_patients),
+        )
+    for column, values in changes.items():
+        data[column] = values.ravel()
+    return pd.DataFrame(data)
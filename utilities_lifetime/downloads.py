@@ -0,0 +1,259 @@
+"""
+Make the files for the download buttons only when they're needed.
+
+Streamlit reruns the whole page script every time a widget changes.
+If a download button is given the file contents directly, e.g.
+df.to_csv(), then the whole file is made again on every rerun even if
+nobody clicks the button, and the file sits in memory next to the
+DataFrame it came from.
+
+Instead the download buttons are given a function that makes the file.
+Streamlit only calls the function when the button is clicked.
+
+The files of results from the Advanced options page are memoized with
+functools.lru_cache, using the age range and model type as the key,
+so clicking the button again or in another session with the same
+inputs doesn't make the file again. There are two tables of results:
+one row per patient for the results with one value per patient, and
+one row per patient per year for the results by year.
+
+The CSV files are encoded a chunk of rows at a time so that the
+whole table is never held as one long string as well as the encoded
+bytes. The gzip and Parquet files are much smaller for large sweeps.
+"""
+# Imports:
+import functools
+import gzip
+import io
+
+# Results of the main calculations for a range of ages:
+import utilities_lifetime.results_cache as results_cache
+
+# Number of rows of the DataFrame to turn into CSV at a time:
+csv_chunk_rows = 2000
+# The tables of results that can be downloaded:
+export_contents = ['results', 'by_year']
+# Maximum number of files to keep. Each file for the full range of
+# ages in steps of 0.5 years is at most about 7MB.
+cache_max_entries = 32
+
+# The file formats that can be downloaded.
+# Keys are the export_format names used below.
+export_formats = {
+    'csv': dict(label='.csv', extension='.csv', mime='text/csv'),
+    'csv_gzip': dict(
+        label='.csv.gz (compressed)',
+        extension='.csv.gz',
+        mime='application/gzip'
+        ),
+    'parquet': dict(
+        label='.parquet',
+        extension='.parquet',
+        mime='application/vnd.apache.parquet'
+        ),
+}
+
+
+# #####################################################################
+# ############################# Encoding ##############################
+# #####################################################################
+
+def iter_csv_chunks(df, chunk_rows: int = csv_chunk_rows):
+    """
+    Turn a DataFrame into CSV a chunk of rows at a time.
+
+    Joining the chunks gives the same text as df.to_csv().
+
+    Inputs:
+    -------
+    df         - pd.DataFrame. The table to write.
+    chunk_rows - int. Number of rows in each chunk.
+
+    Yields:
+    -------
+    bytes. UTF-8 encoded CSV. Only the first chunk has the header.
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start+chunk_rows].to_csv(
+            header=(start == 0)).encode('utf-8')
+
+
+def write_csv(df, f, chunk_rows: int = csv_chunk_rows):
+    """
+    Write a DataFrame as CSV to a file a chunk of rows at a time.
+
+    Inputs:
+    -------
+    df         - pd.DataFrame. The table to write.
+    f          - binary file object. e.g. io.BytesIO or gzip.GzipFile.
+    chunk_rows - int. Number of rows in each chunk.
+    """
+    for chunk in iter_csv_chunks(df, chunk_rows):
+        f.write(chunk)
+
+
+def encode_csv(df, chunk_rows: int = csv_chunk_rows):
+    """
+    Make the contents of a CSV file of a DataFrame.
+
+    Inputs:
+    -------
+    df         - pd.DataFrame. The table to write.
+    chunk_rows - int. Number of rows encoded at a time.
+
+    Returns:
+    --------
+    bytes. The CSV file.
+    """
+    buffer = io.BytesIO()
+    write_csv(df, buffer, chunk_rows)
+    return buffer.getvalue()
+
+
+def encode_csv_gzip(df, chunk_rows: int = csv_chunk_rows):
+    """
+    Make the contents of a gzip-compressed CSV file of a DataFrame.
+
+    Inputs:
+    -------
+    df         - pd.DataFrame. The table to write.
+    chunk_rows - int. Number of rows encoded at a time.
+
+    Returns:
+    --------
+    bytes. The .csv.gz file.
+    """
+    buffer = io.BytesIO()
+    # mtime=0 so that the same table always gives the same bytes.
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as f:
+        write_csv(df, f, chunk_rows)
+    return buffer.getvalue()
+
+
+def encode_parquet(df):
+    """
+    Make the contents of a Parquet file of a DataFrame.
+
+    Inputs:
+    -------
+    df - pd.DataFrame. The table to write.
+
+    Returns:
+    --------
+    bytes. The .parquet file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df), buffer)
+    return buffer.getvalue()
+
+
+def encode_dataframe(df, export_format: str):
+    """
+    Make the contents of a file of a DataFrame.
+
+    Inputs:
+    -------
+    df            - pd.DataFrame. The table to write.
+    export_format - str. A key of export_formats.
+
+    Returns:
+    --------
+    bytes. The file.
+    """
+    if export_format == 'csv':
+        return encode_csv(df)
+    elif export_format == 'csv_gzip':
+        return encode_csv_gzip(df)
+    elif export_format == 'parquet':
+        return encode_parquet(df)
+    raise ValueError(
+        f'Unknown export format "{export_format}". ' +
+        f'Use one of: {", ".join(export_formats)}.'
+        )
+
+
+# #####################################################################
+# ########################## Cached exports ###########################
+# #####################################################################
+
+@functools.lru_cache(maxsize=cache_max_entries)
+def sweep_export(
+        age_min: float,
+        age_max: float,
+        age_step: float,
+        model_input_str: str,
+        export_format: str,
+        content: str = 'results'
+        ):
+    """
+    Make a file of the results for a range of ages.
+
+    The results come from results_cache.run_sweep(), so they are
+    only calculated if the page hasn't already done so.
+
+    Inputs:
+    -------
+    age_min         - float. Youngest age in years.
+    age_max         - float. Oldest age in years.
+    age_step        - float. Years between ages.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    export_format   - str. A key of export_formats.
+    content         - str. "results" for the results with one value
+                      per patient, or "by_year" for the results by
+                      year with one row per patient per year.
+
+    Returns:
+    --------
+    bytes. The file.
+    """
+    results = results_cache.run_sweep(
+        age_min, age_max, age_step, model_input_str)
+    if content == 'results':
+        df = results.scalars
+    elif content == 'by_year':
+        df = results.to_long_dataframe()
+    else:
+        raise ValueError(
+            f'Unknown content "{content}". ' +
+            f'Use one of: {", ".join(export_contents)}.'
+            )
+    return encode_dataframe(df, export_format)
+
+
+def make_sweep_export(
+        age_min: float,
+        age_max: float,
+        age_step: float,
+        model_input_str: str,
+        export_format: str,
+        content: str = 'results'
+        ):
+    """
+    Make a function for a download button that gives the sweep file.
+
+    Inputs:
+    -------
+    The same as sweep_export().
+
+    Returns:
+    --------
+    callable. Takes no arguments and returns the file as bytes.
+    """
+    return functools.partial(
+        sweep_export, age_min, age_max, age_step, model_input_str,
+        export_format, content
+        )
+
+
+def cache_info():
+    """
+    Get the hit and miss counters for the file cache.
+
+    Returns:
+    --------
+    dict. Keys hits, misses, maxsize, currsize.
+    """
+    return sweep_export.cache_info()._asdict()
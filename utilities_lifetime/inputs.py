@@ -1,19 +1,90 @@
+import functools
+import os
+
 import streamlit as st
 
+# Maximum number of text files to keep between script runs.
+# Each one is a few kB.
+text_cache_max_entries = 64
+
 
 def write_text_from_file(filename, head_lines_to_skip=0):
     """
     Write text from 'filename' into streamlit.
     Skip a few lines at the top of the file using head_lines_to_skip.
     """
+    # Find the text, only reading the file if it hasn't been read
+    # already or if it has changed since.
+    text_to_print = read_text_from_file(filename, head_lines_to_skip)
+
+    # Write the text in streamlit.
+    st.markdown(f"""{text_to_print}""")
+
+
+def read_text_from_file(filename, head_lines_to_skip=0):
+    """
+    Get the text from a file, skipping a few lines at the top.
+
+    The text is kept between script runs. The file's modification
+    time is part of the cache key so that the file is read again
+    if it's changed, e.g. while editing the page text.
+
+    Inputs:
+    -------
+    filename           - str. Path to the text file.
+    head_lines_to_skip - int. Number of lines at the top to leave out.
+
+    Returns:
+    --------
+    text_to_print - str. The rest of the file as one string.
+    """
+    path = os.path.abspath(filename)
+    # Only looks up the file's details, doesn't read it:
+    modified_ns = os.stat(path).st_mtime_ns
+    return read_text(path, head_lines_to_skip, modified_ns)
+
+
+@functools.lru_cache(maxsize=text_cache_max_entries)
+def read_text(path, head_lines_to_skip, modified_ns):
+    """
+    Read the text from a file, skipping a few lines at the top.
+
+    Memoized with functools.lru_cache. Use read_text_from_file()
+    instead of calling this directly.
+
+    Inputs:
+    -------
+    path               - str. Absolute path to the text file.
+    head_lines_to_skip - int. Number of lines at the top to leave out.
+    modified_ns        - int. When the file was last changed. Only
+                         used as part of the cache key.
+
+    Returns:
+    --------
+    text_to_print - str. The rest of the file as one string.
+    """
     # Open the file and read in the contents,
     # skipping a few lines at the top if required.
-    with open(filename, 'r', encoding="utf-8") as f:
+    with open(path, 'r', encoding="utf-8") as f:
         text_to_print = f.readlines()[head_lines_to_skip:]
 
     # Turn the list of all of the lines into one long string
     # by joining them up with an empty '' string in between each pair.
     text_to_print = ''.join(text_to_print)
+    return text_to_print
 
-    # Write the text in streamlit.
-    st.markdown(f"""{text_to_print}""")
+
+def text_cache_info():
+    """
+    Get the hit and miss counters for the text file cache.
+
+    Returns:
+    --------
+    dict. Keys hits, misses, maxsize, currsize.
+    """
+    return read_text.cache_info()._asdict()
+
+
+def text_cache_clear():
+    """Empty the text file cache and reset its counters."""
+    read_text.cache_clear()
@@ -0,0 +1,286 @@
+"""
+Optional timing of the functions that draw the app.
+
+Switch this on with either the environment variable
+LIFETIME_PROFILE=1 (for every session) or by adding ?profile=1 to the
+end of the app's URL (for one session).
+
+When it's on, the main() function and every write_* and plot_*
+function in the container scripts are wrapped so that each call is
+timed, and so are a few Streamlit functions like st.latex. At the end
+of each script run, the number of calls and the total time for each
+function are shown in a debug panel in the sidebar and written to the
+log as one line of JSON.
+
+When it's off, nothing is wrapped so there is no extra cost. The
+functions are only wrapped while at least one session's script run
+is being timed and the originals are put back when the last one
+finishes. Other sessions that run at the same time only pay for one
+attribute lookup per call.
+
+Each script run is in its own thread, so the timings are stored
+separately for each thread. A script run can stop part way through,
+e.g. from an exception, st.stop() or a rerun, so the page calls
+release_wrappers() in a finally block after start_rerun() to make
+sure that the count of timed runs always goes back down.
+"""
+# Imports:
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Streamlit functions that are timed as well as the container functions:
+streamlit_functions = [
+    'latex', 'markdown', 'table', 'dataframe', 'plotly_chart', 'write']
+# Prefixes of the container function names that are timed:
+function_prefixes = ('main', 'write_', 'plot_')
+
+# The functions that have been swapped for timed versions, as
+# {(module, name): original function}:
+originals = {}
+# Number of script runs being timed at the moment:
+n_timed_runs = 0
+# Stops two sessions wrapping or unwrapping the functions at once:
+wrap_lock = threading.Lock()
+
+
+class ThreadState(threading.local):
+    """
+    The timings for the script run in this thread.
+
+    records is None unless this thread's script run is being timed.
+    The defaults are class attributes so that reading them in a
+    thread that has never been timed is as quick as possible.
+    """
+    records = None
+    start = 0.0
+
+
+state = ThreadState()
+
+
+def is_enabled():
+    """
+    Check whether timing is switched on for this session.
+
+    Returns:
+    --------
+    bool. True if LIFETIME_PROFILE is set or ?profile=1 is in the URL.
+    """
+    if os.environ.get('LIFETIME_PROFILE', '').lower() in ['1', 'true']:
+        return True
+    return st.query_params.get('profile', '') in ['1', 'true']
+
+
+# #####################################################################
+# ############################# Recording #############################
+# #####################################################################
+
+def record(name: str, seconds: float):
+    """
+    Add one call to the timings for this script run.
+
+    Inputs:
+    -------
+    name    - str. Name of the timed function or block of code.
+    seconds - float. How long it took.
+    """
+    records = state.records
+    if records is None:
+        return
+    calls, total = records.get(name, (0, 0.0))
+    records[name] = (calls + 1, total + seconds)
+
+
+@contextlib.contextmanager
+def timer(name: str):
+    """
+    Time a block of code, e.g. with timer('calculations'): ...
+
+    Inputs:
+    -------
+    name - str. Label for the timings.
+    """
+    if state.records is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def wrap_function(function, name: str):
+    """
+    Make a version of a function that records how long it takes.
+
+    Inputs:
+    -------
+    function - callable. The function to time.
+    name     - str. Label for the timings.
+
+    Returns:
+    --------
+    wrapper - callable. Calls function and records the time taken if
+              this thread's script run is being timed.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if state.records is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_module(module):
+    """
+    Wrap the main, write_* and plot_* functions in a module.
+
+    The module's functions are replaced so that calls from inside the
+    module and from the pages are both timed. Modules are only
+    wrapped once and the originals are kept in originals.
+
+    Inputs:
+    -------
+    module - module. e.g. utilities_lifetime.container_mortality.
+    """
+    short_name = module.__name__.split('.')[-1]
+    for name, value in list(vars(module).items()):
+        if (
+            callable(value) and
+            name.startswith(function_prefixes) and
+            getattr(value, '__module__', None) == module.__name__ and
+            not getattr(value, 'instrumented', False)
+        ):
+            originals[(module, name)] = value
+            setattr(
+                module, name, wrap_function(value, f'{short_name}.{name}'))
+
+
+def instrument_streamlit():
+    """Wrap the Streamlit functions in streamlit_functions."""
+    for name in streamlit_functions:
+        value = getattr(st, name)
+        if not getattr(value, 'instrumented', False):
+            originals[(st, name)] = value
+            setattr(st, name, wrap_function(value, f'st.{name}'))
+
+
+def restore_originals():
+    """Put back every function that was swapped for a timed version."""
+    for (module, name), value in originals.items():
+        setattr(module, name, value)
+    originals.clear()
+
+
+def release_wrappers():
+    """
+    Mark this thread's timed script run as over.
+
+    The original functions are put back when no other script run is
+    being timed. Does nothing if this thread's script run isn't being
+    timed, so it's safe to call more than once.
+    """
+    global n_timed_runs
+    if state.records is None:
+        return
+    state.records = None
+    with wrap_lock:
+        n_timed_runs -= 1
+        if n_timed_runs == 0:
+            restore_originals()
+
+
+# #####################################################################
+# ########################### Script runs #############################
+# #####################################################################
+
+def start_rerun(modules: list):
+    """
+    Start timing this script run if timing is switched on.
+
+    Every call should be followed by release_wrappers() in a finally
+    block so that the functions are unwrapped however the run ends.
+
+    Inputs:
+    -------
+    modules - list. Modules whose functions should be timed.
+
+    Returns:
+    --------
+    bool. Whether this script run is being timed.
+    """
+    global n_timed_runs
+    if not is_enabled():
+        return False
+    with wrap_lock:
+        for module in modules:
+            instrument_module(module)
+        instrument_streamlit()
+        n_timed_runs += 1
+    if not logger.handlers:
+        # Make sure the JSON lines are shown alongside Streamlit's logs.
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(name)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    state.records = {}
+    state.start = time.perf_counter()
+    return True
+
+
+def finish_rerun(page_name: str):
+    """
+    Stop timing this script run and report the timings.
+
+    The timings are shown in the sidebar and logged as one line of
+    JSON with the keys page, total_ms and functions, where functions
+    maps each name to its calls and ms.
+
+    Inputs:
+    -------
+    page_name - str. Used to label the log line.
+    """
+    records = state.records
+    if records is None:
+        return
+    total = time.perf_counter() - state.start
+    # Stop timing before drawing the panel so it isn't included:
+    release_wrappers()
+
+    df_timings = pd.DataFrame(
+        [[name, calls, 1000.0 * seconds]
+         for name, (calls, seconds) in records.items()],
+        columns=['function', 'calls', 'total_ms']
+        ).sort_values('total_ms', ascending=False)
+
+    logger.info(json.dumps(dict(
+        page=page_name,
+        total_ms=round(1000.0 * total, 3),
+        functions={
+            name: dict(calls=calls, ms=round(1000.0 * seconds, 3))
+            for name, (calls, seconds) in records.items()
+            }
+        )))
+
+    with st.sidebar:
+        with st.expander('Debug: timings', expanded=True):
+            st.caption(
+                f'Whole script run: {1000.0 * total:.1f} ms. ' +
+                'Times include any timed functions called inside.')
+            st.dataframe(df_timings, hide_index=True)
@@ -0,0 +1,261 @@
+"""
+Keep the LaTeX formulae and markdown tables from latex_equations.py
+between script runs.
+
+Streamlit reruns the whole page script every time a widget changes,
+and every formula in the Details expanders is built again from its
+pieces even when none of the numbers in it have changed.
+
+Every function in latex_equations.py is memoized here:
+
++ The "generic" functions take no inputs, so each string is only
+  built once for the whole process.
++ The functions that take vd (the variables_dict) are keyed on the
+  values of only the variables that they actually read from vd,
+  plus any other inputs. The coefficient tables only read fixed
+  parameters, so they are only built once for each model type.
+  The patient formulae are built again only when a number that
+  appears in them changes.
+
+Which variables a function reads is found by running it with a
+wrapper around vd that notes every key that is looked up. The
+strings are made the same way every time from the same inputs, so
+if another call has the same inputs and the same values for those
+keys, it would build the same string. A function that looks up
+different keys depending on its inputs (e.g. discounted_cost())
+gets one set of keys for each path through it.
+
+Imported modules stay loaded between reruns and between sessions,
+so the cache is shared by every visitor to the app in this process.
+The least recently used strings are dropped once a function has
+cache_max_entries of them.
+"""
+# Imports:
+import collections
+import collections.abc
+import functools
+import inspect
+import threading
+
+import numpy as np
+
+# Maximum number of strings to keep for each function. Most are
+# well under 1kB.
+cache_max_entries = 128
+
+# Types that can go straight into a cache key:
+hashable_types = frozenset([
+    str, int, float, bool, type(None), np.float64, np.int64, np.bool_])
+
+# Every memoized function, for cache_info() and cache_clear():
+memoized_functions = []
+
+
+class ReadRecorder(collections.abc.Mapping):
+    """
+    Wrap vd and note every key that is looked up.
+
+    If anything loops over all of vd then it isn't clear which
+    values the result depends on, so the result isn't kept.
+    """
+    def __init__(self, vd):
+        self.vd = vd
+        # A dict rather than a set to keep the order of first use:
+        self.keys_read = {}
+        self.cacheable = True
+
+    def __getitem__(self, key):
+        self.keys_read[key] = None
+        return self.vd[key]
+
+    def __iter__(self):
+        self.cacheable = False
+        return iter(self.vd)
+
+    def __len__(self):
+        self.cacheable = False
+        return len(self.vd)
+
+
+def make_hashable(value):
+    """
+    Turn a value into something that can be part of a cache key.
+
+    Inputs:
+    -------
+    value - anything. e.g. a float, a list or an np.array.
+
+    Returns:
+    --------
+    The value itself if it can be used as it is, otherwise a tuple
+    that is equal for equal values.
+    """
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,
+                tuple([make_hashable(v) for v in value]))
+    if isinstance(value, dict):
+        return ('dict', tuple(
+            [(k, make_hashable(v)) for k, v in value.items()]))
+    # e.g. numpy scalars, which are hashable already:
+    return value
+
+
+def make_key(values: tuple):
+    """
+    Make a cache key from some values.
+
+    The types are part of the key because e.g. 1 and 1.0 are equal
+    but are not always written the same way.
+
+    Inputs:
+    -------
+    values - tuple. e.g. the inputs to a function.
+
+    Returns:
+    --------
+    tuple. Can be used as a dictionary key.
+    """
+    types = tuple(map(type, values))
+    if hashable_types.issuperset(types):
+        return (values, types)
+    # Some of the values are e.g. lists or arrays.
+    return (tuple([make_hashable(v) for v in values]), types)
+
+
+def memoize(function):
+    """
+    Keep the results of a latex_equations function between calls.
+
+    Inputs:
+    -------
+    function - callable. Returns a string. If its first input is
+               called "vd" then it is keyed on the values it reads
+               from vd, otherwise on all of its inputs.
+
+    Returns:
+    --------
+    wrapper - callable. Use in the same way as function. The original
+              function is kept as wrapper.__wrapped__.
+    """
+    parameters = list(inspect.signature(function).parameters)
+    if len(parameters) == 0:
+        # Generic formula. There's only ever one string.
+        wrapper = functools.cache(function)
+        memoized_functions.append(wrapper)
+        return wrapper
+
+    uses_vd = parameters[0] == 'vd'
+    # Strings already built, least recently used first:
+    cache = collections.OrderedDict()
+    # Each set of vd keys that a call has read:
+    key_sets = []
+    counts = dict(hits=0, misses=0)
+    lock = threading.Lock()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if kwargs:
+            # Put keyword inputs in the same place as positional ones.
+            args = signature.bind(*args, **kwargs).args
+        if uses_vd:
+            vd = args[0]
+            args_key = make_key(args[1:])
+            # Try every set of keys that this function has read before.
+            for keys in key_sets:
+                try:
+                    values = tuple([vd[key] for key in keys])
+                except KeyError:
+                    continue
+                key = (args_key, keys, make_key(values))
+                with lock:
+                    result = cache.get(key)
+                    if result is not None:
+                        cache.move_to_end(key)
+                        counts['hits'] += 1
+                        return result
+        else:
+            key = make_key(args)
+            with lock:
+                result = cache.get(key)
+                if result is not None:
+                    cache.move_to_end(key)
+                    counts['hits'] += 1
+                    return result
+
+        # Build the string:
+        if uses_vd:
+            recorder = ReadRecorder(vd)
+            result = function(recorder, *args[1:])
+            if not recorder.cacheable:
+                return result
+            keys = tuple(recorder.keys_read)
+            values = tuple([vd[key] for key in keys])
+            key = (args_key, keys, make_key(values))
+        else:
+            result = function(*args)
+
+        with lock:
+            counts['misses'] += 1
+            if uses_vd and keys not in key_sets:
+                key_sets.append(keys)
+            cache[key] = result
+            if len(cache) > cache_max_entries:
+                cache.popitem(last=False)
+        return result
+
+    def cache_info():
+        return dict(counts, maxsize=cache_max_entries, currsize=len(cache))
+
+    def cache_clear():
+        with lock:
+            cache.clear()
+            key_sets.clear()
+            counts.update(hits=0, misses=0)
+
+    signature = inspect.signature(function)
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    memoized_functions.append(wrapper)
+    return wrapper
+
+
+def memoize_module(module):
+    """
+    Memoize every function defined in a module.
+
+    Inputs:
+    -------
+    module - module. Usually latex_equations. Each function defined
+             there is replaced with its memoized version.
+    """
+    for name, value in list(vars(module).items()):
+        if (inspect.isfunction(value) and
+                value.__module__ == module.__name__):
+            setattr(module, name, memoize(value))
+
+
+def cache_info():
+    """
+    Get the hit and miss counters for all of the formulae.
+
+    Returns:
+    --------
+    dict. Keys hits, misses, currsize summed over every function.
+    """
+    info = dict(hits=0, misses=0, currsize=0)
+    for function in memoized_functions:
+        function_info = function.cache_info()
+        if not isinstance(function_info, dict):
+            # From functools.cache.
+            function_info = function_info._asdict()
+        for key in info:
+            info[key] += function_info[key]
+    return info
+
+
+def cache_clear():
+    """Empty every formula cache and reset the counters."""
+    for function in memoized_functions:
+        function.cache_clear()
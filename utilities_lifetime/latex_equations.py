@@ -28,7 +28,16 @@ Terms used in this script:
             i.e. no calculated variables.
 "display" - means we're just showing the current value of some
             variable, as opposed to showing a formula for it.
+
+Every function here is memoized at the bottom of this file, so each
+string is only built again when the numbers in it change. See
+latex_cache.py.
 """
+# Imports:
+import sys
+
+# Keeps the strings between script runs:
+import utilities_lifetime.latex_cache as latex_cache
 
 # #####################################################################
 # ############################ Mortality ##############################
@@ -2080,3 +2089,11 @@ def cost_effectiveness(vd, qaly, cost, total):
         '''
     )
     return str
+
+
+# #####################################################################
+# ############################# Caching ###############################
+# #####################################################################
+
+# Replace every function above with a memoized version:
+latex_cache.memoize_module(sys.modules[__name__])
@@ -3,15 +3,116 @@ Set up the main calculations in this script.
 
 The function main_calculations() runs through everything important
 and stores the results in a dictionary.
+
+The change-in-outcome tables are found for all pairs of outcomes at
+once with build_change_in_outcome(), which also works for many
+patients at once. The tables are turned into their display format
+separately with format_change_in_outcome().
 """
 # Imports:
 import numpy as np
+import pandas as pd
 
 
 # #####################################################################
 # ######################## CHANGE IN OUTCOME ##########################
 # #####################################################################
 
+def build_change_in_outcome(values):
+    """
+    Find the change in a value for every change in outcome at once.
+
+    For k outcomes (e.g. six mRS scores) this makes a k by k table
+    where the cell in row i and column j is the change from outcome i
+    to outcome j, i.e. values[j] - values[i]. Only the cells below the
+    diagonal (j < i, a change to a better outcome) are used in the app.
+
+    The inputs may have any number of leading axes, e.g. one row of
+    k outcomes for each of N patients gives N tables of k by k.
+
+    Inputs:
+    values - list or array. Shape (..., k). One value per outcome.
+
+    Returns:
+    table - np.array. Shape (..., k, k). Float changes in value for
+            every cell including the ones that aren't used.
+    mask  - np.array. Shape (k, k). True for the cells that are used.
+    """
+    values = np.asarray(values, dtype=float)
+    table = values[..., None, :] - values[..., :, None]
+    k = values.shape[-1]
+    mask = np.tri(k, k, -1, dtype=bool)
+    return table, mask
+
+
+def format_change_in_outcome(table, mask):
+    """
+    Prepare a change-in-outcome table for display.
+
+    The cells on the diagonal become '-' and the cells above it become
+    '' so that they show as blank. The used cells keep their values
+    as np.float64 so that the table formatters recognise them.
+
+    Inputs:
+    table - np.array. Shape (..., k, k). From build_change_in_outcome().
+    mask  - np.array. Shape (k, k). From build_change_in_outcome().
+
+    Returns:
+    table_display - np.array. Same shape as table with dtype object.
+    """
+    table_display = np.empty(table.shape, dtype=object)
+    table_display[...] = ''
+    k = mask.shape[0]
+    diagonal = np.eye(k, dtype=bool)
+    table_display[..., diagonal] = '-'
+    # Copy the values cell by cell so that they stay as np.float64:
+    values = table[..., mask]
+    cells = np.empty(values.shape, dtype=object)
+    cells.ravel()[:] = list(values.ravel())
+    table_display[..., mask] = cells
+    return table_display
+
+
+def build_change_in_outcome_dataframe(df, columns, n_outcomes):
+    """
+    Find the change in results with change in outcome for each patient.
+
+    Uses the results DataFrame from the Advanced options page, where
+    each group of n_outcomes rows is one patient with every mRS score
+    (or both outcome types) from best to worst.
+
+    Inputs:
+    df         - pd.DataFrame. Results with columns age, sex_label, mrs
+                 and the columns to compare.
+    columns    - list. Names of the columns to compare.
+    n_outcomes - int. Number of rows per patient.
+
+    Returns:
+    df_change - pd.DataFrame. One row per patient and change to a
+                better outcome with columns age, sex_label, mrs_from,
+                mrs_to, and the change in each of the columns.
+    """
+    n_patients = len(df) // n_outcomes
+    # Every outcome for each patient, e.g. the mRS scores 0 to 5:
+    mrs = df['mrs'].to_numpy().reshape(n_patients, n_outcomes)
+    rows, cols = np.nonzero(np.tri(n_outcomes, n_outcomes, -1, dtype=bool))
+    first = np.arange(n_patients) * n_outcomes
+
+    data = dict(
+        age=np.repeat(df['age'].to_numpy()[first], len(rows)),
+        sex_label=np.repeat(df['sex_label'].to_numpy()[first], len(rows)),
+        mrs_from=mrs[:, rows].ravel(),
+        mrs_to=mrs[:, cols].ravel(),
+        )
+    for column in columns:
+        values = df[column].to_numpy(dtype=float).reshape(
+            n_patients, n_outcomes)
+        table, mask = build_change_in_outcome(values)
+        data[column] = table[:, rows, cols].ravel()
+    df_change = pd.DataFrame(data)
+    return df_change
+
+
 def build_table_qaly_by_change_in_outcome(qalys):
     """
     Make a table of the change in QALYs with change in outcome.
@@ -26,20 +127,8 @@ def build_table_qaly_by_change_in_outcome(qalys):
     Returns:
     table - np.array. The table of changes in QALYs.
     """
-    table = []
-    for row in range(len(qalys)):
-        row_vals = []
-        for column in range(len(qalys)):
-            if column < row:
-                diff = qalys[column] - qalys[row]
-                row_vals.append(diff)
-            elif column == row:
-                row_vals.append('-')
-            else:
-                row_vals.append('')
-        table.append(row_vals)
-    table = np.array(table, dtype=object)
-    return table
+    table, mask = build_change_in_outcome(qalys)
+    return format_change_in_outcome(table, mask)
 
 
 def build_table_discounted_change(total_discounted_cost):
@@ -58,23 +147,11 @@ def build_table_discounted_change(total_discounted_cost):
     Returns:
     table - np.array. The table of changes in discounted resource use.
     """
-    # Turn into grid by change of outcome:
-    # Keep formatted values in here:
-    table = []
-    for row in range(len(total_discounted_cost)):
-        row_vals = []
-        for column in range(len(total_discounted_cost)):
-            if column < row:
-                diff_val = (total_discounted_cost[row] -
-                            total_discounted_cost[column])
-                row_vals.append(diff_val)
-            elif column == row:
-                row_vals.append('-')
-            else:
-                row_vals.append('')
-        table.append(row_vals)
-    table = np.array(table, dtype=object)
-    return table
+    # This table shows the cost saved by the better outcome, so
+    # find the change in the negative of the cost.
+    table, mask = build_change_in_outcome(
+        -np.asarray(total_discounted_cost, dtype=float))
+    return format_change_in_outcome(table, mask)
 
 
 def build_table_cost_effectiveness(net_benefit):
@@ -83,37 +160,19 @@ def build_table_cost_effectiveness(net_benefit):
     account the willingness-to-pay threshold. The table is used for the
     "Discounted total Net Benefit by change in outcome" section.
 
-    Each of the input and output tables are 6x6 in shape, where each
-    row and each column is a different mRS score.
+    The output table is 6x6 in shape, where each row and each column
+    is a different mRS score.
 
     Inputs:
-    qaly_table               - array. Table of QALYs by change in
-                               outcome.
-    cost_table               - array. Table of discounted change in
-                               cost by change in outcome.
+    net_benefit              - list or array. The list of six net
+                               benefits, one for each mRS.
 
     Returns:
     table_cost_effectiveness - array. Table with the cost effectiveness
                                values, and invalid data treated the
-                               same as in the input QALY and cost
-                               tables.
+                               same as in the QALY and cost tables.
     """
     # The following is equivalent to this:
     # table_cost_effectiveness = (wtp_qaly_gpb * qaly_table) + cost_table
-
-    # Turn into grid by change of outcome:
-    # Keep formatted values in here:
-    table = []
-    for row in range(len(net_benefit)):
-        row_vals = []
-        for column in range(len(net_benefit)):
-            if column < row:
-                diff_val = net_benefit[column] - net_benefit[row]
-                row_vals.append(diff_val)
-            elif column == row:
-                row_vals.append('-')
-            else:
-                row_vals.append('')
-        table.append(row_vals)
-    table = np.array(table, dtype=object)
-    return table
+    table, mask = build_change_in_outcome(net_benefit)
+    return format_change_in_outcome(table, mask)
@@ -0,0 +1,379 @@
+"""
+Collect the results lookups of many sessions into one batch.
+
+A Streamlit server runs each session's script in its own thread. When
+many people change a widget at about the same time, each session
+looks up the results for its own patient with a separate call to
+results_grid.lookup_results(). Most of the time of each call goes on
+work that is the same however many patients are looked up, e.g.
+going through every results column.
+
+This service runs an asyncio event loop in one background thread.
+Requests from the session threads go into a queue. The first request
+in the queue starts a short window (get_batch_window_s()) and every
+request that arrives in that window joins the same batch. The batch is
+looked up with one lookup_results() call per model type, with any
+repeated patients only looked up once, and each caller gets a
+ResultsTable of just its own rows. Each ResultsTable has its own copy
+of its rows so that a cached table doesn't keep the whole batch in
+memory.
+
+The service is used by results_cache.run_all_mrs() on a cache miss.
+Set the window with the environment variable LIFETIME_BATCH_WINDOW_MS.
+A window of 0 turns the service off and each session looks up its
+own results as before.
+
+metrics() gives the current queue depth, a histogram of the number of
+requests in each batch and how long requests waited for their batch
+to start.
+"""
+# Imports:
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+
+import numpy as np
+
+# Precomputed results for every patient:
+import utilities_lifetime.results_grid as results_grid
+# Results with the values by year kept in 2D arrays:
+from utilities_lifetime.results_table import ResultsTable
+
+# How long to wait for more requests after the first one if
+# LIFETIME_BATCH_WINDOW_MS isn't set or isn't usable:
+default_batch_window_ms = 3.0
+# Set this to use a window in seconds instead of the environment
+# variable, e.g. in benchmarks:
+batch_window_s = None
+# Start the batch early if this many requests are waiting:
+max_batch_requests = 256
+# Give up on a request after this long:
+request_timeout_s = 60.0
+# Upper edges of the bins of the batch size histogram:
+batch_size_bins = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+# Number of recent requests to keep wait times for:
+wait_time_samples = 1000
+
+# The event loop, its thread and the request queue:
+loop = None
+thread = None
+queue = None
+start_lock = threading.Lock()
+
+# Counters for metrics():
+metrics_lock = threading.Lock()
+counters = None
+
+
+# #####################################################################
+# ############################## Service ##############################
+# #####################################################################
+
+def get_batch_window_s():
+    """
+    Find how long to wait for more requests after the first one.
+
+    This is read when it's needed rather than when this file is
+    imported, so a bad value of LIFETIME_BATCH_WINDOW_MS can't stop
+    the app from starting.
+
+    Returns:
+    --------
+    float. batch_window_s if it has been set. Otherwise
+    LIFETIME_BATCH_WINDOW_MS in seconds if it is a number that isn't
+    negative, or else default_batch_window_ms in seconds.
+    """
+    if batch_window_s is not None:
+        return batch_window_s
+    try:
+        window_ms = float(os.environ.get(
+            'LIFETIME_BATCH_WINDOW_MS', default_batch_window_ms))
+    except ValueError:
+        window_ms = default_batch_window_ms
+    if not (np.isfinite(window_ms) and window_ms >= 0.0):
+        window_ms = default_batch_window_ms
+    return window_ms / 1000.0
+
+
+def is_enabled():
+    """Whether run_all_mrs() should send its lookups to the service."""
+    return get_batch_window_s() > 0.0
+
+
+def start():
+    """
+    Start the event loop thread if it isn't already running.
+
+    Every session shares the same thread and queue.
+    """
+    global loop, thread, queue
+    with start_lock:
+        if thread is not None and thread.is_alive():
+            return
+        loop = asyncio.new_event_loop()
+        # The lookups run in one separate thread so that the event loop
+        # can keep queueing requests in the meantime:
+        loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        ready = threading.Event()
+
+        def run_loop():
+            global queue
+            asyncio.set_event_loop(loop)
+            queue = asyncio.Queue()
+            loop.create_task(collect_batches())
+            ready.set()
+            loop.run_forever()
+            # Let the waiting tasks finish before the loop is closed:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+        thread = threading.Thread(
+            target=run_loop, name='lifetime-model-service', daemon=True)
+        thread.start()
+        ready.wait()
+
+
+def stop():
+    """Stop the event loop thread. start() makes a new one."""
+    global loop, thread, queue
+    with start_lock:
+        if thread is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop = None
+        thread = None
+        queue = None
+
+
+atexit.register(stop)
+
+
+def request_table(
+        age: float,
+        sex: int,
+        mrs_to_run: tuple,
+        model_input_str: str
+        ):
+    """
+    Look up the results for one patient and every mRS score in a batch.
+
+    Call this from a session thread. It waits until the batch that the
+    request joins has been looked up.
+
+    Inputs:
+    -------
+    age             - float or int. Patient's age in years.
+    sex             - int. Patient's sex, 0 for female and 1 for male.
+    mrs_to_run      - tuple. The mRS scores to look up results for.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+
+    Returns:
+    --------
+    results - ResultsTable. The same results as from
+              results_grid.lookup_table(), one row per mRS score.
+    """
+    start()
+    future = asyncio.run_coroutine_threadsafe(
+        request(age, sex, tuple(mrs_to_run), model_input_str), loop)
+    return future.result(timeout=request_timeout_s)
+
+
+async def request(
+        age: float,
+        sex: int,
+        mrs_to_run: tuple,
+        model_input_str: str
+        ):
+    """
+    Queue a lookup and wait for its batch. Runs in the event loop.
+
+    Inputs:
+    -------
+    The same as request_table().
+
+    Returns:
+    --------
+    results - ResultsTable. This request's rows.
+    """
+    future = asyncio.get_running_loop().create_future()
+    key = (float(age), int(sex), tuple(mrs_to_run), model_input_str)
+    await queue.put((key, future, time.perf_counter()))
+    with metrics_lock:
+        counters['max_queue_depth'] = max(
+            counters['max_queue_depth'], queue.qsize())
+    return await future
+
+
+async def collect_batches():
+    """
+    Take requests from the queue in batches and look them up.
+
+    Runs in the event loop for as long as the service is running.
+    """
+    event_loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        # Wait a short time for more requests to join this batch:
+        deadline = event_loop.time() + get_batch_window_s()
+        while len(batch) < max_batch_requests:
+            timeout = deadline - event_loop.time()
+            if timeout <= 0.0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        keys = [key for key, future, queued in batch]
+        start_time = time.perf_counter()
+        try:
+            tables = await event_loop.run_in_executor(
+                None, evaluate_batch, keys)
+        except Exception as error:
+            for key, future, queued in batch:
+                if not future.done():
+                    future.set_exception(error)
+            continue
+        record_batch(batch, len(tables), start_time)
+        for key, future, queued in batch:
+            # The caller might have given up already:
+            if not future.done():
+                future.set_result(tables[key])
+
+
+def evaluate_batch(keys: list):
+    """
+    Look up the results for every request in a batch.
+
+    Inputs:
+    -------
+    keys - list. Contains (age, sex, mrs_to_run, model_input_str) for
+           each request. Repeated keys are only looked up once.
+
+    Returns:
+    --------
+    tables - dict. A ResultsTable for each different key.
+    """
+    # Keep the order of first appearance:
+    unique_keys = list(dict.fromkeys(keys))
+    tables = {}
+    for model_input_str in dict.fromkeys([key[3] for key in unique_keys]):
+        model_keys = [key for key in unique_keys if key[3] == model_input_str]
+        # One row for each mRS score of each request:
+        n_rows = [len(key[2]) for key in model_keys]
+        age = np.repeat([key[0] for key in model_keys], n_rows)
+        sex = np.repeat([key[1] for key in model_keys], n_rows)
+        mrs = np.concatenate([key[2] for key in model_keys]).astype(int)
+        results = results_grid.lookup_results(age, sex, mrs, model_input_str)
+
+        stops = np.cumsum(n_rows)
+        for key, start, stop in zip(model_keys, stops - n_rows, stops):
+            rows = {name: np.array(values[start:stop])
+                    for name, values in results.items()}
+            tables[key] = ResultsTable.from_results_arrays(
+                rows, model_input_str)
+    return tables
+
+
+# #####################################################################
+# ############################## Metrics ##############################
+# #####################################################################
+
+def metrics_reset():
+    """Reset every counter in metrics()."""
+    global counters
+    with metrics_lock:
+        counters = dict(
+            requests=0,
+            batches=0,
+            patients_looked_up=0,
+            max_queue_depth=0,
+            batch_sizes=np.zeros(len(batch_size_bins), dtype=int),
+            wait_times=collections.deque(maxlen=wait_time_samples),
+            lookup_time=0.0,
+            )
+
+
+metrics_reset()
+
+
+def record_batch(batch: list, n_unique: int, start_time: float):
+    """
+    Add a finished batch to the counters.
+
+    Inputs:
+    -------
+    batch      - list. Contains (key, future, time queued) for each
+                 request in the batch.
+    n_unique   - int. Number of different keys in the batch.
+    start_time - float. time.perf_counter() when the lookup started.
+    """
+    lookup_time = time.perf_counter() - start_time
+    with metrics_lock:
+        counters['requests'] += len(batch)
+        counters['batches'] += 1
+        counters['patients_looked_up'] += n_unique
+        counters['batch_sizes'][
+            np.searchsorted(batch_size_bins, len(batch))] += 1
+        counters['wait_times'].extend(
+            [start_time - queued for key, future, queued in batch])
+        counters['lookup_time'] += lookup_time
+
+
+def metrics():
+    """
+    Get the service's counters.
+
+    Returns:
+    --------
+    dict. Contains:
+        queue_depth           - requests waiting right now.
+        max_queue_depth       - most requests ever waiting at once.
+        requests              - requests answered.
+        batches               - batches looked up.
+        patients_looked_up    - different requests looked up. The rest
+                                were repeats within a batch.
+        mean_batch_size       - requests per batch.
+        batch_size_histogram  - number of batches for each range of
+                                batch sizes, e.g. "3-4".
+        wait_ms               - mean, p50, p95 and max time that the
+                                recent requests waited for their batch
+                                to start, in milliseconds.
+        mean_lookup_ms        - time to look up one batch.
+    """
+    with metrics_lock:
+        waits = np.array(counters['wait_times']) * 1000.0
+        lower_edges = [1] + [edge + 1 for edge in batch_size_bins[:-1]]
+        histogram = {
+            (f'{lower}' if lower == upper else f'{lower}-{upper}'): int(count)
+            for lower, upper, count in zip(
+                lower_edges, batch_size_bins, counters['batch_sizes'])
+            }
+        n_batches = max(counters['batches'], 1)
+        return dict(
+            queue_depth=queue.qsize() if queue is not None else 0,
+            max_queue_depth=counters['max_queue_depth'],
+            requests=counters['requests'],
+            batches=counters['batches'],
+            patients_looked_up=counters['patients_looked_up'],
+            mean_batch_size=counters['requests'] / n_batches,
+            batch_size_histogram=histogram,
+            wait_ms=dict(
+                mean=float(np.mean(waits)) if len(waits) else 0.0,
+                p50=float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                p95=float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                max=float(np.max(waits)) if len(waits) else 0.0,
+                ),
+            mean_lookup_ms=counters['lookup_time'] * 1000.0 / n_batches,
+            )
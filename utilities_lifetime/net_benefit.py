@@ -0,0 +1,115 @@
+"""
+Net benefit by change in outcome for every willingness-to-pay threshold.
+
+Net benefit is the QALYs valued at the willingness-to-pay (WTP)
+threshold plus any cost savings:
+    net benefit = WTP x change in QALYs + change in cost saved
+so for each change in outcome it's a straight line in WTP. The
+change-in-outcome tables of QALYs and cost savings are found once
+(see build_change_in_outcome() in main_calculations.py) and the
+tables for every threshold are then one broadcast multiply-and-add,
+without running the main calculations again.
+
+The break-even WTP of a change in outcome is where its line crosses
+zero, i.e. the cost per QALY gained.
+"""
+# Imports:
+import numpy as np
+
+# The change-in-outcome tables:
+import utilities_lifetime.main_calculations as calc
+
+# Default thresholds for the curves, in £ per QALY:
+wtp_min_gbp = 0.0
+wtp_max_gbp = 100000.0
+wtp_step_gbp = 500.0
+
+
+def wtp_grid(
+        wtp_point: float = None,
+        wtp_min: float = wtp_min_gbp,
+        wtp_max: float = wtp_max_gbp,
+        wtp_step: float = wtp_step_gbp
+        ):
+    """
+    Make an evenly spaced set of WTP thresholds.
+
+    Inputs:
+    -------
+    wtp_point - float or None. A threshold that must be in the grid,
+                e.g. the fixed wtp_qaly_gpb.
+    wtp_min   - float. Lowest threshold.
+    wtp_max   - float. Highest threshold.
+    wtp_step  - float. Gap between thresholds.
+
+    Returns:
+    --------
+    wtp_values - np.array. Sorted thresholds in £ per QALY.
+    """
+    wtp_values = np.arange(wtp_min, wtp_max + 0.5 * wtp_step, wtp_step)
+    if wtp_point is not None:
+        wtp_values = np.union1d(wtp_values, [float(wtp_point)])
+    return wtp_values
+
+
+def build_net_benefit_surface(qalys, total_discounted_cost, wtp_values):
+    """
+    Find the net benefit by change in outcome for many thresholds at once.
+
+    Inputs:
+    -------
+    qalys                 - list or array. Shape (..., k). Discounted
+                            QALYs for each of k outcomes.
+    total_discounted_cost - list or array. Shape (..., k). Discounted
+                            total cost for each outcome.
+    wtp_values            - list or array. Shape (n,). WTP thresholds.
+
+    Returns:
+    --------
+    surface - np.array. Shape (n, ..., k, k). surface[w] is the same
+              table as build_change_in_outcome() of the net benefit
+              with wtp_values[w] as the threshold.
+    mask    - np.array. Shape (k, k). True for the cells that are used.
+    """
+    table_qalys, mask = calc.build_change_in_outcome(qalys)
+    table_saved, mask = calc.build_change_in_outcome(
+        -np.asarray(total_discounted_cost, dtype=float))
+    wtp_values = np.asarray(wtp_values, dtype=float)
+    # Line up the thresholds with the leading axis:
+    wtp = wtp_values.reshape(-1, *[1] * table_qalys.ndim)
+    surface = wtp * table_qalys + table_saved
+    return surface, mask
+
+
+def find_break_even_wtp(qalys, total_discounted_cost):
+    """
+    Find the WTP threshold where each change in outcome breaks even.
+
+    Above this threshold a change that gains QALYs has a positive net
+    benefit. A break-even WTP of zero or less means that the change
+    saves money as well as gaining QALYs, so its net benefit is
+    positive at any threshold.
+
+    Inputs:
+    -------
+    qalys                 - list or array. Shape (..., k). Discounted
+                            QALYs for each of k outcomes.
+    total_discounted_cost - list or array. Shape (..., k). Discounted
+                            total cost for each outcome.
+
+    Returns:
+    --------
+    break_even - np.array. Shape (..., k, k). Change in cost divided by
+                 change in QALYs, in £ per QALY. NaN where the QALYs
+                 don't change.
+    gains      - np.array. Shape (..., k, k). True where the change in
+                 outcome gains QALYs, so net benefit rises with WTP.
+    mask       - np.array. Shape (k, k). True for the cells that are
+                 used.
+    """
+    table_qalys, mask = calc.build_change_in_outcome(qalys)
+    table_cost, mask = calc.build_change_in_outcome(total_discounted_cost)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        break_even = np.where(
+            table_qalys != 0.0, table_cost / table_qalys, np.nan)
+    return break_even, table_qalys > 0.0, mask
@@ -0,0 +1,266 @@
+"""
+Run the batch calculations for large cohorts across several processes.
+
+The cohort is split into one shard per worker with np.array_split.
+Each shard is calculated in a separate process and the results are
+joined back together in the original patient order. Every patient's
+results are calculated independently of the other patients in the
+batch calculations, so the results are identical to running the
+whole cohort in one process.
+
+The fixed parameters are sent to each worker once when the worker
+starts rather than with every shard. A pool of workers is kept for
+each number of workers and set of fixed parameters, so in the app
+there is one pool for each model type and switching between them
+doesn't restart the workers. The pools are shared by every thread
+(Streamlit sessions and the API) and are only stopped when the
+process exits, so no caller can lose a pool that it is using.
+
+Small cohorts are calculated in this process because starting the
+shards costs more than it saves.
+
+The number of workers defaults to the number of CPUs and can be set
+with the environment variable LIFETIME_WORKERS.
+"""
+# Imports:
+import atexit
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+
+# The main calculations for many patients at once:
+import utilities_lifetime.batch_calculations as batch_calc
+
+# Each worker needs at least this many patients to be worth using:
+min_patients_per_worker = 20000
+
+# The pools of workers, one for each (workers, fixed params checksum):
+pools = {}
+pools_lock = threading.Lock()
+
+# Set in each worker process by initialise_worker():
+worker_fixed_params = None
+
+
+# #####################################################################
+# ############################## Workers ##############################
+# #####################################################################
+
+def get_default_workers():
+    """
+    Find the number of processes to use.
+
+    This is read when it's needed rather than when this file is
+    imported, so a bad value of LIFETIME_WORKERS can't stop the app
+    from starting.
+
+    Returns:
+    --------
+    int. LIFETIME_WORKERS if it is a whole number above zero,
+    otherwise the number of CPUs.
+    """
+    try:
+        workers = int(os.environ.get('LIFETIME_WORKERS', ''))
+    except ValueError:
+        workers = 0
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def initialise_worker(fixed_params: dict):
+    """
+    Store the fixed parameters in a new worker process.
+
+    Inputs:
+    -------
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+    """
+    global worker_fixed_params
+    worker_fixed_params = fixed_params
+
+
+def calculate_shard(age, sex, mrs):
+    """
+    Calculate the results arrays for one shard in a worker process.
+
+    Inputs:
+    -------
+    age - np.array. Patients' ages in years.
+    sex - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs - np.array. Patients' mRS scores from 0 to 5.
+
+    Returns:
+    --------
+    results - dict. Same format as from calculate_results_arrays().
+    """
+    return batch_calc.calculate_results_arrays(
+        age, sex, mrs, worker_fixed_params)
+
+
+def get_pool(workers: int, fixed_params: dict):
+    """
+    Get a pool of worker processes that have these fixed parameters.
+
+    Inputs:
+    -------
+    workers      - int. Number of processes.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+
+    Returns:
+    --------
+    pool - concurrent.futures.ProcessPoolExecutor. Shared with any
+           other caller with the same workers and fixed parameters.
+    """
+    key = (workers, batch_calc.fixed_params_checksum(fixed_params))
+    with pools_lock:
+        if key not in pools:
+            pools[key] = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=initialise_worker,
+                initargs=(fixed_params,)
+                )
+        return pools[key]
+
+
+def shutdown_pools():
+    """Stop the worker processes of every pool when the process exits."""
+    with pools_lock:
+        for pool in pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+        pools.clear()
+
+
+atexit.register(shutdown_pools)
+
+
+# #####################################################################
+# ############################ Calculations ###########################
+# #####################################################################
+
+def main_calculations_parallel(
+        age,
+        sex,
+        mrs,
+        fixed_params: dict,
+        model_type_str: str,
+        sex_label=None,
+        workers: int = None
+        ):
+    """
+    Calculates everything useful for lifetime outcomes for a cohort.
+
+    Same as main_calculations_batch() but split across processes.
+
+    Inputs:
+    -------
+    age            - float or array. Patients' ages in years.
+    sex            - int or array. Patients' sex, 0 for female and
+                     1 for male.
+    mrs            - int or array. Patients' mRS scores from 0 to 5.
+    fixed_params   - dict. Contains fixed parameters independent
+                     of the model results.
+    model_type_str - str. Separate "mRS" or "Dichotomous" model.
+    sex_label      - str or array. Either "Male" or "Female". If this
+                     is not given, it is worked out from sex.
+    workers        - int. Largest number of processes to use.
+                     Default get_default_workers().
+
+    Returns:
+    --------
+    df - pd.DataFrame. All of the useful results, one row per patient.
+    """
+    results = calculate_results_arrays_parallel(
+        age, sex, mrs, fixed_params, workers)
+    df = batch_calc.build_results_dataframe(
+        results, model_type_str, sex_label)
+    return df
+
+
+def calculate_results_arrays_parallel(
+        age,
+        sex,
+        mrs,
+        fixed_params: dict,
+        workers: int = None
+        ):
+    """
+    Calculate all of the lifetime outcomes as arrays across processes.
+
+    The fixed parameters must be shared by every patient, i.e. without
+    the extra patient axis that calculate_results_arrays() allows.
+
+    Inputs:
+    -------
+    age          - float or array. Patients' ages in years.
+    sex          - int or array. Patients' sex, 0 for female and
+                   1 for male.
+    mrs          - int or array. Patients' mRS scores from 0 to 5.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+    workers      - int. Largest number of processes to use.
+                   Default get_default_workers().
+
+    Returns:
+    --------
+    results - dict. Same as from calculate_results_arrays() for the
+              whole cohort at once.
+    """
+    # Copy the broadcast views so the inputs own their memory. numpy
+    # warns when the writeable flag of a broadcast view is used.
+    age, sex, mrs = [np.array(x) for x in np.broadcast_arrays(
+        np.atleast_1d(np.asarray(age, dtype=float)),
+        np.atleast_1d(np.asarray(sex, dtype=int)),
+        np.atleast_1d(np.asarray(mrs, dtype=int))
+        )]
+    workers = get_default_workers() if workers is None else workers
+    n_shards = min(workers, len(age) // min_patients_per_worker)
+    if n_shards <= 1:
+        return batch_calc.calculate_results_arrays(
+            age, sex, mrs, fixed_params)
+
+    executor = get_pool(workers, fixed_params)
+    # Executor.map returns the shards in the order they were given:
+    shards = executor.map(
+        calculate_shard,
+        np.array_split(age, n_shards),
+        np.array_split(sex, n_shards),
+        np.array_split(mrs, n_shards)
+        )
+    results = concatenate_results(list(shards))
+    return results
+
+
+def concatenate_results(parts: list):
+    """
+    Join results arrays for consecutive groups of patients.
+
+    Inputs:
+    -------
+    parts - list of dict. Outputs from calculate_results_arrays().
+
+    Returns:
+    --------
+    results - dict. The results for all patients in order. The values
+              by year are padded with NaN to the longest list of any
+              group, which is the same padding as when all patients
+              are calculated together.
+    """
+    results = {}
+    for key in parts[0].keys():
+        values = [np.asarray(part[key]) for part in parts]
+        if values[0].ndim > 1:
+            width = max([value.shape[1] for value in values])
+            values = [
+                np.pad(
+                    value.astype(float),
+                    ((0, 0), (0, width - value.shape[1])),
+                    constant_values=np.nan
+                    )
+                if value.shape[1] < width else value
+                for value in values
+                ]
+        results[key] = np.concatenate(values)
+    return results
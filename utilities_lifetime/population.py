@@ -0,0 +1,327 @@
+"""
+Lifetime burden of stroke for a population.
+
+The population is a table with one row per person (microdata) or one
+row per group of people with a weight column giving how many people
+are in the group (a histogram). Each row needs:
+    age    - years, from 45 to 90.
+    sex    - 0 or "Female", 1 or "Male".
+    mrs    - mRS score at discharge from 0 to 5.
+    weight - optional. Number of people. 1 if there is no weight column.
+and may have other columns to break the results down by, e.g. region.
+
+Many people share the same model inputs, so the rows are first
+collapsed to the distinct combinations of age, sex and mRS and only
+those are looked up (see results_grid.py), all at once. The results
+are then weighted by the number of people with each combination.
+So the model work depends on the number of distinct inputs rather
+than the size of the population. Ages can be rounded to age_step
+years first to reduce the number of distinct inputs for microdata
+with exact ages.
+
+Run from the command line with the population in a .csv file:
+    python -m utilities_lifetime.population --input population.csv \
+        --model-type mRS --strata region sex_label --output burden.csv
+"""
+# Imports:
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Labels used in the results:
+import utilities_lifetime.cohort as cohort
+# Precomputed results for every patient:
+import utilities_lifetime.results_grid as results_grid
+
+# Results to add up over the population:
+burden_columns = [
+    'qalys_total',
+    'ae_discounted_cost',
+    'nel_discounted_cost',
+    'el_discounted_cost',
+    'care_years_discounted_cost',
+    'total_discounted_cost',
+    'net_benefit',
+]
+# Strata that come from the model inputs rather than the population:
+input_strata = ['age_band', 'sex_label', 'mrs', 'outcome_type']
+# Columns that can't be strata, and what to use instead:
+excluded_strata = dict(age='age_band', sex='sex_label', weight=None)
+# Default edges of the age bands:
+default_age_bands = [45, 55, 65, 75, 85, 90]
+
+
+# #####################################################################
+# ############################ Population #############################
+# #####################################################################
+
+def prepare_population(
+        population: pd.DataFrame,
+        weight_column: str = 'weight',
+        age_step: float = None
+        ):
+    """
+    Check the population table and put it in a standard form.
+
+    Inputs:
+    -------
+    population    - pd.DataFrame. Columns age, sex, mrs and optionally
+                    weight_column and any other columns.
+    weight_column - str. Column with the number of people in each row.
+    age_step      - float or None. Round ages to this many years.
+
+    Returns:
+    --------
+    df - pd.DataFrame. Copy of the population with age as float, sex
+         as 0 or 1, mrs as int and weight as float.
+    """
+    missing = [c for c in ['age', 'sex', 'mrs'] if c not in population]
+    if len(missing) > 0:
+        raise ValueError(f'The population needs columns: {", ".join(missing)}')
+    df = population.copy()
+
+    sex = df['sex']
+    if sex.dtype == object or isinstance(sex.dtype, pd.CategoricalDtype):
+        # Labels, numbers or a mix of the two:
+        sex = sex.astype(object)
+        labels = sex.astype(str).str.strip().str.capitalize().map(
+            {label: i for i, label in enumerate(cohort.sex_labels)})
+        # Anything that isn't a label should be a number. Anything
+        # else becomes NaN and is caught by the check below.
+        sex = labels.fillna(pd.to_numeric(sex, errors='coerce'))
+    try:
+        df['age'] = pd.to_numeric(df['age']).astype(float)
+        df['sex'] = pd.to_numeric(sex).astype(float)
+        df['mrs'] = pd.to_numeric(df['mrs']).astype(float)
+        weight = (df[weight_column] if weight_column in df
+                  else pd.Series(1.0, index=df.index))
+        df['weight'] = pd.to_numeric(weight).astype(float)
+    except (ValueError, TypeError):
+        raise ValueError('age, sex, mrs and weight must be numbers')
+
+    if age_step is not None:
+        df['age'] = np.round(df['age'] / age_step) * age_step
+    if not df['age'].between(
+            results_grid.grid_age_min, results_grid.grid_age_max).all():
+        raise ValueError(
+            f'Every age must be from {results_grid.grid_age_min:g} ' +
+            f'to {results_grid.grid_age_max:g}')
+    if not df['sex'].isin(results_grid.grid_sexes).all():
+        raise ValueError('sex must be 0 or "Female", 1 or "Male"')
+    if not df['mrs'].isin(results_grid.grid_mrs).all():
+        raise ValueError('mrs must be a whole number from 0 to 5')
+    if not (np.isfinite(df['weight']).all() and (df['weight'] >= 0).all()):
+        raise ValueError('Every weight must be a number that isn\'t negative')
+
+    df['sex'] = df['sex'].astype(int)
+    df['mrs'] = df['mrs'].astype(int)
+    return df
+
+
+def label_inputs(df: pd.DataFrame, age_bands: list = default_age_bands):
+    """
+    Add the strata that come from the model inputs.
+
+    Inputs:
+    -------
+    df        - pd.DataFrame. Columns age, sex (0 or 1) and mrs.
+    age_bands - list. Edges of the age bands. Each band includes its
+                lower edge and the last band also includes its upper
+                edge.
+
+    Returns:
+    --------
+    df - pd.DataFrame. The same with extra columns sex_label,
+         outcome_type and age_band.
+    """
+    df['sex_label'] = pd.Categorical.from_codes(
+        df['sex'], categories=cohort.sex_labels)
+    df['outcome_type'] = pd.Categorical.from_codes(
+        (df['mrs'] > 2).astype(int), categories=cohort.outcome_types)
+    edges = np.asarray(age_bands, dtype=float)
+    band = np.clip(
+        np.searchsorted(edges, df['age'], side='right') - 1,
+        0, len(edges) - 2)
+    df['age_band'] = pd.Categorical.from_codes(band, categories=[
+        f'{lower:g} to {upper:g}' for lower, upper in zip(edges, edges[1:])])
+    return df
+
+
+def deduplicate(df: pd.DataFrame, strata: list = ()):
+    """
+    Collapse the population to distinct model inputs within each stratum.
+
+    Inputs:
+    -------
+    df     - pd.DataFrame. Output from prepare_population().
+    strata - list. Columns of the population to keep separate,
+             e.g. ['region'].
+
+    Returns:
+    --------
+    df_groups - pd.DataFrame. One row per stratum and distinct input
+                with columns from strata, age, sex, mrs and the summed
+                weight.
+    df_inputs - pd.DataFrame. One row per distinct age, sex and mRS.
+    codes     - np.array. Row of df_inputs for each row of df_groups.
+    """
+    inputs = ['age', 'sex', 'mrs']
+    # Keep rows with a blank stratum so they're still counted:
+    df_groups = df.groupby(
+        [*strata, *inputs], observed=True, sort=False, dropna=False)[
+        'weight'].sum().reset_index()
+    # Both in order of first appearance:
+    codes = df_groups.groupby(inputs, sort=False).ngroup().to_numpy()
+    df_inputs = df_groups[inputs].drop_duplicates().reset_index(drop=True)
+    return df_groups, df_inputs, codes
+
+
+# #####################################################################
+# ############################### Burden ##############################
+# #####################################################################
+
+def population_burden(
+        population: pd.DataFrame,
+        model_input_str: str = 'mRS',
+        strata: list = ('sex_label', 'mrs'),
+        weight_column: str = 'weight',
+        age_step: float = None,
+        age_bands: list = default_age_bands,
+        columns: list = burden_columns
+        ):
+    """
+    Find the weighted lifetime results for a population.
+
+    Inputs:
+    -------
+    population      - pd.DataFrame. See the top of this file.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    strata          - list. Columns to break the results down by. Any
+                      of input_strata or columns of population other
+                      than age, sex and the weight. Rows with a blank
+                      stratum are kept in their own stratum.
+    weight_column   - str. Column with the number of people in each row.
+    age_step        - float or None. Round ages to this many years.
+    age_bands       - list. Edges of the age bands for "age_band".
+    columns         - list. Names of the results to add up.
+
+    Returns:
+    --------
+    burden - dict. Contains:
+        totals    - pd.DataFrame. One row with the number of people
+                    and for each result the total and the mean per
+                    person, e.g. qalys_total_total, qalys_total_mean.
+        strata    - pd.DataFrame. The same for each stratum.
+        n_inputs  - int. Number of distinct inputs that were looked up.
+        n_rows    - int. Number of rows in the population table.
+    """
+    strata = list(strata)
+    for stratum in strata:
+        if stratum in excluded_strata or stratum == weight_column:
+            message = f'{stratum} can\'t be used to split the results'
+            if excluded_strata.get(stratum) is not None:
+                message += f'. Use {excluded_strata[stratum]} instead'
+            raise ValueError(message)
+    unknown = [s for s in strata
+               if s not in input_strata and s not in population]
+    if len(unknown) > 0:
+        raise ValueError(f'Unknown strata: {", ".join(unknown)}')
+    df = prepare_population(population, weight_column, age_step)
+    df_groups, df_inputs, codes = deduplicate(
+        df, [s for s in strata if s not in input_strata])
+
+    # Look up every distinct input at once:
+    results = results_grid.lookup_table(
+        df_inputs['age'].to_numpy(dtype=float),
+        df_inputs['sex'].to_numpy(dtype=int),
+        df_inputs['mrs'].to_numpy(dtype=int),
+        model_input_str
+        )
+    weight = df_groups['weight'].to_numpy()
+    df_weighted = df_groups.copy()
+    for column in columns:
+        df_weighted[column] = results.scalar_arrays[column][codes] * weight
+    # Labels for the strata that come from the inputs:
+    df_weighted = label_inputs(df_weighted, age_bands)
+
+    def summarise(df_sums):
+        df_summary = pd.DataFrame(dict(people=df_sums['weight']))
+        for column in columns:
+            df_summary[f'{column}_total'] = df_sums[column]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df_summary[f'{column}_mean'] = (
+                    df_sums[column] / df_sums['weight'])
+        return df_summary
+
+    df_totals = summarise(
+        df_weighted[['weight', *columns]].sum().to_frame().T)
+    if len(strata) > 0:
+        df_strata = summarise(df_weighted.groupby(
+            strata, observed=True, dropna=False)[
+            ['weight', *columns]].sum()).reset_index()
+    else:
+        df_strata = df_totals.copy()
+    return dict(
+        totals=df_totals.reset_index(drop=True),
+        strata=df_strata,
+        n_inputs=len(df_inputs),
+        n_rows=len(population),
+        )
+
+
+def main(argv=None):
+    """
+    Find the burden of a population from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 0 if everything worked.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m utilities_lifetime.population',
+        description='Lifetime burden of stroke for a population.'
+        )
+    parser.add_argument(
+        '--input', required=True, metavar='FILE',
+        help='.csv file with columns age, sex, mrs and optionally weight.')
+    parser.add_argument(
+        '--model-type', choices=['mRS', 'Dichotomous'], default='mRS',
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--strata', nargs='*', default=['sex_label', 'mrs'],
+        help='Columns to break the results down by. Default: %(default)s.')
+    parser.add_argument(
+        '--weight-column', default='weight', help='Default: %(default)s.')
+    parser.add_argument(
+        '--age-step', type=float,
+        help='Round ages to this many years. Default: no rounding.')
+    parser.add_argument(
+        '--output', metavar='FILE',
+        help='Save the breakdown by strata to this .csv file.')
+    args = parser.parse_args(argv)
+
+    population = pd.read_csv(args.input)
+    start = time.perf_counter()
+    burden = population_burden(
+        population, args.model_type, args.strata, args.weight_column,
+        args.age_step)
+    print(f'Looked up {burden["n_inputs"]} distinct inputs for ' +
+          f'{burden["n_rows"]} rows in ' +
+          f'{time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+    print(burden['totals'].T.to_string(header=False))
+    print(burden['strata'].to_string(index=False))
+    if args.output:
+        burden['strata'].to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
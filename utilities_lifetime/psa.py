@@ -0,0 +1,410 @@
+"""
+Probabilistic sensitivity analysis (PSA).
+
+The app normally runs with the point estimates of the fixed
+parameters. For PSA, chosen parameters are instead drawn many times
+from probability distributions and the model is run once per draw.
+The spread of the results shows how uncertain they are.
+
+Each draw is treated as a separate patient in the batch calculations
+with its own copy of the sampled parameters, so thousands of draws for
+every mRS score run in a few array operations.
+
+The distributions are given as a dictionary, e.g.
+    distributions = {
+        'gz_gamma': dict(distribution='lognormal', sd=0.00002),
+        'lg_coeffs': dict(distribution='normal', sd=[0.01] * 9),
+        'utility_list': dict(distribution='beta', sd=0.02),
+        'cost_ae_gbp': dict(distribution='gamma', sd=20.0),
+        'wtp_qaly_gpb': dict(
+            distribution='uniform', low=20000, high=30000),
+    }
+The mean of each distribution is the point estimate from
+get_fixed_params() unless "mean" is given. For list parameters like
+lg_coeffs, sd can be one value for every item or one value per item.
+Available distributions:
+    normal    - mean, sd. Each item drawn separately.
+    mvnormal  - mean, cov. Items drawn together with covariance cov.
+    lognormal - mean, sd of the value itself. Mean must be positive.
+    gamma     - mean, sd. Mean must be positive.
+    beta      - mean, sd. Mean must be between 0 and 1.
+    uniform   - low, high.
+
+The random draws for each parameter come from a separate stream that
+depends only on the seed and the parameter name. So a run with the same
+seed gives the same results, and adding a parameter to the analysis
+doesn't change the draws of the others.
+
+Run from the command line with the distributions in a JSON file:
+    python -m utilities_lifetime.psa --distributions psa.json \
+        --age 72 --sex 1 --draws 10000 --seed 42
+"""
+# Imports:
+import argparse
+import json
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# The main calculations for many patients at once:
+import utilities_lifetime.batch_calculations as batch_calc
+# Which mRS scores to run for each model type:
+from utilities_lifetime.cohort import mrs_to_run_for_model
+# Function to import fixed params for either mRS or dicho model:
+from stroke_lifetime.fixed_params import get_fixed_params
+
+# Fixed parameters that can be sampled:
+psa_parameters = [
+    'lg_coeffs', 'lg_mean_ages', 'gz_coeffs', 'gz_gamma', 'gz_mean_age',
+    'ae_coeffs', 'ae_mRS', 'nel_coeffs', 'nel_mRS', 'el_coeffs', 'el_mRS',
+    'utility_list', 'qaly_age_coeff', 'qaly_age2_coeff', 'qaly_sex_coeff',
+    'perc_care_home_over70', 'perc_care_home_not_over70',
+    'cost_ae_gbp', 'cost_elective_bed_day_gbp',
+    'cost_non_elective_bed_day_gbp', 'cost_residential_day_gbp',
+    'discount_factor_QALYs_perc', 'wtp_qaly_gpb',
+]
+# Results to keep for each draw:
+psa_results = [
+    'survival_median_years',
+    'life_expectancy',
+    'qalys_total',
+    'ae_discounted_cost',
+    'nel_discounted_cost',
+    'el_discounted_cost',
+    'care_years_discounted_cost',
+    'total_discounted_cost',
+    'net_benefit',
+]
+
+
+# #####################################################################
+# ############################# Sampling ##############################
+# #####################################################################
+
+def make_rng(seed: int, parameter: str):
+    """
+    Make the random number generator for one parameter.
+
+    Inputs:
+    -------
+    seed      - int. Seed for the whole analysis.
+    parameter - str. Name of the parameter.
+
+    Returns:
+    --------
+    np.random.Generator. Depends only on the seed and the name.
+    """
+    sequence = np.random.SeedSequence(
+        entropy=seed, spawn_key=(zlib.crc32(parameter.encode()),))
+    return np.random.default_rng(sequence)
+
+
+def sample_distribution(spec: dict, point_estimate, n_draws: int, rng):
+    """
+    Draw values for one parameter.
+
+    Inputs:
+    -------
+    spec           - dict. The distribution name and its settings.
+                     See the top of this file.
+    point_estimate - float or np.array. Used as the mean if spec has
+                     no mean.
+    n_draws        - int. Number of draws.
+    rng            - np.random.Generator. Source of random numbers.
+
+    Returns:
+    --------
+    draws - np.array. Shape (n_draws, *shape of the point estimate).
+    """
+    shape = np.shape(point_estimate)
+    size = (n_draws, *shape)
+    distribution = spec['distribution']
+    mean = np.asarray(spec.get('mean', point_estimate), dtype=float)
+
+    if distribution == 'normal':
+        draws = rng.normal(mean, np.asarray(spec['sd'], dtype=float), size)
+    elif distribution == 'mvnormal':
+        draws = rng.multivariate_normal(
+            np.ravel(mean), np.asarray(spec['cov'], dtype=float), n_draws)
+    elif distribution == 'lognormal':
+        sd = np.asarray(spec['sd'], dtype=float)
+        if np.any(mean <= 0.0):
+            raise ValueError('A lognormal distribution needs a positive mean.')
+        # Convert the mean and sd of the value into those of its log:
+        sigma2 = np.log1p(sd**2.0 / mean**2.0)
+        draws = rng.lognormal(np.log(mean) - 0.5 * sigma2, np.sqrt(sigma2),
+                              size)
+    elif distribution == 'gamma':
+        sd = np.asarray(spec['sd'], dtype=float)
+        if np.any(mean <= 0.0):
+            raise ValueError('A gamma distribution needs a positive mean.')
+        draws = rng.gamma(mean**2.0 / sd**2.0, sd**2.0 / mean, size)
+    elif distribution == 'beta':
+        sd = np.asarray(spec['sd'], dtype=float)
+        if np.any(sd**2.0 >= mean * (1.0 - mean)):
+            raise ValueError(
+                'A beta distribution needs a mean between 0 and 1 ' +
+                'and sd**2 < mean * (1 - mean).')
+        common = mean * (1.0 - mean) / sd**2.0 - 1.0
+        draws = rng.beta(mean * common, (1.0 - mean) * common, size)
+    elif distribution == 'uniform':
+        draws = rng.uniform(spec['low'], spec['high'], size)
+    else:
+        raise ValueError(f'Unknown distribution: {distribution}')
+    return np.reshape(draws, size)
+
+
+def sample_parameters(
+        distributions: dict,
+        n_draws: int,
+        seed: int,
+        model_input_str: str
+        ):
+    """
+    Draw values for every parameter in the analysis.
+
+    Inputs:
+    -------
+    distributions   - dict. Distribution for each sampled parameter.
+    n_draws         - int. Number of draws.
+    seed            - int. Seed for the random number generators.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+
+    Returns:
+    --------
+    samples - dict. For each sampled parameter, an array with one row
+              per draw.
+    """
+    fixed_params = get_fixed_params(model_input_str)
+    samples = {}
+    for parameter, spec in distributions.items():
+        if parameter not in psa_parameters:
+            raise ValueError(
+                f'{parameter} can\'t be sampled. ' +
+                f'Choose from: {", ".join(psa_parameters)}')
+        samples[parameter] = sample_distribution(
+            spec,
+            np.asarray(fixed_params[parameter], dtype=float),
+            n_draws,
+            make_rng(seed, parameter)
+            )
+    return samples
+
+
+# #####################################################################
+# ############################ Calculations ###########################
+# #####################################################################
+
+def run_psa(
+        age: float,
+        sex: int,
+        distributions: dict,
+        n_draws: int = 1000,
+        seed: int = 42,
+        model_input_str: str = 'mRS',
+        batch_draws: int = 2000
+        ):
+    """
+    Run the model for every draw and every mRS score for one patient.
+
+    Inputs:
+    -------
+    age             - float. Patient's age in years.
+    sex             - int. Patient's sex, 0 for female and 1 for male.
+    distributions   - dict. Distribution for each sampled parameter.
+    n_draws         - int. Number of draws.
+    seed            - int. Seed for the random number generators.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    batch_draws     - int. Number of draws to calculate at once for
+                      each mRS score. Limits the memory used by the
+                      values by year.
+
+    Returns:
+    --------
+    df_draws - pd.DataFrame. One row per draw and mRS score with
+               columns draw, mrs and the psa_results.
+    """
+    fixed_params = get_fixed_params(model_input_str)
+    samples = sample_parameters(distributions, n_draws, seed, model_input_str)
+    mrs_to_run = np.array(mrs_to_run_for_model(model_input_str))
+    n_mrs = len(mrs_to_run)
+
+    parts = []
+    for start in range(0, n_draws, batch_draws):
+        stop = min(start + batch_draws, n_draws)
+        n_batch = stop - start
+        # Rows are ordered by mRS first and then by draw. Every mRS
+        # score gets the same set of draws.
+        params = dict(fixed_params)
+        for parameter, draws in samples.items():
+            params[parameter] = np.tile(
+                draws[start:stop], (n_mrs, *[1] * (draws.ndim - 1)))
+        results = batch_calc.calculate_results_arrays(
+            np.full(n_mrs * n_batch, float(age)),
+            np.full(n_mrs * n_batch, int(sex)),
+            np.repeat(mrs_to_run, n_batch),
+            params
+            )
+        part = pd.DataFrame({key: results[key] for key in psa_results})
+        part.insert(0, 'mrs', results['mrs'])
+        part.insert(0, 'draw', np.tile(np.arange(start, stop), n_mrs))
+        parts.append(part)
+
+    df_draws = pd.concat(parts).sort_values(
+        ['mrs', 'draw'], kind='stable').reset_index(drop=True)
+    return df_draws
+
+
+# #####################################################################
+# ############################## Summary ##############################
+# #####################################################################
+
+def summarise_draws(df_draws: pd.DataFrame, interval: float = 0.95):
+    """
+    Find the mean and credible interval of each result.
+
+    Inputs:
+    -------
+    df_draws - pd.DataFrame. Output from run_psa().
+    interval - float. Width of the credible interval, e.g. 0.95 for
+               the 2.5% and 97.5% percentiles.
+
+    Returns:
+    --------
+    df_summary - pd.DataFrame. One row per mRS and result with the
+                 columns mean, lower and upper.
+    """
+    grouped = df_draws.groupby('mrs')[psa_results]
+    df_summary = pd.concat(dict(
+        mean=grouped.mean().stack(),
+        lower=grouped.quantile(0.5 * (1.0 - interval)).stack(),
+        upper=grouped.quantile(0.5 * (1.0 + interval)).stack(),
+        ), axis=1)
+    df_summary.index.names = ['mrs', 'result']
+    return df_summary.reset_index()
+
+
+def acceptability_curves(df_draws: pd.DataFrame, wtp_values):
+    """
+    Find cost-effectiveness acceptability curves for changes in mRS.
+
+    For each change from a worse mRS score to a better one, the net
+    benefit of the change at a willingness to pay of wtp per QALY is
+        wtp * (change in QALYs) - (change in costs).
+    The curve is the proportion of draws where this is positive,
+    i.e. the chance that the better outcome is cost-effective.
+
+    Inputs:
+    -------
+    df_draws   - pd.DataFrame. Output from run_psa().
+    wtp_values - list or np.array. Willingness to pay per QALY in GBP.
+
+    Returns:
+    --------
+    df_ceac - pd.DataFrame. One row per willingness to pay and one
+              column per change in mRS, e.g. "mRS 4 to 1".
+    """
+    qalys = df_draws.pivot(index='draw', columns='mrs', values='qalys_total')
+    costs = df_draws.pivot(
+        index='draw', columns='mrs', values='total_discounted_cost')
+    mrs_scores = list(qalys.columns)
+    pairs = [
+        (mrs_from, mrs_to) for mrs_from in mrs_scores
+        for mrs_to in mrs_scores if mrs_to < mrs_from
+        ]
+    # Change in QALYs and costs with shape (pairs, draws):
+    qalys_gained = np.array([
+        qalys[mrs_to].to_numpy() - qalys[mrs_from].to_numpy()
+        for mrs_from, mrs_to in pairs
+        ])
+    extra_costs = np.array([
+        costs[mrs_to].to_numpy() - costs[mrs_from].to_numpy()
+        for mrs_from, mrs_to in pairs
+        ])
+
+    wtp_values = np.asarray(wtp_values, dtype=float)
+    net_benefit = (
+        wtp_values[:, None, None] * qalys_gained[None, :, :] -
+        extra_costs[None, :, :]
+        )
+    df_ceac = pd.DataFrame(
+        np.mean(net_benefit > 0.0, axis=2),
+        index=pd.Index(wtp_values, name='wtp_qaly_gpb'),
+        columns=[f'mRS {mrs_from} to {mrs_to}' for mrs_from, mrs_to in pairs]
+        )
+    return df_ceac
+
+
+# #####################################################################
+# ########################### Command line ############################
+# #####################################################################
+
+def main(argv=None):
+    """
+    Run a PSA from the command line and print a summary.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 0 if everything worked.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m utilities_lifetime.psa',
+        description='Probabilistic sensitivity analysis for one patient.'
+        )
+    parser.add_argument(
+        '--distributions', required=True, metavar='FILE',
+        help='JSON file with the distribution for each parameter.')
+    parser.add_argument('--age', type=float, required=True)
+    parser.add_argument(
+        '--sex', type=int, choices=[0, 1], required=True,
+        help='0 for female, 1 for male.')
+    parser.add_argument(
+        '--model-type', choices=['mRS', 'Dichotomous'], default='mRS',
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--draws', type=int, default=1000,
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--seed', type=int, default=42,
+        help='Default: %(default)s.')
+    parser.add_argument(
+        '--interval', type=float, default=0.95,
+        help='Width of the credible intervals. Default: %(default)s.')
+    parser.add_argument(
+        '--output-draws', metavar='FILE',
+        help='Save the results of every draw to this .csv file.')
+    parser.add_argument(
+        '--output-ceac', metavar='FILE',
+        help='Save the acceptability curves to this .csv file.')
+    args = parser.parse_args(argv)
+
+    with open(args.distributions) as f:
+        distributions = json.load(f)
+
+    start = time.perf_counter()
+    df_draws = run_psa(
+        args.age, args.sex, distributions, args.draws, args.seed,
+        args.model_type)
+    print(f'Ran {len(df_draws)} draws in ' +
+          f'{time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+    print(summarise_draws(df_draws, args.interval).to_string(index=False))
+    df_ceac = acceptability_curves(df_draws, np.arange(0, 50001, 1000))
+    print(df_ceac.iloc[::10].to_string())
+
+    if args.output_draws:
+        df_draws.to_csv(args.output_draws, index=False)
+    if args.output_ceac:
+        df_ceac.to_csv(args.output_ceac)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Keep the results of the main calculations between script runs.
+
+Streamlit reruns the whole page script every time a widget changes,
+but the results only depend on the patient's age and sex, the mRS
+scores that are run and the model type. Moving the highlighted mRS
+slider, for example, doesn't change any of the results.
+
+The functions run_all_mrs() and run_sweep() are memoized with
+functools.lru_cache.
+Imported modules stay loaded between reruns and between sessions,
+so the cache is shared by every visitor to the app in this process.
+The least recently used results are dropped once the cache is full.
+
+On a cache miss the results are looked up in the precomputed grid
+of every patient (see results_grid.py) rather than calculated.
+Lookups from sessions that miss at about the same time are collected
+into one batch by the model service (see model_service.py).
+
+The cached results and tables are shared between sessions, so
+treat them as read-only. The arrays in the ResultsTable of results
+are read-only anyway.
+"""
+# Imports:
+import functools
+
+import numpy as np
+
+# Every combination of age, sex and mRS:
+import utilities_lifetime.cohort as cohort
+# The change-in-outcome table builders:
+import utilities_lifetime.main_calculations as calc
+# Batches the lookups of sessions that run at the same time:
+import utilities_lifetime.model_service as model_service
+# Precomputed results for every patient:
+import utilities_lifetime.results_grid as results_grid
+
+# Maximum number of patients to keep results for.
+# Each set of results is roughly 30kB.
+cache_max_entries = 512
+# Maximum number of age ranges to keep results for on the Advanced
+# options page. The full range of ages in steps of 0.5 years is
+# roughly 5MB.
+sweep_cache_max_entries = 16
+
+
+@functools.lru_cache(maxsize=cache_max_entries)
+def run_all_mrs(
+        age: float,
+        sex: int,
+        mrs_to_run: tuple,
+        model_input_str: str
+        ):
+    """
+    Run the main calculations for every mRS score for one patient.
+
+    Inputs:
+    -------
+    age             - float or int. Patient's age in years.
+    sex             - int. Patient's sex, 0 for female and 1 for male.
+    mrs_to_run      - tuple. The mRS scores to calculate results for.
+                      A tuple rather than a list so that it can be
+                      used as part of the cache key.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+
+    Returns:
+    --------
+    results                  - ResultsTable. All of the results, one
+                               row for each mRS score.
+    qalys_table              - np.array. Discounted QALYs by change in
+                               outcome.
+    table_discounted_cost    - np.array. Discounted total costs by
+                               change in outcome.
+    table_cost_effectiveness - np.array. Discounted total Net Benefit
+                               by change in outcome.
+    """
+    # Look up the results for every mRS score. The table has the
+    # same columns as main_calculations() with one row per score.
+    if model_service.is_enabled():
+        # Wait a moment for other sessions' lookups to join this one.
+        results = model_service.request_table(
+            age,
+            sex,
+            mrs_to_run,
+            model_input_str
+            )
+    else:
+        results = results_grid.lookup_table(
+            age,
+            sex,
+            list(mrs_to_run),
+            model_input_str
+            )
+
+    # Take a column from the dataframe that contains one value for
+    # each mRS score from 0 to 5. Turn those six values into a 6x6
+    # grid to show the change in the value between mRS scores.
+    qalys_table = calc.build_table_qaly_by_change_in_outcome(
+        results['qalys_total'])
+    table_discounted_cost = calc.build_table_discounted_change(
+        results['total_discounted_cost'])
+    table_cost_effectiveness = calc.build_table_cost_effectiveness(
+        results['net_benefit'])
+
+    return (results, qalys_table, table_discounted_cost,
+            table_cost_effectiveness)
+
+
+@functools.lru_cache(maxsize=sweep_cache_max_entries)
+def run_sweep(
+        age_min: float,
+        age_max: float,
+        age_step: float,
+        model_input_str: str
+        ):
+    """
+    Run the main calculations for every patient in a range of ages.
+
+    Every combination of age, sex and mRS score (or outcome type for
+    the dichotomous model) is run, as on the Advanced options page.
+
+    Inputs:
+    -------
+    age_min         - float. Youngest age in years.
+    age_max         - float. Oldest age in years.
+    age_step        - float. Years between ages.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+
+    Returns:
+    --------
+    results - ResultsTable. All of the results, one row for each
+              patient.
+    """
+    age_range = np.arange(age_min, age_max+1e-3, age_step)
+    # Decide which mRS scores to run:
+    mrs_to_run = cohort.mrs_to_run_for_model(model_input_str)
+    # Every combination of age, sex and mRS:
+    patient_df = cohort.build_cohort(age_range, mrs_to_run=mrs_to_run)
+
+    # Look up all of the patients at once in the precomputed grid.
+    # Any ages that aren't on the grid are calculated directly.
+    results = results_grid.lookup_table(
+        patient_df['age'].to_numpy(dtype=float),
+        patient_df['sex'].to_numpy(dtype=int),
+        patient_df['mrs'].to_numpy(dtype=int),
+        model_input_str,
+        sex_label=patient_df['sex_label'].to_numpy()
+        )
+    return results
+
+
+def cache_info():
+    """
+    Get the hit and miss counters for the results cache.
+
+    Returns:
+    --------
+    dict. Keys hits, misses, maxsize, currsize.
+    """
+    return run_all_mrs.cache_info()._asdict()
+
+
+def cache_clear():
+    """Empty the results caches and reset their counters."""
+    run_all_mrs.cache_clear()
+    run_sweep.cache_clear()
@@ -0,0 +1,619 @@
+"""
+Precomputed results for every possible patient.
+
+The model inputs are bounded: age from 45 to 90, two sexes, mRS from
+0 to 5 and two model types. So the whole grid of patients can be
+calculated once and then results are picked out by lookup instead
+of being recalculated on every script run.
+
+The grid for each model type is stored as a dictionary of arrays
+with the shape (ages, sexes, mRS scores) for the single values or
+(ages, sexes, mRS scores, years) for the values by year. The arrays
+can be saved as one .npy file each and loaded as memory-mapped arrays
+so that only the rows that are looked up are read from disk.
+
+Build and check the stored grid from the command line:
+    python -m utilities_lifetime.results_grid build
+    python -m utilities_lifetime.results_grid verify --tolerance 0.01
+
+If there is no stored grid (or it was built from different fixed
+parameters, a different version of stroke-lifetime or different grid
+ages), the grid is calculated in memory the first time that
+it's needed. Ages that aren't on the grid are either interpolated
+linearly between the neighbouring grid ages or calculated directly.
+"""
+# Imports:
+import argparse
+import functools
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import stroke_lifetime
+
+# The main calculations for many patients at once:
+import utilities_lifetime.batch_calculations as batch_calc
+# The same calculations split across processes for large cohorts:
+import utilities_lifetime.parallel as parallel
+# Results with the values by year kept in 2D arrays:
+from utilities_lifetime.results_table import ResultsTable
+# The main calculations for one patient, used for checking the grid:
+import stroke_lifetime.main_calculations as calc
+# Function to import fixed params for either mRS or dicho model:
+from stroke_lifetime.fixed_params import get_fixed_params
+
+# Grid of patient details:
+grid_age_min = 45.0
+grid_age_max = 90.0
+grid_age_step = 0.5
+grid_sexes = [0, 1]
+grid_mrs = [0, 1, 2, 3, 4, 5]
+grid_model_types = ['mRS', 'Dichotomous']
+
+# Default place to store the grid, next to the utilities_lifetime
+# directory:
+grid_directory = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data',
+    'results_grid'
+    )
+
+# Ages where the results jump rather than change smoothly. The care
+# home rates are different for patients over 70, so no interpolation
+# is done between grid ages on either side of age 70.
+grid_age_steps_in_results = [70.0]
+
+# These results are labels or whole numbers that can't be interpolated:
+keys_not_interpolated = [
+    'age',
+    'sex',
+    'mrs',
+    'death_in_year_n_probs_first_invalid_index',
+    'n_survival_years',
+    ] + batch_calc.columns_by_survival_year
+
+
+# #####################################################################
+# ########################## Build and store ##########################
+# #####################################################################
+
+def build_grid(model_input_str: str, age_step: float = grid_age_step):
+    """
+    Calculate the results for every patient in the grid.
+
+    Inputs:
+    -------
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    age_step        - float. Gap between ages in the grid in years.
+
+    Returns:
+    --------
+    grid - dict. Results arrays with the shape (ages, sexes, mRS
+           scores, ...). Extra keys:
+        ages     - np.array. The ages in the grid.
+        metadata - dict. Details of how the grid was made.
+    """
+    ages = np.arange(grid_age_min, grid_age_max + 1e-3, age_step)
+    age, sex, mrs = np.meshgrid(ages, grid_sexes, grid_mrs, indexing='ij')
+
+    fixed_params = get_fixed_params(model_input_str)
+    results = batch_calc.calculate_results_arrays(
+        age.ravel(), sex.ravel(), mrs.ravel(), fixed_params)
+
+    grid_shape = age.shape
+    grid = {
+        key: np.reshape(value, (*grid_shape, *np.shape(value)[1:]))
+        for key, value in results.items()
+        }
+    grid['ages'] = ages
+    grid['metadata'] = grid_metadata(model_input_str, age_step)
+    return grid
+
+
+def grid_metadata(model_input_str: str, age_step: float = grid_age_step):
+    """
+    Details of how a grid is made, to tell if a saved grid is stale.
+
+    Inputs:
+    -------
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    age_step        - float. Gap between ages in the grid in years.
+
+    Returns:
+    --------
+    metadata - dict. The model type, the grid ages, the version of
+               stroke-lifetime and a fingerprint of the fixed
+               parameters.
+    """
+    return dict(
+        model_type=model_input_str,
+        age_min=grid_age_min,
+        age_max=grid_age_max,
+        age_step=age_step,
+        stroke_lifetime_version=stroke_lifetime.__version__,
+        fixed_params_checksum=batch_calc.fixed_params_checksum(
+            get_fixed_params(model_input_str)),
+        )
+
+
+def save_grid(grid: dict, directory: str = None):
+    """
+    Save the grid as one .npy file per array and a metadata file.
+
+    Inputs:
+    -------
+    grid      - dict. Output from build_grid().
+    directory - str. The grid is saved in a subdirectory of this
+                named after the model type. Default grid_directory.
+    """
+    directory = grid_directory if directory is None else directory
+    model_directory = os.path.join(directory, grid['metadata']['model_type'])
+    os.makedirs(model_directory, exist_ok=True)
+    for key, value in grid.items():
+        if key == 'metadata':
+            continue
+        np.save(os.path.join(model_directory, f'{key}.npy'), value)
+    # Write the metadata last so that a half-written grid isn't used.
+    with open(os.path.join(model_directory, 'metadata.json'), 'w') as f:
+        json.dump(grid['metadata'], f, indent=4)
+
+
+def load_grid(
+        model_input_str: str,
+        directory: str = None,
+        age_step: float = None
+        ):
+    """
+    Load a saved grid as memory-mapped arrays.
+
+    Inputs:
+    -------
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    directory       - str. The directory that save_grid() used.
+                      Default grid_directory.
+    age_step        - float. Gap between ages the grid should have.
+                      Default grid_age_step.
+
+    Returns:
+    --------
+    grid - dict or None. The grid in the same format as build_grid(),
+           or None if there is no saved grid or if it was built from
+           different fixed parameters, a different version of
+           stroke-lifetime or different ages.
+    """
+    directory = grid_directory if directory is None else directory
+    age_step = grid_age_step if age_step is None else age_step
+    model_directory = os.path.join(directory, model_input_str)
+    try:
+        with open(os.path.join(model_directory, 'metadata.json')) as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    expected = grid_metadata(model_input_str, age_step)
+    if any([metadata.get(key) != value for key, value in expected.items()]):
+        # The fixed parameters, the model code or the grid ages have
+        # changed since the grid was built.
+        return None
+
+    grid = dict(metadata=metadata)
+    for file in os.listdir(model_directory):
+        if file.endswith('.npy'):
+            grid[file[:-len('.npy')]] = np.load(
+                os.path.join(model_directory, file), mmap_mode='r')
+    return grid
+
+
+@functools.lru_cache(maxsize=None)
+def get_grid(model_input_str: str):
+    """
+    Get the grid for this model type, loading or building it once.
+
+    The result is kept for the lifetime of the process, so every
+    script run and every session shares the same grid.
+
+    Inputs:
+    -------
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+
+    Returns:
+    --------
+    grid - dict. The grid in the same format as build_grid().
+    """
+    grid = load_grid(model_input_str)
+    if grid is None:
+        grid = build_grid(model_input_str, grid_age_step)
+    return grid
+
+
+# #####################################################################
+# ############################## Lookup ###############################
+# #####################################################################
+
+def lookup_dataframe(
+        age,
+        sex,
+        mrs,
+        model_input_str: str,
+        interpolate: bool = False,
+        sex_label=None
+        ):
+    """
+    Look up the main results DataFrame for these patients.
+
+    Inputs:
+    -------
+    age             - float or array. Patients' ages in years.
+    sex             - int or array. Patients' sex, 0 for female and
+                      1 for male.
+    mrs             - int or array. Patients' mRS scores from 0 to 5.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    interpolate     - bool. Whether to interpolate ages that aren't
+                      on the grid instead of calculating them.
+    sex_label       - str or array. Either "Male" or "Female". If this
+                      is not given, it is worked out from sex.
+
+    Returns:
+    --------
+    df - pd.DataFrame. Same format as from main_calculations_batch().
+    """
+    results = lookup_results(age, sex, mrs, model_input_str, interpolate)
+    return batch_calc.build_results_dataframe(
+        results, model_input_str, sex_label)
+
+
+def lookup_table(
+        age,
+        sex,
+        mrs,
+        model_input_str: str,
+        interpolate: bool = False,
+        sex_label=None
+        ):
+    """
+    Look up the results for these patients as a ResultsTable.
+
+    Inputs:
+    -------
+    The same as lookup_dataframe().
+
+    Returns:
+    --------
+    table - ResultsTable. The scalar results in a DataFrame and the
+            results by year in 2D arrays.
+    """
+    results = lookup_results(age, sex, mrs, model_input_str, interpolate)
+    return ResultsTable.from_results_arrays(
+        results, model_input_str, sex_label)
+
+
+def lookup_results(
+        age,
+        sex,
+        mrs,
+        model_input_str: str,
+        interpolate: bool = False
+        ):
+    """
+    Look up the results arrays for these patients.
+
+    Patients whose age is on the grid are looked up directly.
+    Other patients within the grid's age range are interpolated if
+    interpolate is True, except for ages just over 70 where the care
+    home rates change. Interpolated patients don't get the lists by
+    year that stop at the median survival (e.g. qalys_by_year) because
+    these have a different length for each age. Everyone else is
+    calculated directly with the batch calculations, split across
+    processes if there are a lot of them.
+
+    Inputs:
+    -------
+    age             - float or array. Patients' ages in years.
+    sex             - int or array. Patients' sex, 0 for female and
+                      1 for male.
+    mrs             - int or array. Patients' mRS scores from 0 to 5.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    interpolate     - bool. Whether to interpolate ages that aren't
+                      on the grid instead of calculating them.
+
+    Returns:
+    --------
+    results - dict. Same format as from calculate_results_arrays().
+    """
+    # Copy the broadcast views so the inputs own their memory. numpy
+    # warns when the writeable flag of a broadcast view is used.
+    age, sex, mrs = [np.array(x) for x in np.broadcast_arrays(
+        np.atleast_1d(np.asarray(age, dtype=float)),
+        np.atleast_1d(np.asarray(sex, dtype=int)),
+        np.atleast_1d(np.asarray(mrs, dtype=int))
+        )]
+    grid = get_grid(model_input_str)
+    ages = grid['ages']
+
+    # Where each age falls on the grid:
+    position = (age - ages[0]) / (ages[1] - ages[0])
+    nearest = np.rint(position).astype(int)
+    in_grid = (
+        np.isin(sex, grid_sexes) &
+        np.isin(mrs, grid_mrs) &
+        (age >= ages[0]) &
+        (age <= ages[-1])
+        )
+    on_grid = in_grid & (np.abs(position - nearest) < 1e-6)
+    between_grid = (
+        in_grid & ~on_grid & interpolate &
+        ~crosses_step_in_results(age, ages)
+        )
+    off_grid = ~(on_grid | between_grid)
+
+    parts = []
+    if np.any(on_grid):
+        parts.append((on_grid, lookup_grid_rows(
+            grid, nearest[on_grid], sex[on_grid], mrs[on_grid])))
+    if np.any(between_grid):
+        parts.append((between_grid, interpolate_grid_rows(
+            grid, position[between_grid], sex[between_grid],
+            mrs[between_grid])))
+    if np.any(off_grid):
+        parts.append((off_grid, parallel.calculate_results_arrays_parallel(
+            age[off_grid], sex[off_grid], mrs[off_grid],
+            get_fixed_params(model_input_str))))
+
+    results = combine_results_rows(len(age), parts)
+    # Keep the exact input ages rather than the grid ages:
+    results['age'] = age
+    return results
+
+
+def crosses_step_in_results(age, ages):
+    """
+    Find ages whose neighbouring grid ages have a jump between them.
+
+    Inputs:
+    -------
+    age  - np.array. Patients' ages in years.
+    ages - np.array. The ages in the grid.
+
+    Returns:
+    --------
+    crosses - np.array. True for each age that shouldn't be
+              interpolated because the results jump between the grid
+              ages either side of it.
+    """
+    index_upper = np.clip(np.searchsorted(ages, age), 1, len(ages) - 1)
+    lower = ages[index_upper - 1]
+    upper = ages[index_upper]
+    crosses = np.zeros(np.shape(age), dtype=bool)
+    for age_step in grid_age_steps_in_results:
+        # The results change for ages above the step age:
+        crosses |= (lower <= age_step) & (upper > age_step)
+    return crosses
+
+
+def lookup_grid_rows(grid: dict, age_index, sex, mrs):
+    """
+    Pick out the grid results for patients whose ages are on the grid.
+
+    Inputs:
+    -------
+    grid      - dict. The grid in the same format as build_grid().
+    age_index - np.array. Index of each patient's age in the grid.
+    sex       - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs       - np.array. Patients' mRS scores from 0 to 5.
+
+    Returns:
+    --------
+    results - dict. Same format as from calculate_results_arrays().
+    """
+    return {
+        key: np.asarray(value[age_index, sex, mrs])
+        for key, value in grid.items()
+        if key not in ['ages', 'metadata']
+        }
+
+
+def interpolate_grid_rows(grid: dict, position, sex, mrs):
+    """
+    Linearly interpolate the grid results between neighbouring ages.
+
+    Inputs:
+    -------
+    grid     - dict. The grid in the same format as build_grid().
+    position - np.array. Position of each patient's age in the grid,
+               e.g. 2.5 is halfway between the third and fourth ages.
+    sex      - np.array. Patients' sex, 0 for female and 1 for male.
+    mrs      - np.array. Patients' mRS scores from 0 to 5.
+
+    Returns:
+    --------
+    results - dict. Same format as from calculate_results_arrays().
+    """
+    lower = np.clip(np.floor(position).astype(int), 0, len(grid['ages']) - 2)
+    fraction = position - lower
+
+    results = {}
+    for key, value in grid.items():
+        if key in ['ages', 'metadata'] or key in keys_not_interpolated:
+            continue
+        value_lower = np.asarray(value[lower, sex, mrs])
+        value_upper = np.asarray(value[lower + 1, sex, mrs])
+        # Line up the fractions with any year columns:
+        f = fraction.reshape(-1, *[1] * (value_lower.ndim - 1))
+        results[key] = (1.0 - f) * value_lower + f * value_upper
+
+    results['sex'] = sex
+    results['mrs'] = mrs
+    # The interpolated patients have no lists by year that stop at
+    # the median survival year.
+    results['n_survival_years'] = np.zeros(len(position), dtype=int)
+    for key in batch_calc.columns_by_survival_year:
+        results[key] = np.full((len(position), 0), np.nan)
+    # Find the first invalid year from the interpolated hazard:
+    invalid = results['hazard_by_year'] >= 1.0
+    results['death_in_year_n_probs_first_invalid_index'] = np.where(
+        np.any(invalid, axis=1), np.argmax(invalid, axis=1) + 1, np.nan)
+    return results
+
+
+def combine_results_rows(n_patients: int, parts: list):
+    """
+    Combine results arrays for separate groups of patients.
+
+    Inputs:
+    -------
+    n_patients - int. Total number of patients.
+    parts      - list. Contains (mask, results) pairs where mask
+                 selects the patients that results are for.
+
+    Returns:
+    --------
+    combined - dict. Same format as from calculate_results_arrays().
+               The values by year are padded with NaN to the longest
+               list of any group.
+    """
+    if len(parts) == 1:
+        return dict(parts[0][1])
+
+    combined = {}
+    for key in parts[0][1].keys():
+        values = [np.asarray(results[key]) for mask, results in parts]
+        width = max([v.shape[1] for v in values]) if values[0].ndim > 1 else 0
+        if values[0].ndim > 1:
+            out = np.full((n_patients, width), np.nan)
+        else:
+            out = np.empty(n_patients, dtype=np.result_type(*values))
+        for (mask, results), value in zip(parts, values):
+            if value.ndim > 1:
+                out[mask, :value.shape[1]] = value
+            else:
+                out[mask] = value
+        combined[key] = out
+    return combined
+
+
+# #####################################################################
+# ############################ Verification ###########################
+# #####################################################################
+
+def verify_grid(model_input_str: str, tolerance: float = 0.01):
+    """
+    Check interpolated results against the direct calculations.
+
+    Every patient halfway between two grid ages is interpolated from
+    the grid and also run through main_calculations() from the
+    stroke-lifetime package. This is the worst case for interpolation.
+
+    Inputs:
+    -------
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    tolerance       - float. Largest allowed difference relative to
+                      the largest size of that result across all of
+                      the checked patients. Net benefit, for example,
+                      can be close to zero for some patients.
+
+    Returns:
+    --------
+    df_check - pd.DataFrame. One row per checked result with the
+               largest absolute and relative differences and whether
+               it passed.
+    """
+    grid = get_grid(model_input_str)
+    ages = grid['ages']
+    midpoints = ages[:-1] + 0.5 * (ages[1] - ages[0])
+    age, sex, mrs = [
+        a.ravel() for a in
+        np.meshgrid(midpoints, grid_sexes, grid_mrs, indexing='ij')
+        ]
+
+    results = lookup_results(age, sex, mrs, model_input_str, interpolate=True)
+
+    fixed_params = get_fixed_params(model_input_str)
+    df_direct = pd.DataFrame([
+        calc.main_calculations(
+            a, s, 'Male' if s == 1 else 'Female', m,
+            fixed_params, model_input_str)
+        for a, s, m in zip(age, sex, mrs)
+        ])
+
+    rows = []
+    for key in batch_calc.results_columns:
+        if key not in results or key in keys_not_interpolated:
+            continue
+        interpolated = np.asarray(results[key], dtype=float)
+        direct = np.array(df_direct[key].tolist(), dtype=float)
+        difference = np.abs(interpolated - direct)
+        scale = np.nanmax(np.abs(direct))
+        relative = difference / (scale if scale > 0.0 else 1.0)
+        rows.append(dict(
+            result=key,
+            max_abs_difference=np.nanmax(difference),
+            max_rel_difference=np.nanmax(relative),
+            passed=bool(np.nanmax(relative) <= tolerance),
+            ))
+    df_check = pd.DataFrame(rows)
+    return df_check
+
+
+# #####################################################################
+# ########################### Command line ############################
+# #####################################################################
+
+def main(argv=None):
+    """
+    Build or verify the stored grid from the command line.
+
+    Inputs:
+    -------
+    argv - list or None. Command line arguments. Uses sys.argv if None.
+
+    Returns:
+    --------
+    int. Exit code, 0 if everything worked.
+    """
+    global grid_directory, grid_age_step
+    parser = argparse.ArgumentParser(
+        prog='python -m utilities_lifetime.results_grid',
+        description='Build or verify the precomputed results grid.'
+        )
+    parser.add_argument('mode', choices=['build', 'verify'])
+    parser.add_argument(
+        '--model-type', choices=grid_model_types, action='append',
+        help='Model type to use. Repeat for both. Default: both.')
+    parser.add_argument(
+        '--age-step', type=float, default=grid_age_step,
+        help='Gap between grid ages in years. The app only uses a grid '
+             'with the default gap. Default: %(default)s.')
+    parser.add_argument(
+        '--directory', default=grid_directory,
+        help='Where to store the grid. Default: %(default)s.')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.01,
+        help='Largest allowed relative difference when verifying. '
+             'Default: %(default)s.')
+    args = parser.parse_args(argv)
+
+    # Verify the grid in the chosen directory and with the chosen ages:
+    grid_directory = args.directory
+    grid_age_step = args.age_step
+
+    exit_code = 0
+    for model_input_str in args.model_type or grid_model_types:
+        if args.mode == 'build':
+            grid = build_grid(model_input_str, args.age_step)
+            save_grid(grid, args.directory)
+            print(f'Saved {model_input_str} grid of {len(grid["ages"])} ' +
+                  f'ages to {args.directory}')
+        else:
+            get_grid.cache_clear()
+            df_check = verify_grid(model_input_str, args.tolerance)
+            print(f'{model_input_str} model:')
+            print(df_check.to_string(index=False))
+            if not df_check['passed'].all():
+                exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,529 @@
+"""
+A table of results that keeps the values by year in 2D arrays.
+
+The results of main_calculations() are usually put in a DataFrame
+with one row per patient. The values by year (e.g. survival_by_year)
+are then stored as one array per cell in columns of dtype object.
+Those columns take more memory than the numbers in them, are slow to
+pickle and copy, and can't be written to CSV or Parquet without
+turning each array into a long string.
+
+ResultsTable keeps the same results in two parts:
+    scalars - a DataFrame with one typed column for each result that
+              has one value per patient (e.g. qalys_total).
+    by_year - one 2D float array (patients x years) for each result
+              that has one value per year, padded with NaN.
+
+Each 2D array has an explicit year axis:
+    years          - 0, 1, 2, ..., the final year of the model.
+                     Used by years, hazard_by_year, survival_by_year,
+                     fhazard_by_year and death_in_year_n_probs.
+                     death_in_year_n_probs starts in year 1, so its
+                     value for year 0 is NaN.
+    survival_years - 1, 2, ..., the longest median survival (rounded
+                     up). Used by the QALY and resource use lists
+                     that stop at each patient's median survival year.
+
+The table can still give the same values as the old DataFrame:
+    table['qalys_total']  - the scalar column as a Series.
+    table['hazard_by_year'] - the 2D array, one row per patient.
+    table.row(i)          - the same dict as df.loc[i].to_dict().
+    table.to_dataframe()  - the old DataFrame with object columns.
+    table.view(i, fixed_params) - a read-only mapping of one patient's
+                            results and the fixed parameters.
+
+The arrays are read-only because cached tables are shared between
+sessions. table.scalars gives a new DataFrame each time that shares
+the read-only columns, so a page can add or replace columns in it
+but changing the cached values in place raises an error.
+"""
+# Imports:
+import collections.abc
+
+import numpy as np
+import pandas as pd
+
+# Column names and the old DataFrame format:
+import utilities_lifetime.batch_calculations as batch_calc
+
+
+# Columns of the scalars DataFrame that only take a few values:
+category_columns = ['sex_label', 'model_type', 'outcome_type']
+# Columns that start in year 1 rather than year 0 on the years axis:
+columns_from_year_one = ['death_in_year_n_probs']
+
+
+def read_only_column(series: pd.Series):
+    """
+    Get the values of a column as a read-only array.
+
+    Inputs:
+    -------
+    series - pd.Series. One column of the scalar results.
+
+    Returns:
+    --------
+    np.array or pd.Categorical. The values without a copy if they're
+    read-only already, otherwise a read-only copy.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        if codes.flags.writeable:
+            codes = codes.copy()
+            codes.setflags(write=False)
+        return pd.Categorical.from_codes(codes, dtype=series.dtype)
+    values = series.to_numpy()
+    if values.flags.writeable:
+        values = values.copy()
+        values.setflags(write=False)
+    return values
+
+
+class ResultsTable:
+    """
+    Results for many patients with the values by year in 2D arrays.
+
+    Make one with ResultsTable.from_results_arrays().
+
+    Attributes:
+    -----------
+    scalars          - pd.DataFrame. One row per patient and one typed
+                       column per result with one value per patient.
+                       A shallow copy of read-only columns.
+    by_year          - dict. For each result by year, a read-only 2D
+                       float array with one row per patient.
+    years            - np.array. Year axis of the model-year columns.
+    survival_years   - np.array. Year axis of the survival-year columns.
+    n_survival_years - np.array. Number of survival years each
+                       patient has values for.
+    """
+    def __init__(
+            self,
+            scalars: pd.DataFrame,
+            by_year: dict,
+            years,
+            survival_years,
+            n_survival_years
+            ):
+        # Keep the scalar columns as separate read-only arrays so that
+        # every column of the DataFrame is read-only:
+        columns = {
+            column: read_only_column(series)
+            for column, series in scalars.items()
+            }
+        self._scalars = pd.DataFrame(columns, index=scalars.index, copy=False)
+        self.by_year = by_year
+        self.years = years
+        self.survival_years = survival_years
+        self.n_survival_years = n_survival_years
+        # Patients with an invalid mRS have no values by year:
+        mrs = scalars['mrs'].to_numpy()
+        self.valid = (mrs >= 0) & (mrs <= 5)
+        # Plain arrays of the scalar columns for quick row lookups:
+        self.scalar_arrays = {
+            column: np.asarray(values) for column, values in columns.items()}
+        for array in [self.years, self.survival_years, self.n_survival_years,
+                      self.valid, *self.by_year.values(),
+                      *self.scalar_arrays.values()]:
+            array.setflags(write=False)
+
+    @classmethod
+    def from_results_arrays(
+            cls,
+            results: dict,
+            model_type_str: str,
+            sex_label=None
+            ):
+        """
+        Make a table from the output of calculate_results_arrays().
+
+        The float arrays in results are used without being copied,
+        and they are made read-only.
+
+        Inputs:
+        -------
+        results        - dict. Output from calculate_results_arrays()
+                         or results_grid.lookup_results().
+        model_type_str - str. Separate "mRS" or "Dichotomous" model.
+        sex_label      - str or array. Either "Male" or "Female". If
+                         this is not given, it is worked out from sex.
+
+        Returns:
+        --------
+        table - ResultsTable. The same results.
+        """
+        n_patients = len(results['age'])
+        mrs = np.asarray(results['mrs'], dtype=int)
+        mrs_valid = (mrs >= 0) & (mrs <= 5)
+        if sex_label is None:
+            sex_label = np.where(results['sex'] == 1, 'Male', 'Female')
+        outcome_type = np.where(
+            mrs_valid, np.where(mrs > 2, 'Dependent', 'Independent'), 'n/a')
+
+        data = dict(
+            age=np.asarray(results['age'], dtype=float),
+            sex=np.asarray(results['sex'], dtype=int),
+            sex_label=np.broadcast_to(np.asarray(sex_label), (n_patients,)),
+            model_type=np.full(n_patients, model_type_str),
+            mrs=mrs,
+            outcome_type=outcome_type,
+            )
+        by_year = {}
+        for column in batch_calc.results_columns[len(data):]:
+            values = results[column]
+            if column == 'years':
+                # This is the year axis rather than a result.
+                continue
+            elif column in columns_from_year_one:
+                # Line up year 1 with year 1 of the years axis:
+                values = np.asarray(values, dtype=float)
+                values = np.concatenate(
+                    (np.full((n_patients, 1), np.nan), values), axis=1)
+                by_year[column] = values
+            elif (column in batch_calc.columns_by_model_year or
+                  column in batch_calc.columns_by_survival_year):
+                by_year[column] = np.asarray(values, dtype=float)
+            elif column == 'death_in_year_n_probs_first_invalid_index':
+                # Keep these as integer indices unless there are any
+                # missing values.
+                values = np.asarray(values)
+                if not np.any(np.isnan(values)):
+                    values = values.astype(int)
+                data[column] = values
+            else:
+                data[column] = np.asarray(values, dtype=float)
+
+        for column in category_columns:
+            data[column] = pd.Categorical(data[column])
+        scalars = pd.DataFrame(data, copy=False)
+
+        # Keep the same dtype as the years in the results:
+        years = np.arange(by_year['hazard_by_year'].shape[1]).astype(
+            np.asarray(results['years']).dtype)
+        survival_years = np.arange(
+            1, by_year['qalys_by_year'].shape[1] + 1)
+        n_survival_years = np.asarray(results['n_survival_years'], dtype=int)
+        return cls(scalars, by_year, years, survival_years, n_survival_years)
+
+    @property
+    def scalars(self):
+        """
+        The results with one value per patient.
+
+        Returns:
+        --------
+        pd.DataFrame. A new DataFrame that shares the read-only
+        columns of this table without copying them.
+        """
+        return self._scalars.copy(deep=False)
+
+    def __len__(self):
+        return len(self._scalars)
+
+    def __getitem__(self, column: str):
+        """
+        Get all of the values of one result.
+
+        Inputs:
+        -------
+        column - str. Any column of the old results DataFrame.
+
+        Returns:
+        --------
+        pd.Series for the scalar results, np.array (patients x years)
+        for the results by year, or the years axis for "years".
+        """
+        if column == 'years':
+            return self.years
+        elif column in self.by_year:
+            return self.by_year[column]
+        return self._scalars[column]
+
+    @property
+    def columns(self):
+        """The columns of the old results DataFrame, in order."""
+        return batch_calc.results_columns
+
+    def year_axis(self, column: str):
+        """
+        Get the years that go with the columns of a result by year.
+
+        Inputs:
+        -------
+        column - str. A key of by_year.
+
+        Returns:
+        --------
+        np.array. Either years or survival_years.
+        """
+        if column in batch_calc.columns_by_survival_year:
+            return self.survival_years
+        return self.years
+
+    def row_value(self, index: int, column: str):
+        """
+        Get one result for one patient.
+
+        Arrays are read-only views into the table, not copies.
+
+        Inputs:
+        -------
+        index  - int. Position of the patient in the table.
+        column - str. Any column of the old results DataFrame.
+
+        Returns:
+        --------
+        The same value as df.loc[index, column] for the old results
+        DataFrame, but with Python numbers instead of NumPy ones.
+        """
+        if column in self.scalar_arrays:
+            # item() gives Python numbers like the old DataFrame did:
+            return self.scalar_arrays[column].item(index)
+        elif column not in self.by_year and column != 'years':
+            raise KeyError(column)
+        elif column in batch_calc.columns_by_survival_year:
+            return self.by_year[column][index, :self.n_survival_years[index]]
+        elif not self.valid[index]:
+            # Patients with an invalid mRS have no values by year.
+            return np.array([])
+        elif column == 'years':
+            return self.years
+        elif column in columns_from_year_one:
+            return self.by_year[column][index, 1:]
+        return self.by_year[column][index]
+
+    def row(self, index: int):
+        """
+        Get all of the results for one patient.
+
+        The arrays are read-only views into the table, not copies.
+
+        Inputs:
+        -------
+        index - int. Position of the patient in the table.
+
+        Returns:
+        --------
+        dict. The same keys and values as df.loc[index].to_dict() for
+        the old results DataFrame.
+        """
+        return {column: self.row_value(index, column)
+                for column in self.columns}
+
+    def view(self, index: int, fixed_params: dict):
+        """
+        Get a read-only view of one patient's results and the fixed
+        parameters.
+
+        Inputs:
+        -------
+        index        - int. Position of the patient in the table.
+        fixed_params - dict. Contains fixed parameters independent
+                       of the model results.
+
+        Returns:
+        --------
+        ResultsView. Works like dict(**table.row(index), **fixed_params)
+        but only looks up the values that are used.
+        """
+        return ResultsView(self, index, fixed_params)
+
+    def to_results_arrays(self):
+        """
+        Convert the table back to the calculate_results_arrays() format.
+
+        Returns:
+        --------
+        results - dict. Arrays with one row per patient.
+        """
+        n_patients = len(self)
+        results = {
+            column: self.scalar_arrays[column]
+            for column in self._scalars.columns
+            if column not in category_columns
+            }
+        results['years'] = np.broadcast_to(
+            self.years, (n_patients, len(self.years)))
+        for column, values in self.by_year.items():
+            if column in columns_from_year_one:
+                values = values[:, 1:]
+            results[column] = values
+        results['n_survival_years'] = self.n_survival_years
+        return results
+
+    def to_dataframe(self):
+        """
+        Make the old results DataFrame with arrays in object columns.
+
+        Returns:
+        --------
+        df - pd.DataFrame. Same format as from main_calculations_batch().
+        """
+        return batch_calc.build_results_dataframe(
+            self.to_results_arrays(),
+            self._scalars['model_type'].iloc[0] if len(self) > 0 else '',
+            sex_label=self.scalar_arrays['sex_label']
+            )
+
+    def to_long_dataframe(
+            self,
+            columns=None,
+            id_columns=('age', 'sex_label', 'mrs')
+            ):
+        """
+        Make a DataFrame of the results by year with one row per year.
+
+        Every patient gets one row for each year on the years axis.
+        The results that stop at the median survival year are NaN
+        after that year, and so is everything for year 0 that starts
+        in year 1.
+
+        Inputs:
+        -------
+        columns    - list or None. Results by year to include. All of
+                     them if this is None.
+        id_columns - tuple. Scalar columns to repeat on every row so
+                     that each patient can be identified.
+
+        Returns:
+        --------
+        df_long - pd.DataFrame. Columns patient (position in this
+                  table), the id_columns, year and then one column
+                  for each result by year.
+        """
+        if columns is None:
+            columns = list(self.by_year.keys())
+        n_patients = len(self)
+        n_years = len(self.years)
+
+        data = dict(patient=np.repeat(np.arange(n_patients), n_years))
+        for column in id_columns:
+            # .array keeps the dtype, e.g. categories for sex_label.
+            data[column] = self._scalars[column].repeat(n_years).array
+        data['year'] = np.tile(self.years, n_patients)
+        for column in columns:
+            values = self.by_year[column]
+            if column in batch_calc.columns_by_survival_year:
+                # Place survival year 1 at year 1 of the years axis.
+                on_years = np.full((n_patients, n_years), np.nan)
+                n = min(values.shape[1], n_years - 1)
+                on_years[:, 1:n+1] = values[:, :n]
+                values = on_years
+            data[column] = values.ravel()
+        df_long = pd.DataFrame(data)
+        return df_long
+
+    def survival_quantiles(self, probabilities, gz_gamma: float):
+        """
+        Find the survival times for any probabilities of death.
+
+        Inputs:
+        -------
+        probabilities - list or np.array. Chosen probabilities of death
+                        from 0 to 1, e.g. 0.5 for the median.
+        gz_gamma      - float. Gompertz gamma coefficient from the
+                        fixed parameters.
+
+        Returns:
+        --------
+        np.array. Survival times in years with one row per probability
+        and one column per patient.
+        """
+        return batch_calc.find_survival_quantiles_batch(
+            probabilities,
+            self.scalar_arrays['death_in_year_1_prob'],
+            self.scalar_arrays['death_in_year_n_lp'],
+            gz_gamma
+            )
+
+    def survival_percentiles_dataframe(
+            self,
+            percentiles,
+            gz_gamma: float,
+            id_columns=('age', 'sex_label', 'mrs')
+            ):
+        """
+        Make a DataFrame of survival times for some percentiles.
+
+        Inputs:
+        -------
+        percentiles - list. Chosen probabilities of death from 0 to
+                      100, e.g. 50 for the median.
+        gz_gamma    - float. Gompertz gamma coefficient from the
+                      fixed parameters.
+        id_columns  - tuple. Scalar columns to include so that each
+                      patient can be identified.
+
+        Returns:
+        --------
+        df_percentiles - pd.DataFrame. One row per patient with the
+                         id_columns and then one column of survival
+                         times in years for each percentile, e.g.
+                         survival_p50_years.
+        """
+        survival_times = self.survival_quantiles(
+            np.asarray(percentiles, dtype=float) / 100.0, gz_gamma)
+        df_percentiles = self._scalars[list(id_columns)].copy()
+        for percentile, times in zip(percentiles, survival_times):
+            df_percentiles[f'survival_p{percentile:g}_years'] = times
+        return df_percentiles
+
+    def memory_usage(self):
+        """
+        Find how much memory the table uses.
+
+        Returns:
+        --------
+        int. Total size in bytes of the DataFrame and arrays.
+        """
+        return int(
+            self._scalars.memory_usage(deep=True).sum() +
+            sum([values.nbytes for values in self.by_year.values()]) +
+            self.years.nbytes + self.survival_years.nbytes +
+            self.n_survival_years.nbytes
+            )
+
+
+class ResultsView(collections.abc.Mapping):
+    """
+    One patient's results and the fixed parameters in one mapping.
+
+    The containers used to make their own variables_dict with
+    dict(**df.loc[mrs].to_dict(), **fixed_params). This view gives the
+    same keys and values, but each value is only looked up the first
+    time it's used and is then kept. Arrays are read-only views into
+    the table, and fixed parameters are the same objects as in
+    fixed_params, so nothing is copied. One view can be shared by all
+    of the containers.
+
+    The view can't be changed, e.g. view['age'] = 50 raises TypeError.
+    """
+    def __init__(self, table: ResultsTable, index: int, fixed_params: dict):
+        self.table = table
+        self.index = index
+        self.fixed_params = fixed_params
+        # The values that have been looked up so far:
+        self.values = {}
+
+    def __getitem__(self, key: str):
+        try:
+            return self.values[key]
+        except KeyError:
+            pass
+        if key in self.fixed_params:
+            value = self.fixed_params[key]
+        else:
+            # Raises KeyError if this isn't a result either.
+            value = self.table.row_value(self.index, key)
+        self.values[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self.fixed_params or key in self.table.columns
+
+    def __iter__(self):
+        yield from self.table.columns
+        yield from self.fixed_params
+
+    def __len__(self):
+        return len(self.table.columns) + len(self.fixed_params)
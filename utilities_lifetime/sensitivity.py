@@ -0,0 +1,286 @@
+"""
+One-way sensitivity analysis.
+
+Each entry of the fixed parameters, e.g. one coefficient in lg_coeffs
+or one utility in utility_list, is changed to a low value and then to
+a high value while everything else stays at its point estimate. The
+change in a result such as net_benefit shows how much that entry
+drives the result. A tornado chart puts the entries with the biggest
+change at the top.
+
+As in the PSA (psa.py), each scenario is treated as a separate patient
+in the batch calculations with its own copy of the parameters, so
+every scenario for every mRS score is calculated in one go.
+
+The ranges are given as a dictionary, e.g.
+    ranges = {
+        'gz_gamma': dict(low=0.00016, high=0.00020),
+        'utility_list': dict(relative=0.05),
+        'wtp_qaly_gpb': dict(low=20000, high=30000),
+    }
+where low and high are values (one per entry for list parameters)
+and relative=0.05 means 5% either side of the point estimate.
+Parameters that aren't in the dictionary use relative_range.
+"""
+# Imports:
+import functools
+
+import numpy as np
+import pandas as pd
+
+# The main calculations for many patients at once:
+import utilities_lifetime.batch_calculations as batch_calc
+# Which mRS scores to run for each model type:
+from utilities_lifetime.cohort import mrs_to_run_for_model
+# The parameters can be changed for each patient in the same way:
+from utilities_lifetime.psa import psa_parameters
+# Function to import fixed params for either mRS or dicho model:
+from stroke_lifetime.fixed_params import get_fixed_params
+
+# Fixed parameters that can be changed:
+sensitivity_parameters = psa_parameters
+# Results to keep for each scenario:
+sensitivity_results = [
+    'qalys_total',
+    'total_discounted_cost',
+    'net_benefit',
+]
+# Default change either side of the point estimate, e.g. 0.1 for 10%:
+default_relative_range = 0.1
+# Maximum number of analyses to keep between script runs:
+cache_max_entries = 64
+
+
+# #####################################################################
+# ############################ Scenarios ##############################
+# #####################################################################
+
+def build_scenarios(
+        fixed_params: dict,
+        ranges: dict = None,
+        relative_range: float = default_relative_range,
+        parameters: list = None
+        ):
+    """
+    Make the low and high value of every entry of the parameters.
+
+    Inputs:
+    -------
+    fixed_params   - dict. Contains the point estimates.
+    ranges         - dict or None. Low and high values for some
+                     parameters. See the top of this file.
+    relative_range - float. Change either side of the point estimate
+                     for parameters that aren't in ranges.
+    parameters     - list or None. Names of the parameters to change.
+                     All of sensitivity_parameters if None.
+
+    Returns:
+    --------
+    df_scenarios - pd.DataFrame. One row per entry with columns
+                   parameter, entry (position in the list, or -1 for
+                   single values), label, base_value, low_value and
+                   high_value. Entries where the low and high values
+                   are the same are left out.
+    """
+    ranges = {} if ranges is None else ranges
+    parameters = sensitivity_parameters if parameters is None else parameters
+    rows = []
+    for parameter in parameters:
+        if parameter not in sensitivity_parameters:
+            raise ValueError(
+                f'{parameter} can\'t be changed. ' +
+                f'Choose from: {", ".join(sensitivity_parameters)}')
+        base = np.asarray(fixed_params[parameter], dtype=float)
+        spec = ranges.get(parameter, dict(relative=relative_range))
+        if 'relative' in spec:
+            low = base * (1.0 - spec['relative'])
+            high = base * (1.0 + spec['relative'])
+        else:
+            low = np.broadcast_to(
+                np.asarray(spec['low'], dtype=float), base.shape)
+            high = np.broadcast_to(
+                np.asarray(spec['high'], dtype=float), base.shape)
+        for entry in range(base.size):
+            rows.append(dict(
+                parameter=parameter,
+                entry=entry if base.ndim > 0 else -1,
+                label=f'{parameter}[{entry}]' if base.ndim > 0 else parameter,
+                base_value=base.flat[entry],
+                low_value=low.flat[entry],
+                high_value=high.flat[entry],
+                ))
+    df_scenarios = pd.DataFrame(rows, columns=[
+        'parameter', 'entry', 'label', 'base_value', 'low_value',
+        'high_value'])
+    df_scenarios = df_scenarios[
+        df_scenarios['low_value'] != df_scenarios['high_value']]
+    return df_scenarios.reset_index(drop=True)
+
+
+def build_scenario_params(fixed_params: dict, df_scenarios: pd.DataFrame):
+    """
+    Make the fixed parameters for the base case and every scenario.
+
+    Inputs:
+    -------
+    fixed_params - dict. Contains the point estimates.
+    df_scenarios - pd.DataFrame. Output from build_scenarios().
+
+    Returns:
+    --------
+    params - dict. Same keys as fixed_params. Each changed parameter
+             has one row per scenario: first the base case, then the
+             low value of every entry, then the high value of every
+             entry.
+    """
+    n_entries = len(df_scenarios)
+    n_scenarios = 1 + 2 * n_entries
+    params = dict(fixed_params)
+    for parameter, df_parameter in df_scenarios.groupby('parameter'):
+        base = np.asarray(fixed_params[parameter], dtype=float)
+        values = np.repeat(base[None, ...], n_scenarios, axis=0)
+        # Flatten the entries so that lists and single values work
+        # in the same way:
+        flat = values.reshape(n_scenarios, -1)
+        positions = df_parameter.index.to_numpy()
+        entries = np.maximum(df_parameter['entry'].to_numpy(), 0)
+        flat[1 + positions, entries] = df_parameter['low_value'].to_numpy()
+        flat[1 + n_entries + positions, entries] = (
+            df_parameter['high_value'].to_numpy())
+        params[parameter] = values
+    return params
+
+
+# #####################################################################
+# ############################ Calculations ###########################
+# #####################################################################
+
+def run_one_way(
+        age: float,
+        sex: int,
+        model_input_str: str = 'mRS',
+        ranges: dict = None,
+        relative_range: float = default_relative_range,
+        parameters: list = None
+        ):
+    """
+    Run the model for every scenario and every mRS score for one patient.
+
+    Inputs:
+    -------
+    age             - float. Patient's age in years.
+    sex             - int. Patient's sex, 0 for female and 1 for male.
+    model_input_str - str. Separate "mRS" or "Dichotomous" model.
+    ranges          - dict or None. Low and high values for some
+                      parameters. See the top of this file.
+    relative_range  - float. Change either side of the point estimate
+                      for parameters that aren't in ranges.
+    parameters      - list or None. Names of the parameters to change.
+
+    Returns:
+    --------
+    df_one_way - pd.DataFrame. One row per entry and mRS score with
+                 the columns from build_scenarios(), mrs, and for
+                 each of sensitivity_results the base, low and high
+                 results, e.g. net_benefit_base, net_benefit_low and
+                 net_benefit_high.
+    """
+    fixed_params = get_fixed_params(model_input_str)
+    df_scenarios = build_scenarios(
+        fixed_params, ranges, relative_range, parameters)
+    params = build_scenario_params(fixed_params, df_scenarios)
+    mrs_to_run = np.array(mrs_to_run_for_model(model_input_str))
+    n_mrs = len(mrs_to_run)
+    n_entries = len(df_scenarios)
+    n_scenarios = 1 + 2 * n_entries
+
+    # Rows are ordered by mRS first and then by scenario. Every mRS
+    # score gets the same set of scenarios.
+    for parameter in df_scenarios['parameter'].unique():
+        values = params[parameter]
+        params[parameter] = np.tile(values, (n_mrs, *[1] * (values.ndim - 1)))
+    results = batch_calc.calculate_results_arrays(
+        np.full(n_mrs * n_scenarios, float(age)),
+        np.full(n_mrs * n_scenarios, int(sex)),
+        np.repeat(mrs_to_run, n_scenarios),
+        params
+        )
+
+    df_one_way = pd.concat([df_scenarios] * n_mrs, ignore_index=True)
+    df_one_way.insert(3, 'mrs', np.repeat(mrs_to_run, n_entries))
+    for column in sensitivity_results:
+        values = results[column].reshape(n_mrs, n_scenarios)
+        df_one_way[f'{column}_base'] = np.repeat(values[:, 0], n_entries)
+        df_one_way[f'{column}_low'] = values[:, 1:1 + n_entries].ravel()
+        df_one_way[f'{column}_high'] = values[:, 1 + n_entries:].ravel()
+    return df_one_way
+
+
+@functools.lru_cache(maxsize=cache_max_entries)
+def run_one_way_cached(
+        age: float,
+        sex: int,
+        model_input_str: str,
+        relative_range: float,
+        parameters: tuple
+        ):
+    """
+    Memoized run_one_way() for the Interactive demo.
+
+    Inputs:
+    -------
+    The same as run_one_way() except that there are no ranges and the
+    parameters are a tuple so that they can be part of the cache key.
+
+    Returns:
+    --------
+    df_one_way - pd.DataFrame. Output from run_one_way(). It's shared
+                 between sessions, so don't change it.
+    """
+    return run_one_way(
+        age, sex, model_input_str,
+        relative_range=relative_range,
+        parameters=list(parameters)
+        )
+
+
+def tornado_data(
+        df_one_way: pd.DataFrame,
+        mrs: int,
+        result: str = 'net_benefit',
+        n_bars: int = None
+        ):
+    """
+    Pick out and sort the changes in one result for a tornado chart.
+
+    Inputs:
+    -------
+    df_one_way - pd.DataFrame. Output from run_one_way().
+    mrs        - int. The mRS score to show.
+    result     - str. One of sensitivity_results.
+    n_bars     - int or None. Only keep this many entries with the
+                 biggest swing. Keep all if None.
+
+    Returns:
+    --------
+    df_tornado - pd.DataFrame. One row per entry, biggest swing first,
+                 with columns label, base_value, low_value,
+                 high_value, base, low, high and swing, where
+                 swing = |high - low|.
+    """
+    df = df_one_way[df_one_way['mrs'] == mrs]
+    df_tornado = pd.DataFrame(dict(
+        label=df['label'],
+        base_value=df['base_value'],
+        low_value=df['low_value'],
+        high_value=df['high_value'],
+        base=df[f'{result}_base'],
+        low=df[f'{result}_low'],
+        high=df[f'{result}_high'],
+        ))
+    df_tornado['swing'] = np.abs(df_tornado['high'] - df_tornado['low'])
+    df_tornado = df_tornado.sort_values(
+        'swing', ascending=False, kind='stable')
+    if n_bars is not None:
+        df_tornado = df_tornado.head(n_bars)
+    return df_tornado.reset_index(drop=True)
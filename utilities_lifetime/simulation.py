@@ -0,0 +1,530 @@
+"""
+Discrete event simulation of a cohort of individual patients.
+
+The rest of the app gives one deterministic set of results for each
+patient. Here each simulated person instead gets a random time of
+death and random A&E admissions and non-elective (NEL) and elective
+(EL) bed days, using the same fitted models:
+
++ Time of death is drawn from the survival by year, i.e. the
+  cumulative probability of death F(t) from the logistic model in
+  year one and the Gompertz model after that. In year one,
+  F(t) = 1 - (1 - P1)^t as in Case 2 of the survival time formula.
+  After year one, F(t) = 1 - (1 - P1)(1 - H(t - 1)) where H is the
+  Gompertz cumulative hazard, the same as survival_by_year. (This
+  is not quite the same curve as the Case 1 formula for the median
+  survival time, so the simulated median is a little different
+  from survival_median_years.)
++ Each resource is a Poisson process whose expected count up to
+  time t is the cumulative count from the model, e.g. find_ae_count().
+  The number of events before death is drawn from a Poisson
+  distribution and then the time of each event is drawn by inverting
+  the cumulative count.
++ Time in residential care isn't random. Each person spends the
+  average fraction of each year alive in care.
+
+Costs are discounted by the year that each event happens in, in the
+same way as the by-year results.
+
+The deterministic results count resources up until the median
+survival time. To compare like with like, each simulated person's
+costs are also added up until a horizon, which is the deterministic
+median survival time unless chosen otherwise. Averaged over the
+people who are still alive at the horizon, these converge to the
+cost columns of the results.
+
+The cohort is simulated a chunk of people at a time by a generator,
+and the chunks are summarised as they go, so memory use doesn't grow
+with the number of people.
+"""
+# Imports:
+import numpy as np
+
+# The main calculations for many patients at once:
+import utilities_lifetime.batch_calculations as batch_calc
+from stroke_lifetime import models as model
+# The results for each type of patient:
+from utilities_lifetime.results_table import ResultsTable
+
+# Number of people to simulate at a time:
+chunk_size = 20000
+# Number of people for verify_convergence():
+verify_n_people = 200000
+# Largest allowed difference between the simulated and calculated
+# results, in standard errors of the simulated result:
+verify_tolerance = 5.0
+
+# For each resource, the fixed parameters for its coefficients and
+# the cost of one unit, e.g. one A&E admission or one bed day.
+resources = {
+    'ae': dict(coeffs='ae_coeffs', cost='cost_ae_gbp'),
+    'nel': dict(coeffs='nel_coeffs', cost='cost_non_elective_bed_day_gbp'),
+    'el': dict(coeffs='el_coeffs', cost='cost_elective_bed_day_gbp'),
+}
+# Cost columns that are summarised for each simulated person:
+cost_columns = [
+    'ae_discounted_cost',
+    'nel_discounted_cost',
+    'el_discounted_cost',
+    'care_years_discounted_cost',
+    'total_discounted_cost',
+]
+
+
+# #####################################################################
+# ############################# Sampling ##############################
+# #####################################################################
+
+def find_death_time_for_pDeath(pDeath, pDeath_year1, lpDeath_yearn, gz_gamma):
+    """
+    Find the time when the cumulative probability of death in
+    survival_by_year reaches the chosen value.
+
+    Inputs:
+    -------
+    pDeath        - np.array. Chosen probabilities of death from 0 to 1.
+    pDeath_year1  - np.array. Probability of death in year 1.
+    lpDeath_yearn - np.array. Linear predictor for death after year 1.
+    gz_gamma      - float. Gompertz gamma coefficient.
+
+    Returns:
+    --------
+    death_time - np.array. Years from discharge.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # In year one:
+        time_year1 = np.log(1.0 - pDeath) / np.log(1.0 - pDeath_year1)
+        # After year one, invert F = 1 - (1 - P1)(1 - H):
+        hazard = 1.0 - (1.0 - pDeath) / (1.0 - pDeath_year1)
+        days = np.log(
+            hazard * gz_gamma / np.exp(lpDeath_yearn) + 1.0) / gz_gamma
+        time_gompertz = 1.0 + days / 365.0
+    death_time = np.where(pDeath <= pDeath_year1, time_year1, time_gompertz)
+    return death_time
+
+
+def find_cumulative_count(resource: str, lp, coeffs, years):
+    """
+    Find the expected number of events up until some time.
+
+    Inputs:
+    -------
+    resource - str. "ae", "nel" or "el".
+    lp       - np.array. Linear predictor for this resource.
+    coeffs   - np.array. Coefficients for this resource.
+    years    - np.array. Years since discharge.
+
+    Returns:
+    --------
+    np.array. Expected cumulative count.
+    """
+    if resource == 'ae':
+        return model.find_ae_count(lp, coeffs, years)
+    elif resource == 'nel':
+        return model.find_nel_count(lp, coeffs, years)
+    return model.find_el_count(lp, coeffs, years)
+
+
+def find_time_for_cumulative_count(resource: str, lp, coeffs, count):
+    """
+    Find when the expected number of events reaches some value.
+
+    This is the inverse of find_cumulative_count().
+
+    Inputs:
+    -------
+    resource - str. "ae", "nel" or "el".
+    lp       - np.array. Linear predictor for this resource.
+    coeffs   - np.array. Coefficients for this resource.
+    count    - np.array. Expected cumulative count.
+
+    Returns:
+    --------
+    np.array. Years since discharge.
+    """
+    if resource == 'ae':
+        # count = exp(-k lp) t^k
+        return (count * np.exp(coeffs[3] * lp))**(1.0 / coeffs[3])
+    # count = log(1 + (t exp(-lp))^(1/k))
+    return np.expm1(count)**coeffs[3] * np.exp(lp)
+
+
+def find_discounted_years(end_time, n_years: int, discount: float):
+    """
+    Add up the time alive in each year with discounting.
+
+    Inputs:
+    -------
+    end_time - np.array. Years from discharge for each person.
+    n_years  - int. Number of years to add up.
+    discount - float. Discount factor, e.g. 1.035.
+
+    Returns:
+    --------
+    np.array. Discounted years for each person.
+    """
+    year_start = np.arange(n_years, dtype=float)
+    # Fraction of each year that each person is alive for:
+    exposure = np.clip(end_time[:, None] - year_start, 0.0, 1.0)
+    return exposure @ (discount ** -year_start)
+
+
+def simulation_inputs(results: ResultsTable, fixed_params: dict):
+    """
+    Gather the model values needed for simulating each patient type.
+
+    Inputs:
+    -------
+    results      - ResultsTable. One row for each type of patient,
+                   e.g. each combination of age, sex and mRS.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+
+    Returns:
+    --------
+    inputs - dict. One value per patient type for each model value.
+    """
+    scalars = results.scalar_arrays
+    mrs_index = np.where(results.valid, scalars['mrs'], 0)
+    # Choose which list of care home percentage rates to use based on
+    # the age, the same as main_calculations_batch():
+    average_care_year = 0.95 * np.where(
+        scalars['age'] > 70,
+        batch_calc.pick_by_mrs(
+            fixed_params['perc_care_home_over70'], mrs_index),
+        batch_calc.pick_by_mrs(
+            fixed_params['perc_care_home_not_over70'], mrs_index)
+        )
+    inputs = dict(
+        death_in_year_1_prob=scalars['death_in_year_1_prob'],
+        death_in_year_n_lp=scalars['death_in_year_n_lp'],
+        ae_lp=scalars['ae_lp'],
+        nel_lp=scalars['nel_lp'],
+        el_lp=scalars['el_lp'],
+        average_care_year=average_care_year,
+        )
+    return inputs
+
+
+def simulate_chunk(rng, inputs: dict, patient, horizon, fixed_params: dict):
+    """
+    Simulate one chunk of people.
+
+    Inputs:
+    -------
+    rng          - np.random.Generator.
+    inputs       - dict. From simulation_inputs().
+    patient      - np.array. Patient type of each person, i.e. the
+                   row of the results.
+    horizon      - np.array. Years from discharge for each person to
+                   add up the costs until.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+
+    Returns:
+    --------
+    chunk - dict. One value per person for each of: patient,
+            death_time, alive_at_horizon, the number of events of
+            each resource (e.g. ae_count), and each cost column both
+            over the whole lifetime and up until the horizon
+            (e.g. ae_discounted_cost_to_horizon).
+    """
+    n_people = len(patient)
+    gz_gamma = float(fixed_params['gz_gamma'])
+    discount = 1.0 + float(fixed_params['discount_factor_QALYs_perc']) / 100.0
+
+    death_time = find_death_time_for_pDeath(
+        rng.random(n_people),
+        inputs['death_in_year_1_prob'][patient],
+        inputs['death_in_year_n_lp'][patient],
+        gz_gamma
+        )
+    alive_at_horizon = death_time >= horizon
+    chunk = dict(
+        patient=patient,
+        death_time=death_time,
+        alive_at_horizon=alive_at_horizon
+        )
+
+    for resource, resource_dict in resources.items():
+        coeffs = np.asarray(fixed_params[resource_dict['coeffs']], dtype=float)
+        cost = float(fixed_params[resource_dict['cost']])
+        lp = inputs[f'{resource}_lp'][patient]
+        # Number of events before death:
+        expected_count = find_cumulative_count(
+            resource, lp, coeffs, death_time)
+        counts = rng.poisson(expected_count)
+        # Time of each event. "person" is the position in this chunk
+        # of the person that each event belongs to.
+        person = np.repeat(np.arange(n_people), counts)
+        event_time = find_time_for_cumulative_count(
+            resource, lp[person], coeffs,
+            rng.random(len(person)) * expected_count[person]
+            )
+        # Discount by the year that the event happens in:
+        event_discount = discount ** -np.floor(event_time)
+        before_horizon = event_time <= horizon[person]
+
+        chunk[f'{resource}_count'] = counts
+        chunk[f'{resource}_discounted_cost'] = cost * np.bincount(
+            person, weights=event_discount, minlength=n_people)
+        chunk[f'{resource}_discounted_cost_to_horizon'] = cost * np.bincount(
+            person, weights=event_discount * before_horizon,
+            minlength=n_people)
+
+    # Time in residential care:
+    n_years = int(np.ceil(np.max(death_time, initial=0.0)))
+    care_cost = (
+        float(fixed_params['cost_residential_day_gbp']) * 365.0 *
+        inputs['average_care_year'][patient]
+        )
+    chunk['care_years_discounted_cost'] = care_cost * find_discounted_years(
+        death_time, n_years, discount)
+    chunk['care_years_discounted_cost_to_horizon'] = (
+        care_cost * find_discounted_years(
+            np.minimum(death_time, horizon), n_years, discount)
+        )
+
+    for suffix in ['', '_to_horizon']:
+        chunk[f'total_discounted_cost{suffix}'] = sum([
+            chunk[f'{column}{suffix}'] for column in cost_columns[:-1]])
+    return chunk
+
+
+def simulate_cohort(
+        results: ResultsTable,
+        fixed_params: dict,
+        n_people: int,
+        weights=None,
+        horizon_years=None,
+        chunk_size: int = chunk_size,
+        seed=None
+        ):
+    """
+    Simulate a cohort of people a chunk at a time.
+
+    Inputs:
+    -------
+    results       - ResultsTable. One row for each type of patient,
+                    e.g. each combination of age, sex and mRS.
+    fixed_params  - dict. Contains fixed parameters independent
+                    of the model results.
+    n_people      - int. Number of people to simulate.
+    weights       - np.array or None. How common each patient type is.
+                    If None, all valid patient types are equally
+                    common.
+    horizon_years - np.array or None. For each patient type, years
+                    from discharge to add up the "_to_horizon" costs
+                    until. If None, use survival_median_years.
+    chunk_size    - int. Number of people in each chunk.
+    seed          - int or None. Seed for the random numbers.
+
+    Yields:
+    -------
+    chunk - dict. From simulate_chunk().
+    """
+    rng = np.random.default_rng(seed)
+    inputs = simulation_inputs(results, fixed_params)
+    if weights is None:
+        weights = results.valid.astype(float)
+    weights = np.where(results.valid, weights, 0.0)
+    if horizon_years is None:
+        horizon_years = results.scalar_arrays['survival_median_years']
+
+    for start in range(0, n_people, chunk_size):
+        patient = rng.choice(
+            len(results),
+            size=min(chunk_size, n_people - start),
+            p=weights / np.sum(weights)
+            )
+        yield simulate_chunk(
+            rng, inputs, patient, horizon_years[patient], fixed_params)
+
+
+# #####################################################################
+# ############################ Summaries ##############################
+# #####################################################################
+
+def summarise_simulation(chunks, n_patients: int, years):
+    """
+    Add up the simulated people for each patient type.
+
+    Inputs:
+    -------
+    chunks     - iterable. Chunks from simulate_cohort().
+    n_patients - int. Number of patient types, i.e. len(results).
+    years      - np.array. Years to find the survival at.
+
+    Returns:
+    --------
+    summary - dict. For each patient type:
+        n_simulated      - number of people.
+        survival_by_year - fraction of people still alive at each
+                           of the years. One row per patient type.
+        death_time_mean  - average time of death.
+        (cost column)    - average cost over the lifetime, e.g.
+                           summary['ae_discounted_cost'], and
+                           (cost column)_se for its standard error.
+        n_alive_at_horizon        - number of people alive at the
+                                    horizon.
+        (cost column)_to_horizon  - average cost up until the horizon
+                                    of the people alive then, and
+                                    (cost column)_to_horizon_se.
+    """
+    n_years = len(years)
+    n_simulated = np.zeros(n_patients)
+    n_alive_at_horizon = np.zeros(n_patients)
+    # Number of people who die after each number of whole years:
+    deaths_after_years = np.zeros(n_patients * (n_years + 1))
+    death_time_sum = np.zeros(n_patients)
+    sums = {}
+    for column in cost_columns:
+        for name in [column, f'{column}_to_horizon']:
+            sums[name] = np.zeros(n_patients)
+            sums[f'{name}_squared'] = np.zeros(n_patients)
+
+    for chunk in chunks:
+        patient = chunk['patient']
+        alive = chunk['alive_at_horizon']
+        n_simulated += np.bincount(patient, minlength=n_patients)
+        n_alive_at_horizon += np.bincount(
+            patient, weights=alive, minlength=n_patients)
+        death_time_sum += np.bincount(
+            patient, weights=chunk['death_time'], minlength=n_patients)
+        # How many of the years each person is alive at:
+        n_years_alive = np.searchsorted(years, chunk['death_time'])
+        deaths_after_years += np.bincount(
+            patient * (n_years + 1) + n_years_alive,
+            minlength=n_patients * (n_years + 1)
+            )
+        for column in cost_columns:
+            values = chunk[column]
+            sums[column] += np.bincount(
+                patient, weights=values, minlength=n_patients)
+            sums[f'{column}_squared'] += np.bincount(
+                patient, weights=values**2.0, minlength=n_patients)
+            name = f'{column}_to_horizon'
+            values = np.where(alive, chunk[name], 0.0)
+            sums[name] += np.bincount(
+                patient, weights=values, minlength=n_patients)
+            sums[f'{name}_squared'] += np.bincount(
+                patient, weights=values**2.0, minlength=n_patients)
+
+    # People alive at year j died after more than j of the years:
+    deaths_after_years = deaths_after_years.reshape(n_patients, n_years + 1)
+    n_alive = np.cumsum(deaths_after_years[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary = dict(
+            n_simulated=n_simulated,
+            survival_by_year=n_alive / n_simulated[:, None],
+            death_time_mean=death_time_sum / n_simulated,
+            n_alive_at_horizon=n_alive_at_horizon,
+            )
+        for column in cost_columns:
+            for name, n in [(column, n_simulated),
+                            (f'{column}_to_horizon', n_alive_at_horizon)]:
+                mean = sums[name] / n
+                variance = sums[f'{name}_squared'] / n - mean**2.0
+                summary[name] = mean
+                summary[f'{name}_se'] = np.sqrt(
+                    np.maximum(variance, 0.0) / (n - 1.0))
+    return summary
+
+
+def run_simulation(
+        results: ResultsTable,
+        fixed_params: dict,
+        n_people: int,
+        **kwargs
+        ):
+    """
+    Simulate a cohort and summarise it for each patient type.
+
+    Inputs:
+    -------
+    results      - ResultsTable. One row for each type of patient.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+    n_people     - int. Number of people to simulate.
+    kwargs       - Any other inputs for simulate_cohort().
+
+    Returns:
+    --------
+    summary - dict. From summarise_simulation().
+    """
+    chunks = simulate_cohort(results, fixed_params, n_people, **kwargs)
+    return summarise_simulation(chunks, len(results), results.years)
+
+
+def verify_convergence(
+        results: ResultsTable,
+        fixed_params: dict,
+        n_people: int = verify_n_people,
+        tolerance: float = verify_tolerance,
+        seed: int = 42
+        ):
+    """
+    Check that the simulated cohort agrees with the calculated results.
+
+    Compares for each patient type:
+    + the simulated survival with survival_by_year.
+    + the simulated costs up to the median survival time with the
+      cost columns, e.g. ae_discounted_cost.
+
+    Inputs:
+    -------
+    results      - ResultsTable. One row for each type of patient.
+    fixed_params - dict. Contains fixed parameters independent
+                   of the model results.
+    n_people     - int. Number of people to simulate.
+    tolerance    - float. Largest allowed difference in standard
+                   errors of the simulated value.
+    seed         - int. Seed for the random numbers.
+
+    Returns:
+    --------
+    report - dict. Contains passed (bool), n_people, and for each
+             quantity compared the largest difference (max_error)
+             and the largest difference in standard errors (max_z).
+    """
+    summary = run_simulation(results, fixed_params, n_people, seed=seed)
+    valid = results.valid
+
+    def compare(simulated, calculated, se):
+        error = np.abs(simulated - calculated)
+        # A tiny allowance for rounding in values that aren't random:
+        allowed = tolerance * se + 1e-9 * (1.0 + np.abs(calculated))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.where(se > 0.0, error / se, 0.0)
+        return dict(
+            max_error=float(np.max(error, initial=0.0)),
+            max_z=float(np.max(z, initial=0.0)),
+            passed=bool(np.all(error <= allowed))
+            )
+
+    # Survival:
+    calculated = results['survival_by_year'][valid]
+    simulated = summary['survival_by_year'][valid]
+    n = summary['n_simulated'][valid][:, None]
+    report = dict(
+        survival_by_year=compare(
+            simulated, calculated,
+            np.sqrt(calculated * (1.0 - calculated) / n))
+        )
+    # Costs, only for patient types with enough people alive at the
+    # median survival time to find a standard error:
+    enough = valid & (summary['n_alive_at_horizon'] > 1)
+    for column in cost_columns:
+        report[column] = compare(
+            summary[f'{column}_to_horizon'][enough],
+            results.scalar_arrays[column][enough],
+            summary[f'{column}_to_horizon_se'][enough]
+            )
+
+    report = dict(
+        passed=all([check['passed'] for check in report.values()]),
+        n_people=n_people,
+        **report
+        )
+    return report